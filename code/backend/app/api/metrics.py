@@ -0,0 +1,59 @@
+"""
+Request timing middleware and the /metrics scrape endpoint
+"""
+
+import asyncio
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import CONTENT_TYPE, HTTP_REQUEST_DURATION, metrics_publisher, registry
+
+router = APIRouter()
+
+
+class MetricsMiddleware:
+    """
+    Records request latency by route template until the last body chunk is sent
+
+    Timing the full response rather than the handler alone keeps streamed
+    downloads and file responses honest.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by template (e.g. /api/v1/results/{task_id}/orthophoto.png) to bound cardinality
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=scope['method'],
+                route=route,
+                status=str(status),
+            )
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint; counters and histograms include the other worker processes"""
+    snapshots = await asyncio.to_thread(metrics_publisher.shared)
+    return Response(content=registry.render(snapshots), media_type=CONTENT_TYPE)
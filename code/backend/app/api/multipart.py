@@ -0,0 +1,174 @@
+"""
+Incremental multipart/form-data reader that hands out each part as soon as it arrives
+"""
+
+import asyncio
+import hashlib
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, List, Optional
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.ingest import FileTooLargeError
+
+
+class MultipartError(Exception):
+    """Raised when a request body is not valid multipart/form-data"""
+
+
+class FormPart:
+    """
+    One completed form field or file
+
+    File parts read with a spool directory are written to `path` as they
+    arrive and their `data` stays empty; the caller owns (and removes) the
+    spooled file once the part is yielded.
+    """
+
+    def __init__(self, name: str, filename: Optional[str], content_type: Optional[str], path: Optional[Path] = None):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.data = b''
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._chunks: List[bytes] = []
+        self._file: Optional[BinaryIO] = None
+
+    @property
+    def text(self) -> str:
+        return self.data.decode('utf-8', errors='replace')
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+
+class _PartCollector:
+    """python-multipart callbacks that collect parts while the body is fed in"""
+
+    def __init__(self, max_part_size: int, spool_dir: Optional[Path] = None):
+        self.max_part_size = max_part_size
+        self.spool_dir = spool_dir
+        self.completed: List[FormPart] = []
+        self._finished: List[FormPart] = []
+        self._part: Optional[FormPart] = None
+        self._header_name = b''
+        self._header_value = b''
+        self._headers = {}
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+        self._part = None
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b''
+        self._header_value = b''
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self._current()
+        part.size += end - start
+        if part.size > self.max_part_size:
+            raise FileTooLargeError(part.filename or 'form field', self.max_part_size)
+        part._digest.update(data[start:end])
+        part._chunks.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        self._finished.append(self._current())
+        self._part = None
+
+    def _current(self) -> FormPart:
+        if self._part is None:
+            _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+            if b'name' not in options:
+                raise MultipartError('The Content-Disposition header field "name" must be provided')
+            filename = options.get(b'filename')
+            content_type = self._headers.get(b'content-type')
+            spooled = filename is not None and self.spool_dir is not None
+            self._part = FormPart(
+                name=options[b'name'].decode('utf-8', errors='replace'),
+                filename=filename.decode('utf-8', errors='replace') if filename is not None else None,
+                content_type=content_type.decode('latin-1') if content_type else None,
+                path=self.spool_dir / f"{uuid.uuid4().hex}.part" if spooled else None,
+            )
+        return self._part
+
+    async def drain(self) -> None:
+        """Write the data received since the last drain to spooled parts and complete finished ones"""
+        parts = self._finished + ([self._part] if self._part is not None else [])
+        for part in parts:
+            if part.path is not None and (part._chunks or part._file is None):
+                await asyncio.to_thread(_spool, part, b''.join(part._chunks))
+                part._chunks = []
+        for part in self._finished:
+            if part.path is None:
+                part.data = b''.join(part._chunks)
+                part._chunks = []
+            elif part._file is not None:
+                part._file.close()
+                part._file = None
+        self.completed.extend(self._finished)
+        self._finished = []
+
+    def discard(self) -> None:
+        """Remove the spooled files of parts that were never handed out"""
+        parts = self.completed + self._finished + ([self._part] if self._part is not None else [])
+        for part in parts:
+            if part._file is not None:
+                part._file.close()
+            if part.path is not None:
+                part.path.unlink(missing_ok=True)
+
+
+def _spool(part: FormPart, data: bytes) -> None:
+    if part._file is None:
+        part._file = part.path.open('wb')
+    part._file.write(data)
+
+
+async def iter_form_parts(request: Request, max_part_size: int, spool_dir: Optional[Path] = None) -> AsyncIterator[FormPart]:
+    """
+    Yield form parts in body order while the request is still being received
+
+    The body is only read as fast as the caller consumes parts, so a slow
+    consumer applies backpressure to the client instead of buffering the
+    whole upload. Each part is held in memory, bounded by max_part_size,
+    unless spool_dir is given: file parts are then written there chunk by
+    chunk and hashed on the way, so memory stays at one body chunk.
+    """
+    _, params = parse_options_header(request.headers.get('content-type', ''))
+    boundary = params.get(b'boundary')
+    if not boundary:
+        raise MultipartError("Missing boundary in multipart body")
+
+    collector = _PartCollector(max_part_size, spool_dir)
+    parser = MultipartParser(boundary, {
+        'on_part_begin': collector.on_part_begin,
+        'on_part_data': collector.on_part_data,
+        'on_part_end': collector.on_part_end,
+        'on_header_field': collector.on_header_field,
+        'on_header_value': collector.on_header_value,
+        'on_header_end': collector.on_header_end,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await collector.drain()
+            while collector.completed:
+                yield collector.completed.pop(0)
+        parser.finalize()
+        await collector.drain()
+        while collector.completed:
+            yield collector.completed.pop(0)
+    finally:
+        collector.discard()
@@ -0,0 +1,153 @@
+"""
+Response helpers for cacheable, resumable result artifacts
+"""
+
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.core.config import settings
+from app.services.artifacts import PRECOMPRESS_SUFFIXES, artifact_store
+
+STREAM_CHUNK = 1024 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header points past the end of the file"""
+
+
+def artifact_cache_control() -> str:
+    """Cache policy for artifacts of completed tasks, which never change once written"""
+    return f"public, max-age={settings.ARTIFACT_CACHE_MAX_AGE}, immutable"
+
+
+def is_not_modified(request: Request, etag: str, mtime: Optional[float] = None) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the current version"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header into inclusive (start, end) offsets
+
+    Returns None when the whole body should be sent (no header, malformed
+    header or a multi-range request).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        return None
+    start_text, _, end_text = spec.partition('-')
+    try:
+        if not start_text:
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+async def iter_file_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yield bytes start..end (inclusive) of a file in bounded chunks"""
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def artifact_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    filename: Optional[str] = None,
+    inline: bool = False,
+    persist_hash: bool = True,
+) -> Response:
+    """
+    Serve a result file with validators, range support and precompressed variants
+
+    The ETag is the sha256 of the bytes actually sent, so a gzip or brotli
+    variant gets its own tag. Conditional requests are answered with 304 and
+    single byte ranges with 206.
+    """
+    served, encoding = artifact_store.select_variant(path, request.headers.get('accept-encoding', ''))
+    stat = served.stat()
+    etag = f'"{await artifact_store.content_hash(served, persist=persist_hash)}"'
+    headers: Dict[str, str] = {
+        'ETag': etag,
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        'Cache-Control': artifact_cache_control(),
+        'Accept-Ranges': 'bytes',
+    }
+    if path.suffix in PRECOMPRESS_SUFFIXES:
+        headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if filename:
+        headers['Content-Disposition'] = f"{'inline' if inline else 'attachment'}; filename={filename}"
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if if_range and if_range != etag and if_range != headers['Last-Modified']:
+        # The client's partial copy is stale, send the whole current body
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, 'Content-Range': f"bytes */{stat.st_size}"})
+
+    if byte_range:
+        start, end = byte_range
+        headers['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+        headers['Content-Length'] = str(end - start + 1)
+        return StreamingResponse(iter_file_range(served, start, end), status_code=206, media_type=media_type, headers=headers)
+
+    return FileResponse(path=served, media_type=media_type, headers=headers, stat_result=stat)
+
+
+def sse_message(data: Any, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events message with a JSON payload"""
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def cached_json_response(request: Request, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """JSON response with a content-hash ETag that answers revalidation with 304"""
+    body = json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = f'"{hashlib.sha256(body).hexdigest()}"'
+    response_headers = {'ETag': etag, 'Cache-Control': 'no-cache', **(headers or {})}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content=body, status_code=200, media_type='application/json', headers=response_headers)
@@ -0,0 +1,45 @@
+"""
+Job queue inspection endpoints
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+
+from app.services.job_queue import JOB_STATUSES
+from app.services.job_worker import job_worker
+
+# Create router
+router = APIRouter()
+
+@router.get("/")
+async def list_jobs(
+    status: Optional[str] = Query(None, pattern=f"^({'|'.join(JOB_STATUSES)})$"),
+    type: Optional[str] = Query(None, description="Job type, e.g. download or tiles"),
+    task_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    List queued, running and recently finished jobs, newest first.
+
+    Returns:
+        Job counts by type and status, and the matching jobs
+    """
+    try:
+        return JSONResponse(status_code=200, content={
+            "counts": job_worker.queue.counts(),
+            "jobs": job_worker.queue.list(status=status, job_type=type, task_id=task_id, limit=limit),
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list jobs: {str(e)}")
+
+@router.get("/{job_id}")
+async def get_job(job_id: int):
+    """
+    Get one job including its payload, attempts and last error.
+    """
+    job = job_worker.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(status_code=200, content=job)
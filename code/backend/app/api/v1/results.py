@@ -2,8 +2,8 @@
 Results API endpoints for drone imagery files
 """
 
-from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, Body, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from typing import List, Optional
 import uuid
 import os
@@ -13,13 +13,54 @@ from datetime import datetime
 import requests
 from dotenv import load_dotenv
 from pyodm import Node
+from app.api.responses import artifact_response, cached_json_response
 from app.services import file_storage_service
+from app.services.elevation import DEMS, SamplingError, elevation_service
+from app.services.export import DEFAULT_ARTIFACTS, ExportError, export_service
+from app.services.indices import IndexUnavailableError, index_service
+from app.services.rasters import (
+    RESAMPLING_METHODS,
+    RasterUnavailableError,
+    WindowError,
+    WindowTooLargeError,
+    raster_service,
+)
+from app.services.retention import retention_service
+from app.services.tiles import tile_service
 
 load_dotenv()
 
 # Create router
 router = APIRouter()
 
+@router.get("/export.zip")
+async def export_results(
+    task_ids: str = Query(..., description="Comma-separated task IDs"),
+    artifacts: str = Query(",".join(DEFAULT_ARTIFACTS), description="Comma-separated artifact types"),
+):
+    """
+    Stream a zip of the chosen artifacts of many tasks, one folder per task.
+
+    The archive is built while it is sent: files are read in chunks straight
+    into the response and already-compressed formats are stored without
+    recompression, so memory stays bounded for multi-GB exports.
+    """
+    try:
+        entries = export_service.plan(
+            [task_id for task_id in task_ids.split(',') if task_id],
+            [name for name in artifacts.split(',') if name],
+        )
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for task_id in {entry.task_id for entry in entries}:
+        retention_service.record_access(task_id)
+    filename = f"results-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.zip"
+    return StreamingResponse(
+        export_service.stream(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @router.get("/{task_id}")
 async def get_task_summary(task_id: str, request: Request):
     """
@@ -31,6 +72,7 @@ async def get_task_summary(task_id: str, request: Request):
 
         if not image_path and not report_path:
             raise HTTPException(status_code=404, detail="No results found for task")
+        retention_service.record_access(task_id)
 
         base_url = str(request.base_url).rstrip('/')
         result = {"taskId": task_id}
@@ -38,8 +80,14 @@ async def get_task_summary(task_id: str, request: Request):
             result["orthophotoPngUrl"] = f"{base_url}/api/v1/results/{task_id}/orthophoto.png"
         if report_path:
             result["reportPdfUrl"] = f"{base_url}/api/v1/results/{task_id}/report.pdf"
+        manifest = file_storage_service.read_manifest(task_id) or {}
+        if manifest.get('previews'):
+            previews = file_storage_service.preview_fields(task_id, manifest['previews'])
+            for preview in previews.values():
+                preview["url"] = f"{base_url}{preview['url']}"
+            result["previews"] = previews
 
-        return JSONResponse(status_code=200, content=result)
+        return cached_json_response(request, result)
 
     except HTTPException:
         raise
@@ -47,34 +95,252 @@ async def get_task_summary(task_id: str, request: Request):
         raise HTTPException(status_code=500, detail=f"Failed to get task results: {str(e)}")
 
 @router.get("/")
-async def list_processed_files(request: Request):
+async def list_processed_files(
+    request: Request,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    sort: str = Query('created_at', pattern='^(created_at|completed_at|task_name)$'),
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    name: Optional[str] = Query(None, description="Case-insensitive task name filter"),
+):
     """
-    List all processed tasks that have an orthophoto PNG.
+    List processed tasks that have an orthophoto PNG, one page at a time.
+
+    Pagination details are returned in the X-Total-Count, X-Page and X-Page-Size headers.
     """
     try:
-        tasks = file_storage_service.list_tasks_with_orthophoto()
+        tasks, total = file_storage_service.list_tasks_with_orthophoto(
+            page=page, page_size=page_size, sort=sort, order=order, name=name
+        )
         # Items already include relative URLs; return as-is
-        return JSONResponse(status_code=200, content=tasks)
+        return cached_json_response(
+            request,
+            tasks,
+            headers={
+                "X-Total-Count": str(total),
+                "X-Page": str(page),
+                "X-Page-Size": str(page_size),
+            }
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get all processed tasks: {str(e)}")
 
 @router.get("/{task_id}/orthophoto.png")
-async def get_orthophoto_png(task_id: str):
-    """Serve the orthophoto PNG for a task."""
+async def get_orthophoto_png(task_id: str, request: Request):
+    """Serve the orthophoto PNG for a task (supports conditional and range requests)."""
     image_path = file_storage_service.get_image_path(task_id)
     if not image_path:
-        raise HTTPException(status_code=404, detail="Orthophoto PNG not found")
-    return FileResponse(path=image_path, media_type="image/png", filename="orthophoto.png")
+        raise HTTPException(status_code=404, detail="Orthophoto not found")
+    retention_service.record_access(task_id)
+    return await artifact_response(request, image_path, media_type="image/png", filename="orthophoto.png")
 
 @router.get("/{task_id}/report.pdf")
-async def get_report_pdf(task_id: str):
-    """Serve the PDF report for a task if available."""
+async def get_report_pdf(task_id: str, request: Request):
+    """Serve the PDF report for a task if available, precompressed when the client accepts it."""
     report_path = file_storage_service.get_report_path(task_id)
     if not report_path:
         raise HTTPException(status_code=404, detail="Report not found")
-    return FileResponse(
-        path=report_path,
+    retention_service.record_access(task_id)
+    return await artifact_response(
+        request,
+        report_path,
         media_type="application/pdf",
         filename="report.pdf",
-        headers={"Content-Disposition": "inline; filename=report.pdf"}
-    )
\ No newline at end of file
+        inline=True
+    )
+
+@router.get("/{task_id}/previews/{size}.webp")
+async def get_orthophoto_preview(task_id: str, size: str, request: Request):
+    """Serve a small or medium orthophoto preview for gallery cards."""
+    preview_path = file_storage_service.get_preview_path(task_id, size)
+    if not preview_path:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    retention_service.record_access(task_id)
+    return await artifact_response(request, preview_path, media_type="image/webp")
+
+@router.get("/{task_id}/rasters")
+async def get_raster_metadata(task_id: str, request: Request):
+    """Describe the task's georeferenced rasters (CRS, bounds, resolution, tiling, overviews) with their URLs."""
+    manifest = file_storage_service.read_manifest(task_id) or {}
+    rasters = manifest.get('rasters')
+    if not rasters:
+        raise HTTPException(status_code=404, detail="No georeferenced rasters found for task")
+    retention_service.record_access(task_id)
+    return cached_json_response(
+        request,
+        {
+            "taskId": task_id,
+            "rasters": {
+                name: {**info, "url": f"/api/v1/results/{task_id}/rasters/{name}.tif"}
+                for name, info in rasters.items()
+            },
+        }
+    )
+
+@router.get("/{task_id}/rasters/{name}.tif")
+async def get_raster(
+    task_id: str,
+    name: str,
+    request: Request,
+    bbox: Optional[str] = Query(None, description="min_x,min_y,max_x,max_y to crop to"),
+    bbox_crs: str = Query("EPSG:4326", description="CRS of bbox; use the raster's own CRS to skip reprojection"),
+    resolution: Optional[float] = Query(None, gt=0, description="Output pixel size in raster CRS units"),
+    resampling: str = Query("bilinear", pattern=f"^({'|'.join(RESAMPLING_METHODS)})$"),
+):
+    """
+    Serve a GeoTIFF ('orthophoto', 'dsm' or 'dtm').
+
+    Without bbox the whole Cloud-Optimized GeoTIFF is served with range request
+    support, so GIS clients can read just the tiles they need over HTTP. With
+    bbox only the intersecting tiles are read and a cropped GeoTIFF is returned,
+    resampled to resolution when one is given.
+    """
+    raster_path = file_storage_service.get_raster_path(task_id, name)
+    if not raster_path:
+        raise HTTPException(status_code=404, detail="Raster not found")
+    retention_service.record_access(task_id)
+    if bbox is None:
+        return await artifact_response(request, raster_path, media_type="image/tiff", filename=f"{name}.tif")
+
+    try:
+        bounds = [float(value) for value in bbox.split(',')]
+    except ValueError:
+        bounds = []
+    if len(bounds) != 4 or bounds[0] >= bounds[2] or bounds[1] >= bounds[3]:
+        raise HTTPException(status_code=400, detail="bbox must be min_x,min_y,max_x,max_y")
+    try:
+        data = await raster_service.read_window(raster_path, bounds, bbox_crs, resolution, resampling)
+    except RasterUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except WindowTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except WindowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(
+        content=data,
+        media_type="image/tiff",
+        headers={"Content-Disposition": f'inline; filename="{name}-crop.tif"'},
+    )
+
+@router.post("/{task_id}/elevation")
+async def sample_elevation(
+    task_id: str,
+    points: List[List[float]] = Body(..., description="[x, y] pairs to sample"),
+    crs: str = Body("EPSG:4326", description="CRS of the points; use the DEM's own CRS to skip reprojection"),
+    dem: str = Body("dsm", pattern=f"^({'|'.join(DEMS)})$"),
+):
+    """
+    Sample the task's DSM or DTM at a batch of points.
+
+    Elevations are bilinearly interpolated and returned in the order of the
+    points; points off the model or over holes in it get null.
+    """
+    try:
+        result = await elevation_service.points(task_id, dem, points, crs)
+    except RasterUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except SamplingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Elevation model not found")
+    retention_service.record_access(task_id)
+    return JSONResponse(status_code=200, content={"taskId": task_id, "dem": dem, **result})
+
+@router.post("/{task_id}/elevation/profile")
+async def sample_elevation_profile(
+    task_id: str,
+    line: List[List[float]] = Body(..., description="Polyline vertices as [x, y] pairs"),
+    crs: str = Body("EPSG:4326", description="CRS of the vertices and of the returned coordinates"),
+    dem: str = Body("dsm", pattern=f"^({'|'.join(DEMS)})$"),
+    spacing: Optional[float] = Body(None, gt=0, description="Sample spacing in DEM CRS units; defaults to the DEM resolution"),
+):
+    """
+    Sample the task's DSM or DTM along a polyline.
+
+    Returns the distance along the line, coordinates and elevation of each
+    sample; samples are evenly spaced and include every vertex.
+    """
+    try:
+        result = await elevation_service.profile(task_id, dem, line, crs, spacing)
+    except RasterUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except SamplingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Elevation model not found")
+    retention_service.record_access(task_id)
+    return JSONResponse(status_code=200, content={"taskId": task_id, "dem": dem, **result})
+
+@router.get("/{task_id}/indices")
+async def get_vegetation_indices(task_id: str, request: Request):
+    """Summary statistics of the task's vegetation indices, computing them on first request"""
+    try:
+        indices = await index_service.ensure_indices(task_id)
+    except RasterUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except IndexUnavailableError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not indices:
+        raise HTTPException(status_code=404, detail="No orthophoto GeoTIFF found for task")
+    retention_service.record_access(task_id)
+    return cached_json_response(
+        request,
+        {
+            "taskId": task_id,
+            "indices": {
+                name: {
+                    **{key: value for key, value in metadata.items() if not key.startswith('source_')},
+                    "url": f"/api/v1/results/{task_id}/indices/{name}.tif",
+                }
+                for name, metadata in indices.items()
+            },
+        }
+    )
+
+@router.get("/{task_id}/indices/{name}.tif")
+async def get_vegetation_index(task_id: str, name: str, request: Request):
+    """Serve one vegetation index ('ndvi' or 'ndre') as a float32 GeoTIFF, computing it on first request"""
+    try:
+        metadata = await index_service.ensure_index(task_id, name)
+    except RasterUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except IndexUnavailableError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Vegetation index not found")
+    retention_service.record_access(task_id)
+    return await artifact_response(
+        request, index_service.index_path(task_id, name), media_type="image/tiff", filename=f"{name}.tif"
+    )
+
+@router.get("/{task_id}/tiles.json")
+async def get_tile_metadata(task_id: str, request: Request):
+    """Describe the orthophoto tile pyramid for a task (size, zoom levels, URL template)."""
+    metadata = await tile_service.ensure_pyramid(task_id)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Orthophoto not found")
+    retention_service.record_access(task_id)
+    return cached_json_response(
+        request,
+        {
+            "taskId": task_id,
+            "width": metadata["width"],
+            "height": metadata["height"],
+            "tileSize": metadata["tile_size"],
+            "minZoom": metadata["min_zoom"],
+            "maxZoom": metadata["max_zoom"],
+            "levels": metadata["levels"],
+            "tileUrlTemplate": f"/api/v1/results/{task_id}/tiles/{{z}}/{{x}}/{{y}}.png",
+        }
+    )
+
+@router.get("/{task_id}/tiles/{z}/{x}/{y}.png")
+async def get_orthophoto_tile(task_id: str, z: int, x: int, y: int, request: Request):
+    """Serve one orthophoto tile; zoom 0 is the whole image, maxZoom is full resolution."""
+    tile_path = await tile_service.get_tile(task_id, z, x, y)
+    if not tile_path:
+        raise HTTPException(status_code=404, detail="Tile not found")
+    retention_service.record_access(task_id)
+    # Tiles are small and numerous, so their hashes are kept in memory only
+    return await artifact_response(request, tile_path, media_type="image/png", persist_hash=False)
+
@@ -0,0 +1,124 @@
+"""
+Robot track ingestion and query endpoints
+"""
+
+import asyncio
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+
+from app.services.tracks import TrackError, track_service
+
+# Create router
+router = APIRouter()
+
+
+async def _lines(request: Request) -> AsyncIterator[str]:
+    """Lines of a streamed request body as they arrive"""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode('utf-8', errors='replace')
+    if pending:
+        yield pending.decode('utf-8', errors='replace')
+
+
+@router.post("/")
+async def create_track(
+    name: Optional[str] = Query(None),
+    task_id: Optional[str] = Query(None, description="Task whose orthophoto the track belongs to"),
+):
+    """
+    Create an empty track to stream samples into.
+
+    Returns:
+        The track's metadata including its track_id
+    """
+    meta = track_service.create(name=name, task_id=task_id)
+    return JSONResponse(status_code=201, content=meta)
+
+@router.get("/")
+async def list_tracks(task_id: Optional[str] = Query(None)):
+    """List tracks with their time range, sample count and bbox, newest first"""
+    return JSONResponse(status_code=200, content=track_service.list(task_id=task_id))
+
+@router.get("/{track_id}")
+async def get_track(track_id: str):
+    meta = track_service.get(track_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    return JSONResponse(status_code=200, content=meta)
+
+@router.post("/{track_id}/samples")
+async def ingest_samples(track_id: str, request: Request):
+    """
+    Append samples streamed as the request body.
+
+    One sample per line, either `t,lat,lon,heading,speed` or a JSON object
+    with those keys; t is unix seconds, heading and speed are optional.
+    Lines are parsed as they arrive and written in batches, so a robot can
+    keep one request open while it drives. Samples older than the track's
+    last one are dropped.
+    """
+    if track_service.get(track_id) is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+    try:
+        totals = await track_service.ingest(track_id, _lines(request))
+    except TrackError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=200, content=totals)
+
+@router.get("/{track_id}/samples")
+async def query_samples(
+    track_id: str,
+    start: Optional[float] = Query(None, description="Earliest sample time, unix seconds"),
+    end: Optional[float] = Query(None, description="Latest sample time, unix seconds"),
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    tolerance: float = Query(0.0, ge=0, description="Douglas-Peucker tolerance in metres; 0 keeps every sample"),
+    max_points: Optional[int] = Query(None, ge=2, description="Raise the tolerance until at most this many samples remain"),
+    format: str = Query("columns", pattern="^(columns|geojson)$"),
+):
+    """
+    Samples of a track, optionally limited to a time range and bbox and simplified for drawing.
+
+    The default format returns one array per column (t, lat, lon, heading,
+    speed); geojson returns a LineString Feature to overlay on an orthophoto.
+    """
+    bounds = None
+    if bbox is not None:
+        try:
+            bounds = [float(value) for value in bbox.split(',')]
+        except ValueError:
+            bounds = []
+        if len(bounds) != 4 or bounds[0] >= bounds[2] or bounds[1] >= bounds[3]:
+            raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    try:
+        result = await asyncio.to_thread(track_service.simplified, track_id, start, end, bounds, tolerance, max_points)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Track not found")
+    except TrackError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    samples = result['samples']
+    summary = {"trackId": track_id, "total": result['total'], "count": len(samples), "tolerance": result['tolerance']}
+    if format == 'geojson':
+        columns = samples.columns
+        return JSONResponse(status_code=200, content={
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[lon, lat] for lon, lat in zip(columns['lon'], columns['lat'])]},
+            "properties": {**summary, "times": columns['t'].tolist()},
+        })
+    return JSONResponse(status_code=200, content={**summary, **samples.to_dict()})
+
+@router.delete("/{track_id}")
+async def delete_track(track_id: str):
+    try:
+        deleted = track_service.delete(track_id)
+    except TrackError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Track not found")
+    return JSONResponse(status_code=200, content={"trackId": track_id, "deleted": True})
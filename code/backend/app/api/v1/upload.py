@@ -2,38 +2,114 @@
 Upload API endpoints for drone imagery files
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Form
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, List, Optional
+import asyncio
 import uuid
 import os
+import shutil
 from pathlib import Path
 import aiofiles
 from datetime import datetime
 import requests
 from dotenv import load_dotenv
-from pyodm import Node
 
+from app.api.multipart import FormPart, MultipartError, iter_form_parts
+from app.api.responses import sse_message
+from app.core.config import settings
 from app.services.file_storage import FileStorageService
+from app.services.blob_store import blob_store
+from app.services.ingest import ChecksumMismatchError, FileTooLargeError, ingest_service
+from app.services.node_pool import node_pool
+from app.services.preprocess import preprocess_service
+from app.services.nodeodm_client import NodeODMError, NodeODMTaskNotFoundError, NodeODMUnavailableError
+from app.services.progress import FINAL_STAGES, progress_hub
+from app.services.retention import retention_service
+from app.services.reuse import reuse_service
+from app.services.status_cache import status_cache
+from app.services.task_supervisor import task_supervisor
 
 load_dotenv()
 
+# Seconds between SSE comments that keep idle proxies from closing the stream
+SSE_KEEPALIVE_INTERVAL = 15
+
+MAX_FILES = 200
+# Body bytes allowed beyond MAX_FILES full-size images, for form fields and part headers
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+
+def max_body_size() -> int:
+    """Largest upload body accepted: MAX_FILES images of MAX_FILE_SIZE plus form overhead"""
+    return MAX_FILES * settings.MAX_FILE_SIZE + FORM_OVERHEAD_BYTES
+
+
+class BodyLimitRoute(APIRoute):
+    """
+    Route that refuses request bodies larger than max_body_size() while they arrive
+
+    FastAPI parses a form body completely before the endpoint runs, so
+    without this an oversized POST / would be spooled to disk in full before
+    MAX_FILE_SIZE is checked. A declared Content-Length over the limit is
+    rejected before anything is read; otherwise reading stops at the limit.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request) -> Response:
+            limit = max_body_size()
+            too_large = HTTPException(status_code=413, detail=f"Upload exceeds the maximum of {limit} bytes")
+            declared = request.headers.get('content-length', '')
+            if declared.isdigit() and int(declared) > limit:
+                raise too_large
+            received = 0
+            receive = request.receive
+
+            async def limited_receive():
+                nonlocal received
+                message = await receive()
+                received += len(message.get('body', b''))
+                if received > limit:
+                    raise too_large
+                return message
+
+            return await handler(Request(request.scope, limited_receive))
+
+        return limited_handler
+
+
 # Create router
-router = APIRouter()
+router = APIRouter(route_class=BodyLimitRoute)
+
+# Simple orthophoto settings used for every task
+ORTHOPHOTO_OPTIONS = {
+    'skip-3dmodel': True,  # Skip 3D model to focus on orthophoto
+    'orthophoto-resolution': 3.0,  # Medium quality (3cm/pixel)
+    'orthophoto-quality': 75,  # Medium JPEG quality
+    'pc-quality':'lowest', #lowest quality for the point cloud
+    'orthophoto-png': True, #output orthophoto as png
+    'dsm': True,  # Surface model for elevation queries
+    'dtm': True,  # Terrain model for elevation queries
+}
 
 # file upload endpoint
 @router.post("/")
 async def upload_files(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
-    task_name: Optional[str] = Form(None)
+    task_name: Optional[str] = Form(None),
+    checksums: Optional[List[str]] = Form(None)
 ):
     """
     Upload drone imagery files to NodeODM for processing
     
     Args:
         files: List of uploaded image files
-        background_tasks: Background task handler
+        task_name: Optional human friendly task name
+        checksums: Optional sha256 per file, in the same order; images already
+            stored are then verified without being written again
         
     Returns:
         Task information with unique ID
@@ -43,74 +119,104 @@ async def upload_files(
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     
-    if len(files) > 200:  # Reasonable limit, adjust as needed
+    if len(files) > MAX_FILES:  # Reasonable limit, adjust as needed
         raise HTTPException(status_code=400, detail="Too many files (maximum 200)")
+    
+    if checksums and len(checksums) != len(files):
+        raise HTTPException(status_code=400, detail="Provide one checksum per file")
 
     # Generate temporary task ID for file organization
     task_id = str(uuid.uuid4())
-    dir_path = Path(f"uploads/{task_id}")
+    dir_path = Path(settings.UPLOAD_DIR) / task_id
     dir_path.mkdir(parents=True, exist_ok=True)
     # Pre-create manifest with task_name and created_at so it's available with results
+    manifest = {
+        'task_id': task_id,
+        'task_name': task_name or '',
+        'created_at': datetime.utcnow().isoformat(),
+    }
     try:
-        FileStorageService().write_manifest(task_id, {
-            'task_id': task_id,
-            'task_name': task_name or '',
-            'created_at': datetime.utcnow().isoformat(),
-        })
+        FileStorageService().write_manifest(task_id, manifest)
     except Exception:
         pass
     
     saved_files = []
+    ingested = []
+    deduplicated_bytes = 0
     
     try:
-        # Save uploaded files to temporary directory
-        for file in files:
+        # Stream uploaded files into the blob store and link them into the task directory
+        for index, file in enumerate(files):
             # Validate file
             if not file.filename:
                 raise HTTPException(status_code=400, detail="File with no filename detected")
             
-            # Check file size (100MB limit)
-            content = await file.read()
-            file_size = len(content)
-            
-            if file_size > 100 * 1024 * 1024:  # 100MB
-                raise HTTPException(
-                    status_code=413, 
-                    detail=f"File {file.filename} exceeds maximum size of 100MB"
-                )
-            
-            # Check file type
+            # Check file type before touching the body
             if not file.content_type or not file.content_type.startswith('image/'):
                 raise HTTPException(
                     status_code=400, 
                     detail=f"File {file.filename} is not a valid image"
                 )
             
-            # Save file to temporary directory
-            file_path = dir_path / file.filename
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(content)
+            # Hash while enforcing MAX_FILE_SIZE; content already stored is not written again
+            file_path = dir_path / Path(file.filename).name
+            try:
+                stored = await ingest_service.save_upload(
+                    file,
+                    file_path,
+                    task_id=task_id,
+                    expected_sha256=checksums[index] if checksums else None,
+                )
+            except (FileTooLargeError, ChecksumMismatchError) as e:
+                shutil.rmtree(dir_path, ignore_errors=True)
+                blob_store.release(task_id)
+                status_code = 413 if isinstance(e, FileTooLargeError) else 400
+                raise HTTPException(status_code=status_code, detail=str(e))
             
-            saved_files.append(str(file_path))
+            ingested.append({k: stored[k] for k in ('name', 'size', 'sha256')})
+            saved_files.append(stored['path'])
+            if stored['deduplicated']:
+                deduplicated_bytes += stored['size']
         
-        # Create NodeODM task with saved file paths - simple orthophoto settings
-        n = Node('localhost', 3000)
-        orthophoto_options = {
-            'skip-3dmodel': True,  # Skip 3D model to focus on orthophoto
-            'orthophoto-resolution': 3.0,  # Medium quality (3cm/pixel)
-            'orthophoto-quality': 75,  # Medium JPEG quality
-            'pc-quality':'lowest', #lowest quality for the point cloud
-            'orthophoto-png': True, #output orthophoto as png
-        }
-        # Pass an optional human-friendly task name to NodeODM if provided
-        if task_name and task_name.strip():
-            task = n.create_task(saved_files, options=orthophoto_options, name=task_name.strip())
-        else:
-            task = n.create_task(saved_files, options=orthophoto_options)
-        nodeodm_task_id = task.uuid  # Get NodeODM's auto-generated ID
+        # Record per-image content hashes alongside the task, plus the fingerprint resubmissions are matched by
+        manifest['images'] = ingested
+        manifest['fingerprint'] = reuse_service.fingerprint([image['sha256'] for image in ingested], ORTHOPHOTO_OPTIONS)
+        FileStorageService().write_manifest(task_id, manifest)
         
-        # Run polling in background
-        background_tasks.add_task(FileStorageService().poll_for_download, task, task_id)
+        # Held until the task is recorded as processing so a duplicate click attaches to it
+        async with reuse_service.lock(manifest['fingerprint']):
+            reused = await reuse_service.reuse(task_id, manifest['fingerprint'])
+            if reused:
+                # The earlier task already has (or is producing) these results
+                shutil.rmtree(dir_path, ignore_errors=True)
+                blob_store.release(task_id)
+                return _reused_response(task_id, reused, [f.filename for f in files], manifest)
+            
+            # Validate, inspect and thin the images before NodeODM spends time on them
+            preprocess = None
+            if settings.PREPROCESS_ENABLED:
+                report = await preprocess_service.run([Path(path) for path in saved_files])
+                preprocess = {key: report[key] for key in ('rejected', 'duplicates', 'missing_gps', 'downscaled')}
+                manifest['preprocess'] = preprocess
+                FileStorageService().write_manifest(task_id, manifest)
+                if not report['accepted']:
+                    shutil.rmtree(dir_path, ignore_errors=True)
+                    blob_store.release(task_id)
+                    raise HTTPException(status_code=400, detail={"message": "No usable images", **preprocess})
+                saved_files = [str(path) for path in report['accepted']]
+            
+            # Create NodeODM task with saved file paths, passing the optional task name
+            # Dispatch to the least loaded healthy node; the task stays pinned to it
+            node_url, nodeodm_task_id = await node_pool.create_task(
+                saved_files,
+                options=ORTHOPHOTO_OPTIONS,
+                name=task_name.strip() if task_name and task_name.strip() else None,
+            )
+            
+            # Hand the task to the supervisor, which polls all in-flight tasks from one loop
+            manifest.update({'nodeodm_task_id': nodeodm_task_id, 'node_url': node_url, 'status': 'processing'})
+            FileStorageService().write_manifest(task_id, manifest)
+            task_supervisor.watch(task_id, nodeodm_task_id, node_url)
         
         return JSONResponse(
             status_code=201,
@@ -121,21 +227,221 @@ async def upload_files(
                 "file_count": len(files),
                 "status": "processing",
                 "files": [f.filename for f in files],
+                "deduplicated_bytes": deduplicated_bytes,
+                "preprocess": preprocess,
                 "created_at": datetime.utcnow().isoformat(),
                 "task_name": task_name or None
             }
         )
+    except HTTPException:
+        raise
+    except NodeODMUnavailableError as e:
+        _discard_upload(task_id, dir_path, str(e))
+        raise HTTPException(
+            status_code=503, 
+            detail="No NodeODM node is available. Please start NodeODM on one of the configured nodes"
+        )
     except Exception as e:
-        # TODO:Clean up temporary files on error
+        _discard_upload(task_id, dir_path, str(e))
+        raise HTTPException(status_code=500, detail=f"NodeODM processing failed: {str(e)}")
+
+
+def _reused_response(task_id: str, reused: Dict[str, Any], filenames: List[str], manifest: Dict[str, Any]) -> JSONResponse:
+    """Response for an upload answered from an earlier task with the same images and options"""
+    completed = reused['status'] == 'completed'
+    return JSONResponse(
+        status_code=201,
+        content={
+            "message": "Results reused from an identical earlier task" if completed
+            else "Attached to an identical task that is already processing",
+            "task_id": task_id,
+            "reused_from": reused['reused_from'],
+            "file_count": len(filenames),
+            "status": reused['status'],
+            "files": filenames,
+            "results": FileStorageService().result_links(task_id) if completed else None,
+            "created_at": manifest['created_at'],
+            "task_name": manifest.get('task_name') or None
+        }
+    )
+
+
+def _discard_upload(task_id: str, dir_path: Path, error: str) -> None:
+    """Remove the images of an upload that never reached NodeODM and mark its manifest failed"""
+    shutil.rmtree(dir_path, ignore_errors=True)
+    blob_store.release(task_id)
+    FileStorageService().update_manifest(task_id, {'status': 'failed', 'error': error})
+
+
+@router.post("/stream")
+async def upload_files_streaming(request: Request, task_name: Optional[str] = Query(None)):
+    """
+    Upload drone imagery and forward each image to NodeODM as soon as it arrives
+    
+    Takes the same multipart form as POST /api/v1/upload. The NodeODM task is
+    opened when the first image arrives and up to UPLOAD_PIPELINE_WINDOW images
+    are forwarded concurrently while the rest of the body is still being
+    received, so processing starts about one transfer after the upload
+    begins. Each image is spooled to the blob store's staging directory as
+    it arrives and streamed on from there, so memory use does not grow with
+    image size. A local copy is kept only when UPLOAD_KEEP_LOCAL is set.
+    
+    Args:
+        request: Incoming multipart request with 'files' parts
+        task_name: Optional human friendly task name; a 'task_name' form field
+            sent before the files works too
         
-        # Handle NodeODM connection errors gracefully
-        if "ConnectionRefusedError" in str(e) or "No connection could be made" in str(e):
-            raise HTTPException(
-                status_code=503, 
-                detail="NodeODM server is not running. Please start NodeODM on localhost:3000"
-            )
-        else:
+    Returns:
+        Task information with unique ID
+    """
+    if not request.headers.get('content-type', '').startswith('multipart/form-data'):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    
+    task_id = str(uuid.uuid4())
+    dir_path = Path(settings.UPLOAD_DIR) / task_id
+    storage = FileStorageService()
+    manifest: Dict[str, Any] = {
+        'task_id': task_id,
+        'task_name': task_name or '',
+        'created_at': datetime.utcnow().isoformat(),
+    }
+    storage.write_manifest(task_id, manifest)
+    
+    window = asyncio.Semaphore(settings.UPLOAD_PIPELINE_WINDOW)
+    forwards: List[asyncio.Task] = []
+    filenames: List[str] = []
+    spooled: List[Path] = []
+    node_url = client = nodeodm_task_id = None
+    
+    async def forward(filename: str, part: FormPart) -> Dict[str, Any]:
+        try:
+            await client.upload_image(nodeodm_task_id, part.path, filename=filename, mime=part.content_type)
+            if settings.UPLOAD_KEEP_LOCAL:
+                # The spooled file is already hashed, so keeping it is a move into the store
+                await asyncio.to_thread(
+                    ingest_service.save_staged, part.path, part.sha256, part.size, dir_path / filename, task_id,
+                )
+            return {'name': filename, 'size': part.size, 'sha256': part.sha256}
+        finally:
+            part.path.unlink(missing_ok=True)
+            window.release()
+    
+    parts = iter_form_parts(request, settings.MAX_FILE_SIZE, spool_dir=blob_store.staging_dir)
+    try:
+        async for part in parts:
+            if part.filename is None:
+                if part.name == 'task_name' and not task_name:
+                    task_name = part.text.strip()
+                continue
+            if part.name != 'files':
+                part.path.unlink(missing_ok=True)
+                continue
+            # Removed by forward(), or below if the upload fails first
+            spooled.append(part.path)
+            if not part.filename:
+                raise HTTPException(status_code=400, detail="File with no filename detected")
+            if not part.content_type or not part.content_type.startswith('image/'):
+                raise HTTPException(status_code=400, detail=f"File {part.filename} is not a valid image")
+            if len(filenames) >= MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"Too many files (maximum {MAX_FILES})")
+            for done in [f for f in forwards if f.done()]:
+                # Surface a failed forward now instead of after the whole body is read
+                done.result()
+            
+            if nodeodm_task_id is None:
+                node_url, nodeodm_task_id = await node_pool.init_task(ORTHOPHOTO_OPTIONS, name=task_name or None)
+                client = node_pool.client_for(node_url)
+            # Reading the next part waits here while the window is full
+            await window.acquire()
+            filename = Path(part.filename).name
+            filenames.append(filename)
+            forwards.append(asyncio.create_task(forward(filename, part)))
+        
+        if not forwards:
+            raise HTTPException(status_code=400, detail="No files provided")
+        ingested = await asyncio.gather(*forwards)
+        manifest.update({
+            'task_name': task_name or '',
+            'images': list(ingested),
+            'fingerprint': reuse_service.fingerprint([image['sha256'] for image in ingested], ORTHOPHOTO_OPTIONS),
+        })
+        storage.write_manifest(task_id, manifest)
+        # The images are already on the node, but committing is what starts the hours-long run
+        async with reuse_service.lock(manifest['fingerprint']):
+            reused = await reuse_service.reuse(task_id, manifest['fingerprint'])
+            if reused is None:
+                await client.commit_task(nodeodm_task_id)
+                manifest.update({'nodeodm_task_id': nodeodm_task_id, 'node_url': node_url, 'status': 'processing'})
+                storage.write_manifest(task_id, manifest)
+                task_supervisor.watch(task_id, nodeodm_task_id, node_url)
+    except BaseException as e:
+        # Removes the spooled files of parts that were not handed out yet
+        await parts.aclose()
+        for pending in forwards:
+            pending.cancel()
+        await asyncio.gather(*forwards, return_exceptions=True)
+        # Forwards cancelled before they started never removed their spooled images
+        for path in spooled:
+            path.unlink(missing_ok=True)
+        if nodeodm_task_id:
+            await client.remove_task(nodeodm_task_id, quiet=True)
+        shutil.rmtree(dir_path, ignore_errors=True)
+        blob_store.release(task_id)
+        storage.update_manifest(task_id, {'status': 'failed', 'error': str(e)})
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, FileTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e))
+        if isinstance(e, MultipartError):
+            raise HTTPException(status_code=400, detail=str(e))
+        if isinstance(e, NodeODMUnavailableError):
+            raise HTTPException(status_code=503, detail=str(e))
+        if isinstance(e, Exception):
             raise HTTPException(status_code=500, detail=f"NodeODM processing failed: {str(e)}")
+        raise
+    
+    if reused:
+        await client.remove_task(nodeodm_task_id, quiet=True)
+        shutil.rmtree(dir_path, ignore_errors=True)
+        blob_store.release(task_id)
+        return _reused_response(task_id, reused, filenames, manifest)
+    
+    return JSONResponse(
+        status_code=201,
+        content={
+            "message": "Files uploaded successfully, processing started",
+            "task_id": task_id,
+            "nodeodm_task_id": nodeodm_task_id,
+            "file_count": len(filenames),
+            "status": "processing",
+            "files": filenames,
+            "created_at": manifest['created_at'],
+            "task_name": task_name or None
+        }
+    )
+
+
+@router.get("/storage")
+async def get_upload_storage():
+    """
+    Report blob store usage and the bytes saved by deduplicating uploads
+    
+    Returns:
+        Blob count, stored, referenced and saved byte totals
+    """
+    return JSONResponse(status_code=200, content=blob_store.stats())
+
+
+@router.get("/nodes")
+async def get_processing_nodes():
+    """
+    Report the NodeODM node pool
+    
+    Returns:
+        Each node's URL, health and last reported queue
+    """
+    await node_pool.probe_all(stale_only=True)
+    return JSONResponse(status_code=200, content=node_pool.node_status())
 
 
 @router.get("/{task_id}/status")
@@ -144,37 +450,204 @@ async def get_upload_status(task_id: str):
     Get upload status for a specific NodeODM task
     
     Args:
-        task_id: NodeODM task identifier
+        task_id: NodeODM task identifier (our task ID is accepted too)
         
     Returns:
-        Current task status from NodeODM
+        Current task status from the node processing the task
     """
     try:
-        n = Node('localhost', 3000)
-        task = n.get_task(task_id)
+        # Resolve our task ID to the NodeODM task and the node it was pinned to
+        manifest = FileStorageService().read_manifest(task_id) or {}
+        if manifest.get('reused_from'):
+            # Resubmissions report the NodeODM task whose results they reuse
+            manifest = FileStorageService().read_manifest(manifest['reused_from']) or manifest
+        nodeodm_task_id = manifest.get('nodeodm_task_id') or task_id
+        if manifest.get('node_url'):
+            node_pool.pin(nodeodm_task_id, manifest['node_url'])
+        # Concurrent viewers of the same task share one cached or in-flight lookup
+        info = await status_cache.get(nodeodm_task_id)
         return JSONResponse(
             status_code=200,
             content={
-                "status": str(task.info().status),
-                "progress": str(task.info().progress)
+                "status": str(info.status),
+                "progress": str(info.progress)
             }
         )
+    except HTTPException:
+        raise
+    except NodeODMTaskNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except NodeODMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except NodeODMError as e:
+        # The node answered, but not with the task's status
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get task status: {str(e)}")
 
 
+def _final_event(task_id: str, manifest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Event describing a task that has already finished, or None if it is still in flight"""
+    status = manifest.get('status')
+    if status not in FINAL_STAGES:
+        return None
+    event: Dict[str, Any] = {'taskId': task_id, 'stage': status, 'status': status}
+    if status == 'completed':
+        event.update({'progress': 100.0, 'results': FileStorageService().result_links(task_id)})
+    else:
+        event['error'] = manifest.get('error', '')
+    return event
+
+
+@router.get("/{task_id}/events")
+async def stream_task_events(task_id: str):
+    """
+    Stream task progress as Server-Sent Events
+    
+    Status is fetched once per supervisor check and shared by every open
+    stream. Events carry a stage (processing, downloading, completed, failed
+    or canceled), the NodeODM status and progress; the final 'done' event of
+    a completed task includes its result URLs.
+    
+    Args:
+        task_id: Our task ID or the NodeODM task identifier
+    """
+    storage = FileStorageService()
+    manifest = storage.read_manifest(task_id)
+    if manifest is None:
+        row = storage.catalog.find_by_nodeodm_task_id(task_id)
+        manifest = storage.read_manifest(row['task_id']) if row else None
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    task_id = manifest.get('task_id') or task_id
+
+    async def events() -> AsyncIterator[str]:
+        # Subscribe before checking the manifest so a finish in between is not missed
+        queue = progress_hub.subscribe(task_id)
+        try:
+            final = _final_event(task_id, storage.read_manifest(task_id) or manifest)
+            if final:
+                yield sse_message(final, event='done')
+                return
+            if progress_hub.latest(task_id) is None:
+                task_supervisor.check_soon(task_id)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event.get('stage') in FINAL_STAGES:
+                    yield sse_message(event, event='done')
+                    return
+                yield sse_message(event, event='progress')
+        finally:
+            progress_hub.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@router.get("/retention")
+async def get_retention_plan():
+    """
+    Report what the retention janitor would do without changing anything
+    
+    Returns:
+        Current usage, the quota and the planned actions with the bytes each frees
+    """
+    return JSONResponse(status_code=200, content=await retention_service.sweep(dry_run=True))
+
+
+@router.post("/retention")
+async def run_retention_sweep(dry_run: bool = Query(False)):
+    """
+    Apply the retention policies now instead of waiting for the next sweep
+    
+    Args:
+        dry_run: Only report the plan
+        
+    Returns:
+        The applied plan and the bytes freed
+    """
+    try:
+        return JSONResponse(status_code=200, content=await retention_service.sweep(dry_run=dry_run))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retention sweep failed: {str(e)}")
+
+
+@router.put("/{task_id}/pin")
+async def pin_task(task_id: str):
+    """
+    Exempt a task from retention (quota eviction, upload deletion and compaction)
+    
+    Args:
+        task_id: Our task ID
+        
+    Returns:
+        The task's pinned state
+    """
+    try:
+        manifest = retention_service.set_pinned(task_id, True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return JSONResponse(status_code=200, content={"task_id": task_id, "pinned": True})
+
+
+@router.delete("/{task_id}/pin")
+async def unpin_task(task_id: str):
+    """
+    Make a pinned task subject to retention again
+    
+    Args:
+        task_id: Our task ID
+        
+    Returns:
+        The task's pinned state
+    """
+    try:
+        manifest = retention_service.set_pinned(task_id, False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return JSONResponse(status_code=200, content={"task_id": task_id, "pinned": False})
+
+
 @router.delete("/{task_id}")
 async def delete_upload(task_id: str):
     """
-    Delete a NodeODM task
+    Delete a task and everything stored for it
+    
+    The task is removed from its NodeODM node (canceling it if it is still
+    running), and its uploads, results, tile pyramid and catalog entry are
+    deleted. Pinned tasks can still be deleted explicitly.
     
     Args:
-        task_id: NodeODM task identifier
+        task_id: Our task ID
         
     Returns:
-        Deletion confirmation
+        Deletion confirmation with the bytes freed
     """
-    pass
+    try:
+        deleted = await retention_service.delete_task(task_id)
+        if deleted is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return JSONResponse(
+            status_code=200,
+            content={"message": "Task deleted", **deleted}
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete task: {str(e)}")
 
 # Step 4: List all NodeODM tasks
 @router.get("/")
@@ -3,7 +3,7 @@ Configuration settings for the Drone Imagery API
 """
 
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import os
 
 class Settings(BaseSettings):
@@ -13,6 +13,7 @@ class Settings(BaseSettings):
     PORT: int = 8001
     HOST: str = "0.0.0.0"
     DEBUG: bool = True
+    WORKERS: int = 1  # Server processes; they share task state through RESULTS_DIR/state.db
     
     # CORS Configuration
     ALLOWED_ORIGINS: List[str] = [
@@ -29,13 +30,122 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     RESULTS_DIR: str = "./results"
     MAX_FILE_SIZE: int = 104857600  # 100MB in bytes
+    UPLOAD_CHUNK_SIZE: int = 1048576  # 1MB read/write chunks while streaming uploads
+    UPLOAD_PIPELINE_WINDOW: int = 4  # Images forwarded to NodeODM concurrently by the streaming upload endpoint
+    UPLOAD_KEEP_LOCAL: bool = True  # Keep a local copy of images sent through the streaming upload endpoint
+    BLOB_STORE_DIR: str = "./blobs"  # Deduplicated upload content; keep on the same filesystem as UPLOAD_DIR for hardlinks
+    TRACKS_DIR: str = "./tracks"  # Robot GPS/odometry tracks
     
     # Supported file formats
     SUPPORTED_FORMATS: List[str] = ["image/jpeg", "image/png", "image/tiff"]
     
+    # Result Reuse
+    REUSE_ENABLED: bool = True  # Answer resubmissions of the same images and options from the task that already has them
+    
+    # Image Preprocessing
+    PREPROCESS_ENABLED: bool = True  # Validate and inspect uploads before creating the NodeODM task
+    PREPROCESS_WORKERS: int = 4  # Processes inspecting and downscaling images
+    PREPROCESS_REQUIRE_GPS: bool = False  # Reject images without an EXIF GPS position instead of flagging them
+    PREPROCESS_DROP_DUPLICATES: bool = True  # Drop near-identical frames taken while hovering
+    PREPROCESS_DUPLICATE_DISTANCE: float = 1.0  # Meters between frames considered the same position
+    PREPROCESS_DUPLICATE_HASH_DISTANCE: int = 6  # Differing bits (of 64) in the image hash for a duplicate
+    PREPROCESS_TARGET_GSD: float = 0.0  # cm/px to downscale finer images to; 0 keeps full resolution
+    PREPROCESS_JPEG_QUALITY: int = 95  # JPEG quality of downscaled images
+    
     # Node ODM Configuration
     NODEODM_URL: str = "http://localhost:3000"
-    NODEODM_TIMEOUT: int = 3600  # 1 hour
+    NODEODM_TIMEOUT: int = 3600  # 1 hour, applies to image uploads and asset downloads
+    NODEODM_REQUEST_TIMEOUT: int = 30  # Per-call timeout for info/status/control requests
+    NODEODM_MAX_CONNECTIONS: int = 20  # Size of the shared keep-alive connection pool
+    NODEODM_PARALLEL_UPLOADS: int = 10  # Images uploaded to NodeODM concurrently per task
+    NODEODM_URLS: List[str] = []  # Processing node pool, e.g. ["http://odm1:3000","http://odm2:3000"]; empty uses NODEODM_URL
+    NODEODM_PROBE_INTERVAL: float = 30.0  # Seconds before a node's /info (and an unhealthy node) is probed again
+    
+    # Asset Download
+    RESULT_ARTIFACTS: List[str] = []  # Archive prefixes to extract, e.g. ["odm_orthophoto/", "odm_report/"]; empty keeps everything
+    DOWNLOAD_MAX_RETRIES: int = 5  # Range-resumed attempts before an asset download gives up
+    
+    # Artifact Serving
+    ARTIFACT_CACHE_MAX_AGE: int = 86400  # Cache-Control max-age for completed task artifacts
+    PRECOMPRESS_MIN_RATIO: float = 0.95  # Keep gzip/brotli variants only if at most this fraction of the original
+    PRECOMPRESS_BROTLI_QUALITY: int = 11
+    EXPORT_MAX_TASKS: int = 500  # Tasks allowed in one bulk zip export
+    EXPORT_CHUNK_SIZE: int = 1048576  # Bytes read and streamed at a time while exporting
+    
+    # Orthophoto Previews
+    PREVIEW_SMALL_SIZE: int = 256  # Longest edge in pixels
+    PREVIEW_MEDIUM_SIZE: int = 1024  # Longest edge in pixels
+    PREVIEW_QUALITY: int = 80  # WebP quality
+    PREVIEW_WORKERS: int = 2  # Processes rendering previews
+    
+    # Cloud-Optimized GeoTIFFs
+    COG_ENABLED: bool = True  # Convert orthophoto and DEM GeoTIFFs to COGs at ingest (needs the optional 'geo' extra)
+    COG_BLOCK_SIZE: int = 512  # Internal tile size in pixels
+    COG_COMPRESSION: str = "DEFLATE"
+    COG_WORKERS: int = 2  # Processes converting GeoTIFFs
+    RASTER_MAX_WINDOW_PIXELS: int = 16777216  # Largest bbox crop (width x height) returned by the raster endpoint
+    
+    # Elevation Queries
+    ELEVATION_CACHE_SIZE: int = 8  # DEM datasets kept open between queries
+    ELEVATION_MAX_POINTS: int = 100000  # Points per batch or samples per profile
+    ELEVATION_WINDOW_SIZE: int = 1024  # Pixels per side of the windows points are grouped into and read by
+    
+    # Robot Tracks
+    TRACK_BATCH_SIZE: int = 4096  # Streamed samples buffered before each append to disk
+    TRACK_MIN_TOLERANCE: float = 0.25  # Metres; first simplification tolerance tried when a point budget is given
+    TRACK_MAX_POINTS: int = 200000  # Samples one track query may return
+    
+    # Vegetation Indices
+    INDEX_BAND_RED: int = 1  # 1-based orthophoto band holding red reflectance
+    INDEX_BAND_REDEDGE: int = 4  # 1-based orthophoto band holding red edge reflectance
+    INDEX_BAND_NIR: int = 5  # 1-based orthophoto band holding near-infrared reflectance
+    INDEX_WINDOW_SIZE: int = 2048  # Pixels per side of the block each worker computes at a time
+    INDEX_WORKERS: int = 4  # Processes computing index blocks
+    
+    # Orthophoto Tiles
+    TILE_CACHE_DIR: str = "./tile_cache"
+    TILE_CACHE_MAX_BYTES: int = 2147483648  # 2GB across all cached pyramids
+    TILE_SIZE: int = 256
+    TILES_AT_INGEST: bool = False  # Render every tile right after download instead of on first request
+    
+    # Metrics
+    METRICS_ENABLED: bool = True  # Expose /metrics and time HTTP requests
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5  # Seconds between event loop lag samples
+    METRICS_PUBLISH_INTERVAL: float = 5.0  # Seconds between snapshots shared with the other API and job worker processes
+    METRICS_SNAPSHOT_MAX_AGE: float = 3600.0  # Seconds a stopped process's counters stay in scrapes
+    
+    # Status Cache
+    STATUS_CACHE_TTL: float = 2.0  # Seconds a non-terminal task status is reused
+    STATUS_CACHE_MAX_ENTRIES: int = 10000  # Least recently used statuses are evicted past this
+    
+    # Retention
+    RETENTION_ENABLED: bool = True  # Run the background retention janitor
+    RETENTION_INTERVAL: float = 3600.0  # Seconds between janitor sweeps
+    RETENTION_DRY_RUN: bool = False  # Only log what each sweep would do
+    RETENTION_MAX_BYTES: int = 0  # Quota for results and uploads; least recently viewed tasks are evicted past it; 0 disables
+    RETENTION_DELETE_UPLOADS: bool = True  # Delete a task's raw uploads once its results are downloaded
+    RETENTION_COMPACT_AFTER_DAYS: float = 30.0  # Gzip logs and trim intermediates of tasks completed this long ago; 0 disables
+    RETENTION_TRIM_PATHS: List[str] = ["opensfm", "odm_filterpoints", "odm_meshing", "odm_texturing", "odm_georeferencing"]  # Result subdirectories removed when compacting
+    RETENTION_COMPRESS_MIN_BYTES: int = 1048576  # Logs smaller than this are left uncompressed
+    
+    # Task Supervisor
+    SUPERVISOR_MIN_INTERVAL: float = 2.0  # Fastest status check interval (task nearly done)
+    SUPERVISOR_MAX_INTERVAL: float = 60.0  # Slowest status check interval
+    SUPERVISOR_QUEUED_INTERVAL: float = 30.0  # Status check interval while a task is queued
+    SUPERVISOR_MAX_CONCURRENT_CHECKS: int = 10  # Parallel task info calls per batch
+    SUPERVISOR_MAX_DOWNLOADS: int = 2  # Download jobs one worker runs at the same time
+    TASK_LEASE_TTL: float = 30.0  # Seconds a worker's claim on a task lasts without renewal
+    TASK_LEASE_RENEW_INTERVAL: float = 10.0  # Seconds between lease renewals and claims of orphaned tasks
+    PROGRESS_FOLLOW_INTERVAL: float = 1.0  # Seconds between shared state reads for streams of other workers' tasks
+    
+    # Job Queue
+    JOB_WORKER_IN_API: bool = False  # Also run queued jobs inside the API process instead of the worker.py that run.py starts
+    JOB_CONCURRENCY: Dict[str, int] = {}  # Overrides of how many jobs of a type one worker runs at once, e.g. {"tiles": 2}
+    JOB_MAX_ATTEMPTS: int = 5  # Attempts before a job fails for good
+    JOB_RETRY_DELAY: float = 30.0  # Seconds before the first retry; doubles per attempt up to an hour
+    JOB_LEASE_TTL: float = 60.0  # Seconds before a job of a worker that stopped renewing is run again
+    JOB_POLL_INTERVAL: float = 1.0  # Seconds between checks for ready jobs
+    JOB_HISTORY_DAYS: int = 7  # Finished jobs are kept this long for inspection
     
     class Config:
         env_file = ".env"
@@ -4,11 +4,26 @@ Main FastAPI application entry point
 """
 
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.api.metrics import MetricsMiddleware, router as metrics_router
+from app.api.v1.jobs import router as jobs_router
 from app.api.v1.upload import router as upload_router
 from app.api.v1.results import router as results_router
+from app.api.v1.tracks import router as tracks_router
 from app.core.config import settings
+from app.services.elevation import elevation_service
+from app.services.file_storage import file_storage_service
+from app.services.job_worker import job_worker
+from app.services.metrics import loop_lag_monitor, metrics_publisher
+from app.services.node_pool import node_pool
+from app.services.preprocess import preprocess_service
+from app.services.indices import index_service
+from app.services.previews import preview_service
+from app.services.rasters import raster_service
+from app.services.retention import retention_service
+from app.services.task_supervisor import task_supervisor
 
 # Configure logging
 logging.basicConfig(
@@ -16,13 +31,47 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown hooks"""
+    # Index existing results the first time the catalog is created
+    if file_storage_service.catalog.count() == 0:
+        file_storage_service.catalog.rebuild()
+    # Learn each node's queue before the first dispatch
+    await node_pool.probe_all()
+    # Resume tracking tasks that were in flight when the server last stopped
+    task_supervisor.restore()
+    await task_supervisor.start()
+    if settings.JOB_WORKER_IN_API:
+        # Opt-in for single-process setups; otherwise worker.py runs the queued jobs
+        await job_worker.start()
+    if settings.METRICS_ENABLED:
+        await loop_lag_monitor.start()
+        await metrics_publisher.start()
+    if settings.RETENTION_ENABLED:
+        await retention_service.start()
+    yield
+    await retention_service.stop()
+    await loop_lag_monitor.stop()
+    await metrics_publisher.stop()
+    await job_worker.stop()
+    await task_supervisor.stop()
+    preview_service.shutdown()
+    raster_service.shutdown()
+    index_service.shutdown()
+    elevation_service.close()
+    preprocess_service.shutdown()
+    # Release pooled NodeODM connections
+    await node_pool.aclose()
+
 # Create FastAPI app
 app = FastAPI(
     title="Drone Imagery API",
     description="Backend API for drone imagery processing with Node ODM",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -34,6 +83,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request by route for /metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Health check endpoints
 @app.get("/")
 async def root():
@@ -48,6 +101,10 @@ async def health_check():
 # Include API routers
 app.include_router(upload_router, prefix="/api/v1/upload", tags=["upload"])
 app.include_router(results_router, prefix="/api/v1/results", tags=["results"])
+app.include_router(jobs_router, prefix="/api/v1/jobs", tags=["jobs"])
+app.include_router(tracks_router, prefix="/api/v1/tracks", tags=["tracks"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -55,5 +112,7 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG
+        workers=settings.WORKERS,
+        # Reloading supports a single worker only
+        reload=settings.DEBUG and settings.WORKERS == 1
     )
@@ -2,9 +2,37 @@
 Services package for the Drone Imagery API
 """
 
+from .blob_store import BlobStore, blob_store
 from .file_storage import FileStorageService, file_storage_service
+from .ingest import IngestService, ChecksumMismatchError, FileTooLargeError, ingest_service
+from .node_pool import NodePool, node_pool
+from .nodeodm_client import (
+    NodeODMClient, NodeODMError, NodeODMTaskNotFoundError, NodeODMUnavailableError, nodeodm_client,
+)
+from .progress import ProgressHub, progress_hub
+from .status_cache import StatusCache, status_cache
+from .task_supervisor import TaskSupervisor, task_supervisor
 
 __all__ = [
+    "BlobStore",
+    "blob_store",
     "FileStorageService",
-    "file_storage_service"
+    "file_storage_service",
+    "IngestService",
+    "ChecksumMismatchError",
+    "FileTooLargeError",
+    "ingest_service",
+    "NodePool",
+    "node_pool",
+    "NodeODMClient",
+    "NodeODMError",
+    "NodeODMTaskNotFoundError",
+    "NodeODMUnavailableError",
+    "nodeodm_client",
+    "ProgressHub",
+    "progress_hub",
+    "StatusCache",
+    "status_cache",
+    "TaskSupervisor",
+    "task_supervisor"
 ]
\ No newline at end of file
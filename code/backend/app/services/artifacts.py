@@ -0,0 +1,157 @@
+"""
+Artifact store for content hashes and precompressed variants of result files
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped when the package is missing
+    brotli = None
+
+from ..core.config import settings
+from .results_catalog import ARTIFACTS
+
+LOGGER = logging.getLogger(__name__)
+
+HASH_SUFFIX = ".sha256"
+HASH_CHUNK = 1024 * 1024
+# Result files worth storing precompressed next to the original
+PRECOMPRESS_SUFFIXES = ('.json', '.pdf')
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+MAX_CACHED_HASHES = 4096
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}"""
+    codings: Dict[str, float] = {}
+    for part in header.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+class ArtifactStore:
+    """Computes and remembers content hashes and serves precompressed variants"""
+
+    def __init__(self):
+        self._hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def content_hash(self, path: Path, persist: bool = True) -> str:
+        """
+        Return the sha256 of a file, computing it at most once per file version
+
+        Hashes are remembered in memory and, when persist is set, in a sidecar
+        file so restarts do not re-read large artifacts.
+        """
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest:
+                self._hashes.move_to_end(key)
+                return digest
+        digest = await asyncio.to_thread(self._load_or_compute_hash, path, stat.st_size, stat.st_mtime_ns, persist)
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > MAX_CACHED_HASHES:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def _load_or_compute_hash(self, path: Path, size: int, mtime_ns: int, persist: bool) -> str:
+        sidecar = path.with_name(path.name + HASH_SUFFIX)
+        if persist and sidecar.exists():
+            try:
+                recorded = json.loads(sidecar.read_text())
+                if recorded.get('size') == size and recorded.get('mtime_ns') == mtime_ns:
+                    return recorded['sha256']
+            except Exception as e:
+                LOGGER.warning(f"Ignoring unreadable hash sidecar {sidecar}: {e}")
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+        result = digest.hexdigest()
+        if persist:
+            try:
+                sidecar.write_text(json.dumps({'size': size, 'mtime_ns': mtime_ns, 'sha256': result}))
+            except OSError as e:
+                LOGGER.warning(f"Could not write hash sidecar {sidecar}: {e}")
+        return result
+
+    def select_variant(self, path: Path, accept_encoding: str) -> Tuple[Path, Optional[str]]:
+        """Pick the best up-to-date precompressed variant the client accepts"""
+        if path.suffix not in PRECOMPRESS_SUFFIXES or not accept_encoding:
+            return path, None
+        accepted = parse_accept_encoding(accept_encoding)
+        source_mtime = path.stat().st_mtime_ns
+        for encoding, suffix in ENCODINGS:
+            if accepted.get(encoding, accepted.get('*', 0)) <= 0:
+                continue
+            variant = path.with_name(path.name + suffix)
+            if variant.exists() and variant.stat().st_mtime_ns >= source_mtime:
+                return variant, encoding
+        return path, None
+
+    def precompress(self, path: Path) -> List[Path]:
+        """Write gzip and brotli variants of a file, keeping only those that save space"""
+        data = path.read_bytes()
+        written = []
+        for encoding, suffix in ENCODINGS:
+            if encoding == 'br':
+                if brotli is None:
+                    continue
+                compressed = brotli.compress(data, quality=settings.PRECOMPRESS_BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            variant = path.with_name(path.name + suffix)
+            if len(compressed) >= len(data) * settings.PRECOMPRESS_MIN_RATIO:
+                variant.unlink(missing_ok=True)
+                continue
+            variant.write_bytes(compressed)
+            written.append(variant)
+        return written
+
+    def _prepare_sync(self, task_dir: Path) -> None:
+        for relative in ARTIFACTS.values():
+            path = task_dir / relative
+            if path.exists():
+                stat = path.stat()
+                self._load_or_compute_hash(path, stat.st_size, stat.st_mtime_ns, persist=True)
+        report_dir = task_dir / "odm_report"
+        if not report_dir.exists():
+            return
+        for path in list(report_dir.rglob('*')):
+            if path.is_file() and path.suffix in PRECOMPRESS_SUFFIXES:
+                for variant in self.precompress(path):
+                    stat = variant.stat()
+                    self._load_or_compute_hash(variant, stat.st_size, stat.st_mtime_ns, persist=True)
+
+    async def prepare(self, task_dir: Path) -> None:
+        """Hash the main artifacts and precompress JSON/PDF outputs once at ingest"""
+        await asyncio.to_thread(self._prepare_sync, task_dir)
+
+
+# Create store instance
+artifact_store = ArtifactStore()
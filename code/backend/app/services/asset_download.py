@@ -0,0 +1,360 @@
+"""
+Streaming asset download pipeline that extracts NodeODM archives while they arrive
+"""
+
+import asyncio
+import logging
+import struct
+import time
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Callable, Dict, List, Optional, Sequence
+
+from ..core.config import settings
+from .metrics import DOWNLOAD_BYTES, DOWNLOAD_DURATION
+from .nodeodm_client import NodeODMClient, NodeODMError, nodeodm_client
+
+LOGGER = logging.getLogger(__name__)
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_HEADER_SIG = 0x04034b50
+DESCRIPTOR_SIG = b'PK\x07\x08'
+# Signatures that mark the end of the member list
+END_SIGS = (0x02014b50, 0x06054b50, 0x06064b50)
+ZIP64_EXTRA_ID = 0x0001
+OUTPUT_CHUNK = 1024 * 1024
+
+
+class ZipStreamError(Exception):
+    """Raised when the streamed archive cannot be parsed"""
+
+
+class StreamingZipExtractor:
+    """
+    Incremental zip parser fed with raw archive bytes as they are downloaded
+
+    Members are parsed from their local headers, so each file is written out as
+    soon as its bytes arrive instead of after the whole archive is on disk. Only
+    members under the include prefixes are written when include is given.
+    """
+
+    def __init__(self, destination: Path, include: Optional[Sequence[str]] = None):
+        self.destination = destination
+        self.include = [p for p in (include or []) if p]
+        self.extracted: List[str] = []
+        self.done = False
+        self._buffer = bytearray()
+        self._state = 'header'
+        self._member: Dict[str, object] = {}
+        self._out: Optional[BinaryIO] = None
+
+    def feed(self, data: bytes) -> None:
+        """Consume the next chunk of the archive"""
+        if self.done:
+            return
+        self._buffer += data
+        while not self.done and self._step():
+            pass
+
+    def close(self) -> None:
+        """Check that the archive ended cleanly"""
+        if self._out is not None:
+            self._discard_output()
+        if not self.done:
+            raise ZipStreamError("Archive ended before the central directory")
+
+    def _selected(self, name: str) -> bool:
+        if not self.include:
+            return True
+        return any(name.startswith(prefix) or name == prefix.rstrip('/') for prefix in self.include)
+
+    def _target(self, name: str) -> Optional[Path]:
+        parts = PurePosixPath(name).parts
+        if not parts or name.startswith('/') or '..' in parts:
+            LOGGER.warning(f"Skipping unsafe archive member {name}")
+            return None
+        return self.destination.joinpath(*parts)
+
+    def _step(self) -> bool:
+        if self._state == 'header':
+            return self._read_header()
+        if self._state == 'data':
+            return self._read_data()
+        if self._state == 'descriptor':
+            return self._read_descriptor()
+        return False
+
+    def _read_header(self) -> bool:
+        if len(self._buffer) < 4:
+            return False
+        signature = struct.unpack_from('<I', self._buffer)[0]
+        if signature in END_SIGS:
+            self.done = True
+            self._buffer.clear()
+            return False
+        if signature != LOCAL_HEADER_SIG:
+            raise ZipStreamError(f"Unexpected signature {signature:#x} in archive")
+        if len(self._buffer) < LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, csize, usize, name_len, extra_len) = LOCAL_HEADER.unpack_from(self._buffer)
+        header_len = LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buffer) < header_len:
+            return False
+
+        name = bytes(self._buffer[LOCAL_HEADER.size:LOCAL_HEADER.size + name_len]).decode('utf-8', 'replace')
+        extra = bytes(self._buffer[LOCAL_HEADER.size + name_len:header_len])
+        del self._buffer[:header_len]
+
+        if flags & 0x1:
+            raise ZipStreamError(f"Encrypted member {name} is not supported")
+        if method not in (0, 8):
+            raise ZipStreamError(f"Compression method {method} for {name} is not supported")
+
+        zip64 = False
+        if csize == 0xFFFFFFFF or usize == 0xFFFFFFFF:
+            zip64 = True
+            usize, csize = self._zip64_sizes(extra, usize, csize)
+
+        has_descriptor = bool(flags & 0x8)
+        self._member = {
+            'name': name,
+            'method': method,
+            'crc': crc,
+            'has_descriptor': has_descriptor,
+            'zip64': zip64,
+            # Sizes in the local header are zero when a data descriptor follows
+            'remaining': None if has_descriptor else csize,
+            'running_crc': 0,
+            'written': 0,
+            'decompressor': zlib.decompressobj(-zlib.MAX_WBITS) if method == 8 else None,
+        }
+        self._open_output(name)
+        self._state = 'data'
+        if self._member['remaining'] == 0:
+            self._end_data()
+        return True
+
+    @staticmethod
+    def _zip64_sizes(extra: bytes, usize: int, csize: int):
+        offset = 0
+        while offset + 4 <= len(extra):
+            header_id, size = struct.unpack_from('<HH', extra, offset)
+            if header_id == ZIP64_EXTRA_ID:
+                fields = extra[offset + 4:offset + 4 + size]
+                values = [struct.unpack_from('<Q', fields, i)[0] for i in range(0, len(fields) - 7, 8)]
+                if usize == 0xFFFFFFFF and values:
+                    usize = values.pop(0)
+                if csize == 0xFFFFFFFF and values:
+                    csize = values.pop(0)
+                break
+            offset += 4 + size
+        return usize, csize
+
+    def _open_output(self, name: str) -> None:
+        self._out = None
+        if not self._selected(name):
+            return
+        target = self._target(name)
+        if target is None:
+            return
+        if name.endswith('/'):
+            target.mkdir(parents=True, exist_ok=True)
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        self._member['target'] = target
+        self._out = open(target.with_name(target.name + '.part'), 'wb')
+
+    def _write(self, data: bytes) -> None:
+        self._member['running_crc'] = zlib.crc32(data, self._member['running_crc'])
+        if self._out is not None:
+            self._out.write(data)
+
+    def _take(self) -> bytes:
+        remaining = self._member['remaining']
+        size = len(self._buffer) if remaining is None else min(remaining, len(self._buffer))
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        if remaining is not None:
+            self._member['remaining'] = remaining - size
+        self._member['written'] += size
+        return chunk
+
+    def _read_data(self) -> bool:
+        if not self._buffer:
+            return False
+        member = self._member
+        if member['method'] == 8:
+            return self._inflate()
+        if member['remaining'] is not None:
+            self._write(self._take())
+            if member['remaining'] == 0:
+                self._end_data()
+            return True
+        return self._scan_stored()
+
+    def _inflate(self) -> bool:
+        member = self._member
+        decompressor = member['decompressor']
+        data = self._take()
+        while True:
+            out = decompressor.decompress(data, OUTPUT_CHUNK)
+            if out:
+                self._write(out)
+            if decompressor.eof:
+                unused = decompressor.unused_data
+                if unused:
+                    self._buffer[:0] = unused
+                    member['written'] -= len(unused)
+                    if member['remaining'] is not None:
+                        member['remaining'] += len(unused)
+                self._end_data()
+                return True
+            data = decompressor.unconsumed_tail
+            if not data and not out:
+                break
+        if member['remaining'] == 0:
+            raise ZipStreamError(f"Compressed data for {member['name']} ended early")
+        return True
+
+    def _scan_stored(self) -> bool:
+        """Find the end of a stored member whose size is only given in its data descriptor"""
+        member = self._member
+        size_len = 8 if member['zip64'] else 4
+        descriptor_len = 4 + 4 + 2 * size_len
+        start = 0
+        while True:
+            index = self._buffer.find(DESCRIPTOR_SIG, start)
+            if index == -1:
+                # Hold back a few bytes in case the signature straddles two chunks
+                keep = min(len(DESCRIPTOR_SIG) - 1, len(self._buffer))
+                chunk = bytes(self._buffer[:len(self._buffer) - keep])
+                if not chunk:
+                    return False
+                del self._buffer[:len(chunk)]
+                member['written'] += len(chunk)
+                self._write(chunk)
+                return True
+            if len(self._buffer) < index + descriptor_len:
+                chunk = bytes(self._buffer[:index])
+                del self._buffer[:index]
+                member['written'] += len(chunk)
+                self._write(chunk)
+                return bool(chunk)
+            crc = struct.unpack_from('<I', self._buffer, index + 4)[0]
+            fmt = '<Q' if member['zip64'] else '<I'
+            csize = struct.unpack_from(fmt, self._buffer, index + 8)[0]
+            candidate = bytes(self._buffer[:index])
+            if csize == member['written'] + index and crc == zlib.crc32(candidate, member['running_crc']):
+                del self._buffer[:index]
+                member['written'] += index
+                self._write(candidate)
+                self._end_data()
+                return True
+            start = index + 1
+
+    def _end_data(self) -> None:
+        self._state = 'descriptor' if self._member['has_descriptor'] else 'finish'
+        if self._state == 'finish':
+            self._finish_member(self._member['crc'])
+
+    def _read_descriptor(self) -> bool:
+        size_len = 8 if self._member['zip64'] else 4
+        if len(self._buffer) < 4:
+            return False
+        offset = 4 if bytes(self._buffer[:4]) == DESCRIPTOR_SIG else 0
+        needed = offset + 4 + 2 * size_len
+        if len(self._buffer) < needed:
+            return False
+        crc = struct.unpack_from('<I', self._buffer, offset)[0]
+        del self._buffer[:needed]
+        self._finish_member(crc)
+        return True
+
+    def _finish_member(self, expected_crc: int) -> None:
+        member = self._member
+        if member['running_crc'] != expected_crc:
+            self._discard_output()
+            raise ZipStreamError(f"CRC mismatch for {member['name']}")
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+            target: Path = member['target']
+            target.with_name(target.name + '.part').replace(target)
+            self.extracted.append(member['name'])
+        self._state = 'header'
+
+    def _discard_output(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+            target: Path = self._member['target']
+            target.with_name(target.name + '.part').unlink(missing_ok=True)
+
+
+class AssetDownloader:
+    """Downloads a task's all.zip once, extracting members while the transfer runs"""
+
+    def __init__(self, client: Optional[NodeODMClient] = None):
+        self.client = client or nodeodm_client
+
+    async def download(
+        self,
+        nodeodm_task_id: str,
+        destination: Path,
+        include: Optional[Sequence[str]] = None,
+        client: Optional[NodeODMClient] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> List[str]:
+        """
+        Stream and extract the task archive into destination
+
+        Args:
+            nodeodm_task_id: NodeODM task UUID
+            destination: Directory the archive members are extracted into
+            include: Optional member prefixes to keep, e.g. ["odm_orthophoto/"]
+            client: Client of the node holding the task (defaults to this downloader's client)
+            on_progress: Called with the bytes streamed so far after each extracted batch
+
+        Returns:
+            Names of the extracted archive members
+        """
+        if include is None:
+            include = settings.RESULT_ARTIFACTS
+        client = client or self.client
+        destination.mkdir(parents=True, exist_ok=True)
+        extractor = StreamingZipExtractor(destination, include)
+        started = time.perf_counter()
+        offset = 0
+        attempt = 0
+        pending: List[bytes] = []
+        pending_size = 0
+        while True:
+            try:
+                async for chunk in client.iter_asset(nodeodm_task_id, 'all.zip', offset):
+                    offset += len(chunk)
+                    pending.append(chunk)
+                    pending_size += len(chunk)
+                    if pending_size >= settings.UPLOAD_CHUNK_SIZE:
+                        # Inflate and write off the event loop in chunk-sized batches
+                        await asyncio.to_thread(extractor.feed, b''.join(pending))
+                        pending, pending_size = [], 0
+                        if on_progress is not None:
+                            on_progress(offset)
+                break
+            except NodeODMError as e:
+                attempt += 1
+                if attempt > settings.DOWNLOAD_MAX_RETRIES:
+                    raise
+                LOGGER.warning(f"Download of task {nodeodm_task_id} interrupted at {offset} bytes, resuming: {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+        if pending:
+            await asyncio.to_thread(extractor.feed, b''.join(pending))
+        extractor.close()
+        DOWNLOAD_DURATION.observe(time.perf_counter() - started)
+        DOWNLOAD_BYTES.observe(offset)
+        LOGGER.info(f"Extracted {len(extractor.extracted)} files ({offset} bytes streamed) for task {nodeodm_task_id}")
+        return extractor.extracted
+
+
+# Create downloader instance
+asset_downloader = AssetDownloader()
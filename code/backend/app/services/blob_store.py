@@ -0,0 +1,242 @@
+"""
+Content-addressed blob store that deduplicates uploaded images across tasks
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..core.config import settings
+
+LOGGER = logging.getLogger(__name__)
+
+BLOB_DB_FILENAME = "blobs.db"
+STAGING_DIRNAME = ".staging"
+# Staged files untouched this long are leftovers of crashed uploads; younger ones may still be written
+STAGING_MAX_AGE = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    task_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (task_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_sha256 ON refs (sha256);
+"""
+
+
+class BlobStore:
+    """
+    Stores each distinct image once under BLOB_STORE_DIR/{sha[:2]}/{sha}
+
+    Task upload directories hold hardlinks to the blobs, and every link is
+    recorded as a reference so blobs can be collected once no task uses them.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or settings.BLOB_STORE_DIR)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Open the database on first use, so importing the module creates no files (callers hold _lock)"""
+        if self._connection is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.root / BLOB_DB_FILENAME, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+            self._connection = conn
+        return self._connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold the database write lock, which other processes respect too, for a check-then-act change"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @property
+    def staging_dir(self) -> Path:
+        """Directory for uploads being hashed, on the store's filesystem so they can be moved in"""
+        path = self.root / STAGING_DIRNAME
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def staging_path(self) -> Path:
+        """Temporary path on the blob store's filesystem for an upload being hashed"""
+        return self.staging_dir / f"{uuid.uuid4().hex}.part"
+
+    def has(self, sha256: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        return row is not None and self.blob_path(sha256).exists()
+
+    def add(self, staged: Path, sha256: str, size: int, destination: Path, task_id: str) -> bool:
+        """
+        Store a fully written and hashed file and link it at destination
+
+        An identical blob already stored is linked instead and the staged
+        copy dropped. If that blob is collected before it can be linked, the
+        staged copy is ingested after all.
+
+        Returns:
+            True if the blob is new, False if an identical blob was already stored
+        """
+        if self.link(sha256, destination, task_id):
+            staged.unlink(missing_ok=True)
+            return False
+        path = self.blob_path(sha256)
+        with self._transaction() as conn:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            staged.replace(path)
+            # Blobs are shared by every task linking them, so they must never be edited in place
+            path.chmod(0o444)
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, created_at) VALUES (?, ?, ?)",
+                (sha256, size, datetime.utcnow().isoformat()),
+            )
+            self._link_file(conn, sha256, destination, task_id)
+        return True
+
+    def link(self, sha256: str, destination: Path, task_id: str) -> bool:
+        """
+        Materialise a stored blob at destination and record the task's reference to it
+
+        The reference is recorded in the same transaction that checks the blob
+        is still stored, so collect() can never delete a blob being linked.
+
+        Returns:
+            False, with nothing linked, if the blob is not (or no longer) stored
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None or not self.blob_path(sha256).exists():
+                return False
+            self._link_file(conn, sha256, destination, task_id)
+        return True
+
+    def _link_file(self, conn: sqlite3.Connection, sha256: str, destination: Path, task_id: str) -> None:
+        source = self.blob_path(sha256)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.unlink(missing_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError:
+            # Upload and blob directories on different filesystems cannot share inodes
+            LOGGER.debug(f"Hardlink to {destination} failed, copying blob {sha256}")
+            shutil.copyfile(source, destination)
+        conn.execute(
+            "INSERT OR REPLACE INTO refs (task_id, name, sha256) VALUES (?, ?, ?)",
+            (task_id, destination.name, sha256),
+        )
+
+    def release(self, task_id: str) -> int:
+        """Drop all references held by a task; returns the number released"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM refs WHERE task_id = ?", (task_id,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def collect(self) -> Tuple[int, int]:
+        """
+        Delete blobs that no task references
+
+        Staged files are removed only once they are older than
+        STAGING_MAX_AGE, since uploads in flight stage there too.
+
+        Returns:
+            Number of blobs removed and bytes freed
+        """
+        with self._lock:
+            orphans = self._conn.execute(
+                "SELECT sha256, size FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM refs)"
+            ).fetchall()
+        removed, freed = 0, 0
+        for row in orphans:
+            with self._transaction() as conn:
+                # A task in this or another process may have linked the blob since it was listed
+                if conn.execute("SELECT 1 FROM refs WHERE sha256 = ? LIMIT 1", (row['sha256'],)).fetchone():
+                    continue
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (row['sha256'],))
+                self.blob_path(row['sha256']).unlink(missing_ok=True)
+            removed += 1
+            freed += row['size']
+        cutoff = time.time() - STAGING_MAX_AGE
+        for staged in self.staging_dir.glob("*.part"):
+            try:
+                if staged.stat().st_mtime < cutoff:
+                    staged.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+        if removed:
+            LOGGER.info(f"Collected {removed} unreferenced blobs ({freed} bytes)")
+        return removed, freed
+
+    def stats(self) -> Dict[str, int]:
+        """Blob count, bytes on disk, bytes referenced by tasks and bytes saved by deduplication"""
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS bytes FROM blobs").fetchone()
+            referenced = self._conn.execute(
+                "SELECT COUNT(*) AS refs, COALESCE(SUM(blobs.size), 0) AS bytes FROM refs JOIN blobs USING (sha256)"
+            ).fetchone()
+            shared = self._conn.execute(
+                """
+                SELECT COALESCE(SUM(blobs.size * (counts.n - 1)), 0) AS bytes
+                FROM (SELECT sha256, COUNT(*) AS n FROM refs GROUP BY sha256) AS counts
+                JOIN blobs USING (sha256)
+                """
+            ).fetchone()
+        return {
+            'blobs': stored['blobs'],
+            'stored_bytes': stored['bytes'],
+            'references': referenced['refs'],
+            'referenced_bytes': referenced['bytes'],
+            'saved_bytes': shared['bytes'],
+        }
+
+
+# Create store instance
+blob_store = BlobStore()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the upload blob store")
+    parser.add_argument("command", choices=["gc", "stats"], help="gc: delete unreferenced blobs; stats: print usage")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == "gc":
+        removed, freed = blob_store.collect()
+        print(f"Removed {removed} blobs, freed {freed} bytes")
+    elif args.command == "stats":
+        for key, value in blob_store.stats().items():
+            print(f"{key}: {value}")
@@ -0,0 +1,330 @@
+"""
+Elevation sampling of a task's DSM/DTM at point batches and along profiles
+"""
+
+import asyncio
+import logging
+import math
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    import rasterio
+    from rasterio.crs import CRS
+    from rasterio.errors import CRSError
+    from rasterio.warp import transform as transform_coords
+    from rasterio.windows import Window
+except ImportError:  # DEM sampling needs the optional 'geo' extra
+    rasterio = None
+
+from ..core.config import settings
+from .file_storage import FileStorageService, file_storage_service
+from .rasters import RasterUnavailableError
+
+LOGGER = logging.getLogger(__name__)
+
+DEMS = ('dsm', 'dtm')
+
+
+class SamplingError(ValueError):
+    """Raised when a batch of points or a profile line cannot be sampled"""
+
+
+class _OpenDEM:
+    """
+    A DEM dataset kept open between queries
+
+    rasterio handles are not thread-safe, so reads hold its lock. `users`
+    counts the queries that borrowed it; a handle dropped from the cache while
+    borrowed is closed by its last user instead of under its feet.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.mtime_ns = path.stat().st_mtime_ns
+        self.lock = threading.Lock()
+        self.dataset = rasterio.open(path)
+        self.users = 0
+        self.retired = False
+
+    def close(self) -> None:
+        with self.lock:
+            self.dataset.close()
+
+
+def bilinear(data: "np.ndarray", valid: "np.ndarray", rows: "np.ndarray", cols: "np.ndarray") -> "np.ndarray":
+    """
+    Bilinearly interpolate data at fractional pixel-center coordinates
+
+    Neighbours that are nodata are left out and the remaining weights
+    renormalized, so points on the edge of a hole still get a value; points
+    with no valid neighbour come back NaN.
+    """
+    height, width = data.shape
+    row0 = np.floor(rows).astype(np.int64)
+    col0 = np.floor(cols).astype(np.int64)
+    dr = rows - row0
+    dc = cols - col0
+    total = np.zeros(rows.shape, dtype=np.float64)
+    weights = np.zeros(rows.shape, dtype=np.float64)
+    for row_step, col_step, weight in (
+        (0, 0, (1 - dr) * (1 - dc)),
+        (0, 1, (1 - dr) * dc),
+        (1, 0, dr * (1 - dc)),
+        (1, 1, dr * dc),
+    ):
+        r = np.clip(row0 + row_step, 0, height - 1)
+        c = np.clip(col0 + col_step, 0, width - 1)
+        ok = valid[r, c] & (weight > 0)
+        total += np.where(ok, data[r, c] * weight, 0.0)
+        weights += np.where(ok, weight, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weights > 0, total / weights, np.nan)
+
+
+def sample_dataset(src, xs: "np.ndarray", ys: "np.ndarray", window_size: int) -> "np.ndarray":
+    """
+    Elevations at raster CRS coordinates, NaN outside the raster or over nodata
+
+    Points are grouped into window_size pixel cells and each cell is read
+    once as a window (plus a one pixel margin for interpolation), so a large
+    batch touches only the blocks under its points.
+    """
+    inverse = ~src.transform
+    cols, rows = inverse * (xs, ys)
+    # Pixel-center coordinates
+    cols = np.asarray(cols, dtype=np.float64) - 0.5
+    rows = np.asarray(rows, dtype=np.float64) - 0.5
+    result = np.full(xs.shape, np.nan)
+    inside = (cols >= -0.5) & (cols <= src.width - 0.5) & (rows >= -0.5) & (rows <= src.height - 0.5)
+    if not inside.any():
+        return result
+
+    indices = np.nonzero(inside)[0]
+    cells = (
+        np.clip(np.floor(rows[indices]), 0, src.height - 1).astype(np.int64) // window_size * (src.width // window_size + 1)
+        + np.clip(np.floor(cols[indices]), 0, src.width - 1).astype(np.int64) // window_size
+    )
+    order = np.argsort(cells, kind='stable')
+    indices, cells = indices[order], cells[order]
+    boundaries = np.flatnonzero(np.diff(cells)) + 1
+    for group in np.split(indices, boundaries):
+        row_start = max(int(np.floor(rows[group].min())), 0)
+        col_start = max(int(np.floor(cols[group].min())), 0)
+        row_stop = min(int(np.floor(rows[group].max())) + 2, src.height)
+        col_stop = min(int(np.floor(cols[group].max())) + 2, src.width)
+        window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+        block = src.read(1, window=window, masked=True)
+        data = np.asarray(block.filled(0), dtype=np.float64)
+        valid = ~np.ma.getmaskarray(block) & np.isfinite(data)
+        result[group] = bilinear(data, valid, rows[group] - row_start, cols[group] - col_start)
+    return result
+
+
+def densify(xs: "np.ndarray", ys: "np.ndarray", spacing: float, max_samples: int) -> "Tuple[np.ndarray, np.ndarray, np.ndarray]":
+    """
+    Points every spacing units along a polyline, always including its vertices
+
+    Returns:
+        (x, y, distance along the line) arrays
+    """
+    segment_lengths = np.hypot(np.diff(xs), np.diff(ys))
+    length = float(segment_lengths.sum())
+    count = int(math.floor(length / spacing)) + 1
+    if count + len(xs) > max_samples:
+        raise SamplingError(
+            f"The profile would have {count + len(xs)} samples; use a larger spacing (at most {max_samples} samples)"
+        )
+    vertex_distances = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+    distances = np.union1d(np.arange(count) * spacing, vertex_distances)
+    return np.interp(distances, vertex_distances, xs), np.interp(distances, vertex_distances, ys), distances
+
+
+class ElevationService:
+    """
+    Samples DEMs for point batches and profiles
+
+    Datasets stay open in a bounded LRU of ELEVATION_CACHE_SIZE handles, so
+    repeated queries against the same task reuse its handle and GDAL's block
+    cache instead of opening and decoding the raster again. A handle is
+    reopened when its file changes and closed when its task is deleted.
+    """
+
+    def __init__(self, storage: Optional[FileStorageService] = None, cache_size: Optional[int] = None):
+        self.storage = storage or file_storage_service
+        self.cache_size = cache_size or settings.ELEVATION_CACHE_SIZE
+        self._handles: "OrderedDict[Path, _OpenDEM]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return rasterio is not None
+
+    def dem_path(self, task_id: str, dem: str) -> Optional[Path]:
+        if dem not in DEMS:
+            return None
+        return self.storage.get_raster_path(task_id, dem)
+
+    @contextmanager
+    def _borrow(self, path: Path) -> Iterator[_OpenDEM]:
+        """Check out the cached handle of a DEM, opening it if needed, for the duration of a query"""
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None and handle.mtime_ns == path.stat().st_mtime_ns:
+                self._handles.move_to_end(path)
+                stale = []
+            else:
+                stale = [self._handles.pop(path)] if handle is not None else []
+                handle = _OpenDEM(path)
+                self._handles[path] = handle
+                while len(self._handles) > self.cache_size:
+                    stale.append(self._handles.popitem(last=False)[1])
+            handle.users += 1
+            unused = self._retire(stale)
+        for old in unused:
+            old.close()
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.users -= 1
+                last = handle.retired and handle.users == 0
+            if last:
+                handle.close()
+
+    def _retire(self, handles: List[_OpenDEM]) -> List[_OpenDEM]:
+        """Mark handles dropped from the cache; returns those no query holds, to be closed now (call with _lock held)"""
+        for handle in handles:
+            handle.retired = True
+        return [handle for handle in handles if handle.users == 0]
+
+    def invalidate(self, task_id: str) -> None:
+        """Close cached handles of a task's DEMs, e.g. because it is being deleted"""
+        task_dir = self.storage.results_dir / task_id
+        with self._lock:
+            unused = self._retire([self._handles.pop(path) for path in list(self._handles) if task_dir in path.parents])
+        for handle in unused:
+            handle.close()
+
+    def close(self) -> None:
+        with self._lock:
+            unused = self._retire(list(self._handles.values()))
+            self._handles.clear()
+        for handle in unused:
+            handle.close()
+
+    def _to_dem_crs(self, src, xs: "np.ndarray", ys: "np.ndarray", crs: Optional[str]) -> "Tuple[np.ndarray, np.ndarray]":
+        try:
+            other = CRS.from_user_input(crs) if crs else None
+        except CRSError as e:
+            raise SamplingError(f"Unknown CRS {crs}: {e}")
+        if other and src.crs and other != src.crs:
+            xs, ys = transform_coords(crs, src.crs, xs, ys)
+        return np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+
+    def _from_dem_crs(self, src, xs: "np.ndarray", ys: "np.ndarray", crs: Optional[str]) -> "Tuple[np.ndarray, np.ndarray]":
+        if crs and src.crs and CRS.from_user_input(crs) != src.crs:
+            xs, ys = transform_coords(src.crs, crs, xs, ys)
+        return np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+
+    def sample_points(self, path: Path, points: Sequence[Sequence[float]], crs: Optional[str]) -> Dict[str, Any]:
+        """Elevations at points (x, y in crs), None where the DEM has no data"""
+        if len(points) > settings.ELEVATION_MAX_POINTS:
+            raise SamplingError(f"At most {settings.ELEVATION_MAX_POINTS} points can be sampled at once")
+        coords = _coordinates(points)
+        with self._borrow(path) as handle, handle.lock:
+            src = handle.dataset
+            xs, ys = self._to_dem_crs(src, coords[:, 0], coords[:, 1], crs)
+            elevations = sample_dataset(src, xs, ys, settings.ELEVATION_WINDOW_SIZE)
+            dem_crs = src.crs.to_string() if src.crs else None
+        return {'crs': dem_crs, 'elevations': _values(elevations)}
+
+    def sample_profile(
+        self,
+        path: Path,
+        line: Sequence[Sequence[float]],
+        crs: Optional[str],
+        spacing: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Elevations along a polyline (x, y in crs) every spacing DEM CRS units
+
+        Spacing defaults to the DEM's resolution. Distances are measured in
+        the DEM's CRS, which for ODM outputs is a metric UTM zone.
+        """
+        coords = _coordinates(line)
+        if len(coords) < 2:
+            raise SamplingError("A profile needs at least two vertices")
+        with self._borrow(path) as handle, handle.lock:
+            src = handle.dataset
+            line_xs, line_ys = self._to_dem_crs(src, coords[:, 0], coords[:, 1], crs)
+            xs, ys, distances = densify(
+                line_xs, line_ys, spacing or min(src.res), settings.ELEVATION_MAX_POINTS,
+            )
+            elevations = sample_dataset(src, xs, ys, settings.ELEVATION_WINDOW_SIZE)
+            out_xs, out_ys = self._from_dem_crs(src, xs, ys, crs)
+            dem_crs = src.crs.to_string() if src.crs else None
+        return {
+            'crs': dem_crs,
+            'length': float(distances[-1]),
+            'distances': [round(float(d), 3) for d in distances],
+            'coordinates': [[float(x), float(y)] for x, y in zip(out_xs, out_ys)],
+            'elevations': _values(elevations),
+        }
+
+    async def points(
+        self,
+        task_id: str,
+        dem: str,
+        points: Sequence[Sequence[float]],
+        crs: Optional[str] = 'EPSG:4326',
+    ) -> Optional[Dict[str, Any]]:
+        """Sample a task's DEM at points off the event loop; None if the task has no such DEM"""
+        path = self._path_or_raise(task_id, dem)
+        if path is None:
+            return None
+        return await asyncio.to_thread(self.sample_points, path, points, crs)
+
+    async def profile(
+        self,
+        task_id: str,
+        dem: str,
+        line: Sequence[Sequence[float]],
+        crs: Optional[str] = 'EPSG:4326',
+        spacing: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Sample a task's DEM along a polyline off the event loop; None if the task has no such DEM"""
+        path = self._path_or_raise(task_id, dem)
+        if path is None:
+            return None
+        return await asyncio.to_thread(self.sample_profile, path, line, crs, spacing)
+
+    def _path_or_raise(self, task_id: str, dem: str) -> Optional[Path]:
+        if not self.available:
+            raise RasterUnavailableError("Elevation queries need the optional 'geo' extra (rasterio)")
+        return self.dem_path(task_id, dem)
+
+
+def _coordinates(points: Sequence[Sequence[float]]) -> "np.ndarray":
+    if not points:
+        raise SamplingError("No coordinates given")
+    try:
+        coords = np.asarray(points, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise SamplingError("Coordinates must be [x, y] pairs")
+    if coords.ndim != 2 or coords.shape[1] != 2 or not np.isfinite(coords).all():
+        raise SamplingError("Coordinates must be [x, y] pairs")
+    return coords
+
+
+def _values(elevations: "np.ndarray") -> List[Optional[float]]:
+    """JSON-ready elevations rounded to the millimetre, None for NaN"""
+    return [None if math.isnan(value) else round(value, 3) for value in elevations.tolist()]
+
+
+# Create service instance
+elevation_service = ElevationService()
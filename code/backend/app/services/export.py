@@ -0,0 +1,156 @@
+"""
+Bulk export that streams artifacts of many tasks as one zip built on the fly
+"""
+
+import logging
+import re
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+from ..core.config import settings
+from .file_storage import FileStorageService, file_storage_service, is_valid_task_id
+from .indices import INDEX_DIR
+from .rasters import RASTERS
+from .results_catalog import ARTIFACTS
+
+LOGGER = logging.getLogger(__name__)
+
+# Artifact type -> candidate paths relative to the task's results directory; the first that exists is exported
+EXPORT_ARTIFACTS = {
+    'orthophoto': [ARTIFACTS['orthophoto']],
+    'report': [ARTIFACTS['report']],
+    'geotiff': [RASTERS['orthophoto']],
+    'dsm': [RASTERS['dsm']],
+    'dtm': [RASTERS['dtm']],
+    'ndvi': [Path(INDEX_DIR) / "ndvi.tif"],
+    'ndre': [Path(INDEX_DIR) / "ndre.tif"],
+    # Compacted tasks keep their log gzipped
+    'log': [Path("task_output.txt"), Path("task_output.txt.gz")],
+}
+DEFAULT_ARTIFACTS = ('orthophoto', 'report')
+# Formats that are already compressed and would only cost CPU to deflate again
+STORED_SUFFIXES = {'.png', '.jpg', '.jpeg', '.webp', '.tif', '.tiff', '.pdf', '.gz', '.br', '.zip', '.laz'}
+
+
+class ExportError(ValueError):
+    """Raised when an export names unknown tasks or artifact types"""
+
+
+class ExportEntry(NamedTuple):
+    task_id: str
+    arcname: str
+    path: Path
+    size: int
+    mtime: float
+
+
+class _ZipSink:
+    """Write-only file object that zipfile writes into and the response drains"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def iter_zip(entries: Sequence[ExportEntry], chunk_size: int) -> Iterator[bytes]:
+    """
+    Yield a zip archive of entries chunk by chunk
+
+    Nothing is staged on disk and at most about one chunk of each file is
+    held in memory. Sizes and CRCs follow each entry in a data descriptor, and
+    zip64 records are used for entries and archives past 4GB.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry.arcname, date_time=time.localtime(entry.mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED if entry.path.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+            # Lets zipfile decide up front whether the entry needs zip64 headers
+            info.file_size = entry.size
+            with open(entry.path, 'rb') as source, archive.open(info, 'w') as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory
+    yield sink.drain()
+
+
+def folder_name(task_id: str, task_name: Optional[str]) -> str:
+    """Archive folder for a task: its name made path-safe plus a short id, or the id alone"""
+    safe = re.sub(r'[^A-Za-z0-9._-]+', '_', task_name or '').strip('._')
+    return f"{safe}-{task_id[:8]}" if safe else task_id
+
+
+class ExportService:
+    """Plans and streams multi-task artifact exports"""
+
+    def __init__(self, storage: Optional[FileStorageService] = None):
+        self.storage = storage or file_storage_service
+
+    def plan(self, task_ids: Sequence[str], artifacts: Sequence[str] = DEFAULT_ARTIFACTS) -> List[ExportEntry]:
+        """
+        Resolve the files an export will contain
+
+        Artifacts a task does not have are skipped; unknown tasks or artifact
+        types fail the whole export before anything is streamed.
+        """
+        unknown = [name for name in artifacts if name not in EXPORT_ARTIFACTS]
+        if unknown:
+            raise ExportError(f"Unknown artifact types: {', '.join(unknown)}")
+        if not task_ids:
+            raise ExportError("No tasks to export")
+        if len(task_ids) > settings.EXPORT_MAX_TASKS:
+            raise ExportError(f"At most {settings.EXPORT_MAX_TASKS} tasks can be exported at once")
+
+        entries: List[ExportEntry] = []
+        missing = []
+        for task_id in dict.fromkeys(task_ids):
+            task_dir = self.storage.results_dir / task_id
+            if not is_valid_task_id(task_id):
+                missing.append(task_id)
+                continue
+            manifest = self.storage.read_manifest(task_id)
+            if manifest is None or not task_dir.is_dir():
+                missing.append(task_id)
+                continue
+            folder = folder_name(task_id, manifest.get('task_name'))
+            for name in dict.fromkeys(artifacts):
+                for relative in EXPORT_ARTIFACTS[name]:
+                    path = task_dir / relative
+                    if path.is_file():
+                        stat = path.stat()
+                        entries.append(ExportEntry(task_id, f"{folder}/{path.name}", path, stat.st_size, stat.st_mtime))
+                        break
+        if missing:
+            raise ExportError(f"Unknown tasks: {', '.join(missing)}")
+        return entries
+
+    def stream(self, entries: Sequence[ExportEntry]) -> Iterator[bytes]:
+        """Zip the planned entries as a generator for a streaming response"""
+        LOGGER.info(f"Exporting {len(entries)} files ({sum(entry.size for entry in entries)} bytes)")
+        return iter_zip(entries, settings.EXPORT_CHUNK_SIZE)
+
+
+# Create service instance
+export_service = ExportService()
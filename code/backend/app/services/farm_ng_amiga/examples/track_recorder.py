@@ -0,0 +1,63 @@
+"""
+Stream an Amiga's GPS track into the Drone Imagery API
+
+Subscribes to the Amiga GPS service's PVT messages with the farm-ng SDK and
+forwards each fix as a `t,lat,lon,heading,speed` line over one long-lived
+POST to /api/v1/tracks/{track_id}/samples, so the backend stores it while the
+robot drives. Run it on the Amiga brain (or anywhere that can reach the GPS
+service) with a service config such as:
+
+    {"name": "gps", "port": 3001, "host": "localhost", "subscriptions": [{"uri": {"path": "/pvt", "query": "service_name=gps"}, "every_n": 1}]}
+
+Usage:
+    python track_recorder.py --service-config gps_config.json --api http://backend:8001 --name "north field"
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import httpx
+from farm_ng.core.event_client import EventClient
+from farm_ng.core.event_service_pb2 import EventServiceConfig
+from farm_ng.core.events_file_reader import proto_from_json_file
+
+
+async def gps_lines(config: EventServiceConfig) -> AsyncIterator[bytes]:
+    """One sample line per GPS fix"""
+    async for _, frame in EventClient(config).subscribe(config.subscriptions[0], decode=True):
+        yield (
+            f"{frame.gps_time.stamp:.3f},{frame.latitude:.9f},{frame.longitude:.9f},"
+            f"{frame.heading_motion:.2f},{frame.ground_speed:.3f}\n"
+        ).encode()
+
+
+async def record(service_config: Path, api: str, name: Optional[str], task_id: Optional[str]) -> None:
+    config: EventServiceConfig = proto_from_json_file(service_config, EventServiceConfig())
+    async with httpx.AsyncClient(base_url=api, timeout=httpx.Timeout(10.0, read=None, write=None)) as client:
+        response = await client.post("/api/v1/tracks/", params={'name': name, 'task_id': task_id})
+        response.raise_for_status()
+        track_id = response.json()['track_id']
+        print(f"Recording track {track_id}")
+        while True:
+            try:
+                # Chunked upload that stays open for as long as fixes arrive
+                response = await client.post(f"/api/v1/tracks/{track_id}/samples", content=gps_lines(config))
+                response.raise_for_status()
+                print(f"Stream ended: {response.json()}")
+                return
+            except httpx.TransportError as e:
+                # Samples already sent are stored; reconnect and keep appending
+                print(f"Connection lost ({e}), reconnecting")
+                await asyncio.sleep(1.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream Amiga GPS fixes to the Drone Imagery API")
+    parser.add_argument("--service-config", type=Path, required=True, help="farm-ng GPS service config JSON")
+    parser.add_argument("--api", default="http://localhost:8001", help="Backend base URL")
+    parser.add_argument("--name", help="Track name")
+    parser.add_argument("--task-id", help="Task whose orthophoto the track belongs to")
+    args = parser.parse_args()
+    asyncio.run(record(args.service_config, args.api, args.name, args.task_id))
@@ -0,0 +1,48 @@
+"""
+Exclusive file locks shared between processes on POSIX and Windows
+"""
+
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; msvcrt byte-range locks stand in for flock
+    fcntl = None
+    import msvcrt
+
+# Seconds between attempts while another process holds a lock on Windows
+LOCK_POLL_INTERVAL = 0.05
+
+
+@contextmanager
+def file_lock(path: Union[str, Path]) -> Iterator[None]:
+    """
+    Hold an exclusive lock on path, creating the file if needed, for the block
+
+    POSIX uses flock. Windows locks the file's first byte with msvcrt,
+    retrying while another process holds it, since msvcrt's own blocking
+    mode gives up after ten seconds. The lock is released when the block
+    ends or the process dies.
+    """
+    with open(path, 'a+b') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
@@ -8,22 +8,43 @@ import shutil
 import time
 import asyncio
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 import hashlib
-import pyodm
 import logging
 
 from ..core.config import settings
+from .artifacts import artifact_store
+from .asset_download import asset_downloader
+from .file_lock import file_lock
+from .nodeodm_client import NodeODMClient
+from .previews import PREVIEW_FORMAT, preview_service
+from .rasters import raster_service
+from .results_catalog import ResultsCatalog
 LOGGER = logging.getLogger(__name__)
-COMPLETED_STATUS = 'taskstatus.completed'
-FAILED_STATUS = 'taskstatus.failed'
+
+# Manifest fields describing result files, carried over when results are linked into another task
+LINKED_MANIFEST_FIELDS = ('previews', 'rasters', 'indices', 'compacted')
+
+
+def is_valid_task_id(task_id: str) -> bool:
+    """Whether task_id is a single path component that can be joined onto storage directories"""
+    return bool(task_id) and Path(task_id).name == task_id and task_id not in ('.', '..') and '\x00' not in task_id
+
 class FileStorageService:
     """Service for managing NodeODM output file storage"""
     
-    def __init__(self):
-        self.results_dir = Path(settings.RESULTS_DIR)
+    def __init__(self, results_dir: Optional[Path] = None):
+        self.results_dir = Path(results_dir or settings.RESULTS_DIR)
         self.results_dir.mkdir(parents=True, exist_ok=True)
+        self._catalog: Optional[ResultsCatalog] = None
+
+    @property
+    def catalog(self) -> ResultsCatalog:
+        """Shared catalog of the results directory, opened on first use rather than at import"""
+        if self._catalog is None:
+            self._catalog = ResultsCatalog.for_directory(self.results_dir)
+        return self._catalog
 
     def _result_url(self, task_id: str, artifact_name: str) -> str:
         """Build a relative API URL for a task artifact."""
@@ -32,18 +53,37 @@ class FileStorageService:
     def _manifest_path(self, task_id: str) -> Path:
         return self.results_dir / task_id / "manifest.json"
 
-    def write_manifest(self, task_id: str, data: Dict[str, str]) -> None:
+    def _manifest_lock(self, task_id: str) -> ContextManager[None]:
+        """Lock serializing manifest writes of a task across every process sharing RESULTS_DIR"""
+        return file_lock(self.results_dir / f".{task_id}.manifest.lock")
+
+    def _write_manifest_file(self, task_id: str, data: Dict[str, Any]) -> None:
+        import json
         task_dir = self.results_dir / task_id
         task_dir.mkdir(parents=True, exist_ok=True)
         manifest_path = self._manifest_path(task_id)
+        # Write beside the manifest and swap it in, so readers never see a half-written file
+        partial = manifest_path.with_name(manifest_path.name + ".part")
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        partial.replace(manifest_path)
+
+    def _index_manifest(self, task_id: str, data: Dict[str, Any]) -> None:
         try:
-            import json
-            with open(manifest_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self.catalog.upsert_manifest({**data, 'task_id': task_id})
+        except Exception as e:
+            LOGGER.warning(f"Failed to index manifest for task {task_id}: {e}")
+
+    def write_manifest(self, task_id: str, data: Dict[str, Any]) -> None:
+        try:
+            self.results_dir.mkdir(parents=True, exist_ok=True)
+            with self._manifest_lock(task_id):
+                self._write_manifest_file(task_id, data)
         except Exception as e:
             LOGGER.warning(f"Failed to write manifest for task {task_id}: {e}")
+        self._index_manifest(task_id, data)
 
-    def read_manifest(self, task_id: str) -> Optional[Dict[str, str]]:
+    def read_manifest(self, task_id: str) -> Optional[Dict[str, Any]]:
         manifest_path = self._manifest_path(task_id)
         if not manifest_path.exists():
             return None
@@ -55,67 +95,141 @@ class FileStorageService:
             LOGGER.warning(f"Failed to read manifest for task {task_id}: {e}")
             return None
 
-    async def poll_for_download(self, task : pyodm.Task, task_id: str) -> Path | None:
-        """Poll for the download of the NodeODM task"""
-        while True:
-            status = str(task.info().status).lower()
-            LOGGER.info(f"Polling for task {task_id} status: {status}")
-            
-            if status == COMPLETED_STATUS:
-                LOGGER.info(f"Downloading assets for task {task_id}")
-                try:
-                    return task.download_assets(destination = self.results_dir / task_id)
-                except PermissionError as e:
-                    LOGGER.warning(f"[Benign] Permission error downloading assets (Windows file lock): {e}")
-                    # Files were likely downloaded but couldn't be cleaned up, which is okay
-                    # Return the directory path anyway
-                    task_dir = self.results_dir / task_id
-                    if task_dir.exists():
-                        return task_dir
-                    raise
-
-            if status == FAILED_STATUS:
-                LOGGER.error(f"Task {task_id} failed. Error: {task.info().last_error}")
-                return None
-                
-            await asyncio.sleep(5)
-    
-    def store_nodeodm_files(self, task_id: str, nodeodm_task: pyodm.Task) -> Path:
+    def update_manifest(self, task_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Store NodeODM output files locally
-        
+        Merge fields into a task manifest and write it back
+
+        The read and the write happen under the task's manifest lock, so
+        concurrent updates from the API and workers never drop each other's
+        fields. A task without a manifest gets a new one; a manifest that
+        exists but cannot be read raises instead of being overwritten.
+        """
+        import json
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        with self._manifest_lock(task_id):
+            try:
+                with open(self._manifest_path(task_id), 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                manifest = {'task_id': task_id}
+            manifest.update(fields)
+            self._write_manifest_file(task_id, manifest)
+        self._index_manifest(task_id, manifest)
+        return manifest
+
+    def iter_manifests(self) -> Iterator[Dict[str, Any]]:
+        """Yield every readable task manifest under RESULTS_DIR"""
+        if not self.results_dir.exists():
+            return
+        for task_dir in self.results_dir.iterdir():
+            if not task_dir.is_dir():
+                continue
+            manifest = self.read_manifest(task_dir.name)
+            if isinstance(manifest, dict):
+                manifest.setdefault('task_id', task_dir.name)
+                yield manifest
+
+    async def download_assets(
+        self,
+        nodeodm_task_id: str,
+        task_id: str,
+        include: Optional[List[str]] = None,
+        client: Optional[NodeODMClient] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> Path:
+        """
+        Download a completed task's assets into the results directory
+
+        The archive is streamed once and extracted while it downloads, resuming
+        with HTTP Range requests if the transfer is interrupted.
+
         Args:
+            nodeodm_task_id: NodeODM task UUID
             task_id: Our internal task ID
-            nodeodm_task: NodeODM task object
-            
+            include: Optional archive prefixes to keep (defaults to settings.RESULT_ARTIFACTS)
+            client: Client of the node the task ran on (defaults to NODEODM_URL)
+            on_progress: Called with the bytes downloaded so far
+
         Returns:
-            Dictionary mapping file types to local storage paths
+            Path to the task's results directory
         """
         task_dir = self.results_dir / task_id
-        task_dir.mkdir(parents=True, exist_ok=True)
-        
-        stored_files = {}
-        
-        # List of files to retrieve from NodeODM
-        files_to_store = [
-            'orthophoto.tif',
-            'orthophoto.png', 
-            'odm_orthophoto',
-            'odm_dem',
-            'odm_report',
-            'odm_logs'
-        ]
-        
-        for file_type in files_to_store:
-            try:
-                # Download assets from NodeODM
-                pathToData : Path = Path(nodeodm_task.download_assets(destination = task_dir))
-            except Exception as e:
-                # Log error but continue with other files
-                print(f"Failed to store {file_type}: {e}")
+        await asset_downloader.download(nodeodm_task_id, task_dir, include, client=client, on_progress=on_progress)
+        # Rewrite GeoTIFFs as COGs before anything hashes them
+        await self.create_rasters(task_id)
+        # Hash artifacts and precompress JSON/PDF outputs once so serving never has to
+        await artifact_store.prepare(task_dir)
+        await self.create_previews(task_id)
+        self.catalog.refresh_artifacts(task_id)
+        return task_dir
+
+    def link_results(self, source_task_id: str, task_id: str) -> Path:
+        """
+        Give task_id the results of source_task_id without copying them
+
+        Files are hardlinked (copied where the filesystem cannot link), so both
+        tasks are served, exported and deleted independently while sharing
+        the bytes on disk.
+        """
+        source_dir = self.results_dir / source_task_id
+        task_dir = self.results_dir / task_id
+        for source in source_dir.rglob('*'):
+            if source.is_dir() or source == self._manifest_path(source_task_id):
+                continue
+            target = task_dir / source.relative_to(source_dir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists():
                 continue
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+        source_manifest = self.read_manifest(source_task_id) or {}
+        self.update_manifest(task_id, {
+            field: source_manifest[field] for field in LINKED_MANIFEST_FIELDS if field in source_manifest
+        })
+        self.catalog.refresh_artifacts(task_id)
+        return task_dir
+
+    async def create_previews(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Render gallery previews of the orthophoto and record their dimensions in the manifest"""
+        try:
+            previews = await preview_service.create_previews(self.results_dir / task_id)
+        except Exception as e:
+            # Previews are a convenience; the full orthophoto is still served without them
+            LOGGER.warning(f"Failed to create previews for task {task_id}: {e}")
+            return None
+        if previews:
+            self.update_manifest(task_id, {'previews': previews})
+        return previews
+
+    async def create_rasters(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Convert orthophoto and DEM GeoTIFFs to Cloud-Optimized GeoTIFFs and record them in the manifest"""
+        if not settings.COG_ENABLED:
+            return None
+        try:
+            rasters = await raster_service.create_cogs(self.results_dir / task_id)
+        except Exception as e:
+            # The GeoTIFFs are still served whole; only windowed reads get slower
+            LOGGER.warning(f"Failed to convert rasters for task {task_id}: {e}")
+            return None
+        if rasters:
+            self.update_manifest(task_id, {'rasters': rasters})
+        return rasters
+
+    async def store_nodeodm_files(self, task_id: str, nodeodm_task_id: str) -> Path:
+        """
+        Store NodeODM output files locally
         
-        return pathToData
+        Args:
+            task_id: Our internal task ID
+            nodeodm_task_id: NodeODM task UUID
+            
+        Returns:
+            Path to the directory holding the extracted outputs
+        """
+        # all.zip contains every output, so one streamed download covers them all
+        return await self.download_assets(nodeodm_task_id, task_id)
     
     def get_image_path(self, task_id: str) -> Optional[Path]:
         """Get local path for a stored orthophoto PNG"""
@@ -123,6 +237,25 @@ class FileStorageService:
         LOGGER.info(f"Retrieving image path: {file_path}")
         return file_path if file_path.exists() else None
     
+    def get_preview_path(self, task_id: str, size: str) -> Optional[Path]:
+        """Get local path for a stored orthophoto preview ('small' or 'medium')"""
+        return preview_service.preview_path(self.results_dir / task_id, size)
+
+    def preview_fields(self, task_id: str, previews: Dict[str, Any]) -> Dict[str, Any]:
+        """Describe available previews with their URLs and dimensions"""
+        return {
+            name: {
+                'url': self._result_url(task_id, f"previews/{name}.{PREVIEW_FORMAT}"),
+                'width': info['width'],
+                'height': info['height'],
+            }
+            for name, info in previews.items()
+        }
+    
+    def get_raster_path(self, task_id: str, name: str) -> Optional[Path]:
+        """Get local path for a stored GeoTIFF ('orthophoto', 'dsm' or 'dtm')"""
+        return raster_service.raster_path(self.results_dir / task_id, name)
+
     def get_report_path(self, task_id: str) -> Optional[Path]:
         """Get local path for a stored PDF report"""
         file_path = self.results_dir / task_id / Path("odm_report") / "report.pdf"
@@ -149,35 +282,52 @@ class FileStorageService:
                 })
         return files
 
-    def list_tasks_with_orthophoto(self) -> List[Dict[str, str]]:
-        """Return tasks that have an orthophoto PNG available."""
-        tasks: List[Dict[str, str]] = []
-        if not self.results_dir.exists():
-            return tasks
-        ORTHO_DIR = "odm_orthophoto"
-        ORTHO_FILE = "odm_orthophoto.png"
-        REPORT_DIR = "odm_report"
-        REPORT_FILE = "report.pdf"
+    def list_tasks_with_orthophoto(
+        self,
+        page: int = 1,
+        page_size: int = 100,
+        sort: str = 'created_at',
+        order: str = 'desc',
+        name: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return one page of tasks that have an orthophoto PNG available
 
-        for task_dir in self.results_dir.iterdir():
-            if not task_dir.is_dir():
-                continue
-            task_id = task_dir.name
-            if not (task_dir / ORTHO_DIR / ORTHO_FILE).exists():
-                continue
+        Served from the results catalog, so the cost depends on the page size
+        rather than the number of task directories.
 
-            item: Dict[str, str] = {
-                'taskId': task_id,
-                'orthophotoPngUrl': self._result_url(task_id, 'orthophoto.png'),
-                'reportPdfUrl': self._result_url(task_id, 'report.pdf'),
-            }
-            manifest = self.read_manifest(task_id)
-            if manifest and isinstance(manifest, dict):
-                task_name = manifest.get('task_name') or manifest.get('taskName')
-                if task_name:
-                    item['taskName'] = task_name
-            tasks.append(item)
-        return tasks
+        Returns:
+            Tuple of (items, total matching tasks)
+        """
+        rows, total = self.catalog.list_tasks(page=page, page_size=page_size, sort=sort, order=order, name=name)
+        return [self._listing_item(row) for row in rows], total
+
+    def result_links(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Listing entry (artifact URLs, sizes, previews) for one task, or None if it has no orthophoto"""
+        row = self.catalog.get(task_id)
+        if not row or not row['has_orthophoto']:
+            return None
+        return self._listing_item(row)
+
+    def _listing_item(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        task_id = row['task_id']
+        item: Dict[str, Any] = {
+            'taskId': task_id,
+            'orthophotoPngUrl': self._result_url(task_id, 'orthophoto.png'),
+            'orthophotoSize': row['orthophoto_size'],
+        }
+        if row['has_report']:
+            item['reportPdfUrl'] = self._result_url(task_id, 'report.pdf')
+            item['reportSize'] = row['report_size']
+        if row['previews']:
+            item['previews'] = self.preview_fields(task_id, row['previews'])
+        if row['task_name']:
+            item['taskName'] = row['task_name']
+        if row['created_at']:
+            item['createdAt'] = row['created_at']
+        if row['completed_at']:
+            item['completedAt'] = row['completed_at']
+        return item
 
 # Create service instance
 file_storage_service = FileStorageService()
\ No newline at end of file
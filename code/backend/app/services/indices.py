@@ -0,0 +1,302 @@
+"""
+Vegetation index rasters (NDVI, NDRE) computed block by block from multispectral orthophotos
+"""
+
+import asyncio
+import logging
+import math
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+except ImportError:  # Index rasters need the optional 'geo' extra
+    rasterio = None
+
+from ..core.config import settings
+from .file_storage import FileStorageService, file_storage_service
+from .rasters import PREDICTOR_CODECS, RasterUnavailableError, raster_service
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_DIR = "indices"
+# Index name -> (band a, band b); every index is the normalized difference (a - b) / (a + b)
+INDICES = {
+    'ndvi': ('nir', 'red'),
+    'ndre': ('nir', 'rededge'),
+}
+# Histogram bins over [-1, 1] used for percentiles, 0.01 wide
+HISTOGRAM_BINS = 200
+PERCENTILES = (10, 50, 90)
+
+
+class IndexUnavailableError(Exception):
+    """Raised when a task's orthophoto cannot produce the requested index"""
+
+
+def band_numbers() -> Dict[str, int]:
+    """Spectral band name -> 1-based orthophoto band"""
+    return {
+        'red': settings.INDEX_BAND_RED,
+        'rededge': settings.INDEX_BAND_REDEDGE,
+        'nir': settings.INDEX_BAND_NIR,
+    }
+
+
+def compute_block(source: str, band_a: int, band_b: int, window: Tuple[int, int, int, int]) -> Dict[str, Any]:
+    """
+    Compute a normalized difference index for one window of an orthophoto
+
+    Pixels outside the orthophoto's mask (nodata or alpha) and pixels where
+    both bands are zero become NaN. Runs in a worker process, so it only takes
+    and returns plain values and arrays.
+
+    Returns:
+        The window, the float32 index values and partial statistics
+    """
+    with rasterio.open(source) as src:
+        block = Window(*window)
+        a = src.read(band_a, window=block).astype(np.float32)
+        b = src.read(band_b, window=block).astype(np.float32)
+        mask = src.read_masks(band_a, window=block) > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        index = (a - b) / (a + b)
+    valid = mask & np.isfinite(index)
+    index[~valid] = np.nan
+    values = index[valid].astype(np.float64)
+    return {
+        'window': window,
+        'data': index,
+        'count': int(values.size),
+        'sum': float(values.sum()),
+        'sum_squares': float(np.square(values).sum()),
+        'min': float(values.min()) if values.size else None,
+        'max': float(values.max()) if values.size else None,
+        'histogram': np.histogram(np.clip(values, -1.0, 1.0), bins=HISTOGRAM_BINS, range=(-1.0, 1.0))[0],
+    }
+
+
+def iter_windows(width: int, height: int, size: int) -> List[Tuple[int, int, int, int]]:
+    """Split a raster into (col_off, row_off, width, height) windows of at most size x size"""
+    return [
+        (col, row, min(size, width - col), min(size, height - row))
+        for row in range(0, height, size)
+        for col in range(0, width, size)
+    ]
+
+
+def summarize(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-block statistics into count, min, max, mean, std and percentiles"""
+    count = sum(part['count'] for part in parts)
+    if not count:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None,
+                **{f"p{q}": None for q in PERCENTILES}}
+    total = sum(part['sum'] for part in parts)
+    mean = total / count
+    variance = max(sum(part['sum_squares'] for part in parts) / count - mean * mean, 0.0)
+    histogram = np.sum([part['histogram'] for part in parts], axis=0)
+    cumulative = np.cumsum(histogram)
+    edges = np.linspace(-1.0, 1.0, HISTOGRAM_BINS + 1)
+    percentiles = {}
+    for q in PERCENTILES:
+        position = int(np.searchsorted(cumulative, count * q / 100.0))
+        # Midpoint of the bin holding the percentile
+        percentiles[f"p{q}"] = round(float(edges[position] + edges[position + 1]) / 2, 3)
+    return {
+        'count': count,
+        'min': min(part['min'] for part in parts if part['count']),
+        'max': max(part['max'] for part in parts if part['count']),
+        'mean': mean,
+        'std': math.sqrt(variance),
+        **percentiles,
+    }
+
+
+def build_index(
+    source: str,
+    target: str,
+    name: str,
+    bands: Dict[str, int],
+    window_size: int,
+    executor: Executor,
+    max_in_flight: int,
+) -> Dict[str, Any]:
+    """
+    Write one index raster for an orthophoto and return its statistics
+
+    Windows are computed on executor with at most max_in_flight results held
+    in memory at once, and written into a tiled float32 GeoTIFF with
+    overviews as they finish. Runs in a thread so the event loop stays free.
+    """
+    band_a, band_b = (bands[band] for band in INDICES[name])
+    with rasterio.open(source) as src:
+        if src.count < max(band_a, band_b):
+            raise IndexUnavailableError(
+                f"{name.upper()} needs bands {band_a} and {band_b} but the orthophoto has {src.count}; "
+                f"set INDEX_BAND_* for a multispectral orthophoto"
+            )
+        profile = {
+            'driver': 'GTiff',
+            'width': src.width,
+            'height': src.height,
+            'count': 1,
+            'dtype': 'float32',
+            'crs': src.crs,
+            'transform': src.transform,
+            'nodata': float('nan'),
+            'tiled': True,
+            'blockxsize': settings.COG_BLOCK_SIZE,
+            'blockysize': settings.COG_BLOCK_SIZE,
+            'compress': settings.COG_COMPRESSION,
+            'BIGTIFF': 'IF_SAFER',
+        }
+        if settings.COG_COMPRESSION.upper() in PREDICTOR_CODECS:
+            profile['predictor'] = 3
+
+    # Whole blocks per window so no output block is written twice
+    window_size = max(1, math.ceil(window_size / settings.COG_BLOCK_SIZE)) * settings.COG_BLOCK_SIZE
+    windows = iter_windows(profile['width'], profile['height'], window_size)
+    path = Path(target)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".part")
+    parts: List[Dict[str, Any]] = []
+    with rasterio.open(partial, 'w', **profile) as dst:
+        pending = set()
+        queued = iter(windows)
+        while True:
+            for window in queued:
+                pending.add(executor.submit(compute_block, source, band_a, band_b, window))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                dst.write(result.pop('data'), 1, window=Window(*result['window']))
+                parts.append(result)
+        factors = []
+        while max(profile['width'], profile['height']) / 2 ** (len(factors) + 1) >= settings.COG_BLOCK_SIZE / 2:
+            factors.append(2 ** (len(factors) + 1))
+        if factors:
+            dst.build_overviews(factors, Resampling.average)
+        dst.update_tags(1, INDEX=name.upper())
+    partial.replace(path)
+    return summarize(parts)
+
+
+class IndexService:
+    """
+    Computes vegetation index rasters for completed tasks and caches them
+
+    Indices are built on first request from the task's orthophoto GeoTIFF into
+    the task's indices directory, with summary statistics recorded in the task
+    manifest. A cached index is rebuilt only when the orthophoto changes.
+    """
+
+    def __init__(self, storage: Optional[FileStorageService] = None, max_workers: Optional[int] = None):
+        self.storage = storage or file_storage_service
+        self.max_workers = max_workers or settings.INDEX_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._builds: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @property
+    def available(self) -> bool:
+        return rasterio is not None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def index_path(self, task_id: str, name: str) -> Path:
+        return self.storage.results_dir / task_id / INDEX_DIR / f"{name}.tif"
+
+    def _is_current(self, task_id: str, name: str, source: Path) -> Optional[Dict[str, Any]]:
+        manifest = self.storage.read_manifest(task_id) or {}
+        metadata = (manifest.get('indices') or {}).get(name)
+        if not metadata or not self.index_path(task_id, name).exists():
+            return None
+        stat = source.stat()
+        if metadata.get('source_size') != stat.st_size or metadata.get('source_mtime') != stat.st_mtime:
+            return None
+        return metadata
+
+    async def ensure_index(self, task_id: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Return an index's metadata and statistics, computing the raster if needed
+
+        Concurrent callers for the same task and index share one build.
+
+        Returns:
+            Metadata dictionary, or None if the index is unknown or the task has no orthophoto GeoTIFF
+        Raises:
+            RasterUnavailableError: rasterio is not installed
+            IndexUnavailableError: The orthophoto lacks the bands the index needs
+        """
+        if name not in INDICES:
+            return None
+        source = self.storage.get_raster_path(task_id, 'orthophoto')
+        if not source:
+            return None
+        if not self.available:
+            raise RasterUnavailableError("Vegetation indices need the optional 'geo' extra (rasterio)")
+        metadata = self._is_current(task_id, name, source)
+        if metadata:
+            return metadata
+
+        key = (task_id, name)
+        build = self._builds.get(key)
+        if build is None:
+            build = asyncio.create_task(self._build(task_id, name, source))
+            self._builds[key] = build
+            build.add_done_callback(lambda _: self._builds.pop(key, None))
+        return await asyncio.shield(build)
+
+    async def _build(self, task_id: str, name: str, source: Path) -> Dict[str, Any]:
+        target = self.index_path(task_id, name)
+        stat = source.stat()
+        stats = await asyncio.to_thread(
+            build_index,
+            str(source),
+            str(target),
+            name,
+            band_numbers(),
+            settings.INDEX_WINDOW_SIZE,
+            self.pool,
+            self.max_workers * 2,
+        )
+        metadata = {
+            **stats,
+            'bytes': target.stat().st_size,
+            'source_size': stat.st_size,
+            'source_mtime': stat.st_mtime,
+        }
+        manifest = self.storage.read_manifest(task_id) or {}
+        self.storage.update_manifest(task_id, {'indices': {**(manifest.get('indices') or {}), name: metadata}})
+        LOGGER.info(f"Computed {name.upper()} for task {task_id} (mean {stats['mean']})")
+        return metadata
+
+    async def ensure_indices(self, task_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Compute every known index for a task; None if the task has no orthophoto GeoTIFF"""
+        indices: Dict[str, Dict[str, Any]] = {}
+        for name in INDICES:
+            metadata = await self.ensure_index(task_id, name)
+            if metadata is None:
+                return None
+            indices[name] = metadata
+        return indices
+
+
+# Create service instance
+index_service = IndexService()
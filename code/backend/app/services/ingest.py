@@ -0,0 +1,156 @@
+"""
+Streaming ingest service for uploaded drone imagery
+"""
+
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiofiles
+from fastapi import UploadFile
+
+from ..core.config import settings
+from .blob_store import BlobStore, blob_store
+from .metrics import UPLOAD_BYTES, UPLOAD_FILE_DURATION
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload grows past MAX_FILE_SIZE while it is being copied"""
+
+    def __init__(self, filename: str, limit: int):
+        self.filename = filename
+        self.limit = limit
+        super().__init__(f"File {filename} exceeds maximum size of {limit // (1024 * 1024)}MB")
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when an upload does not match the checksum the client declared for it"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        super().__init__(f"File {filename} does not match its declared sha256")
+
+
+class IngestService:
+    """Copies uploaded files into the blob store in bounded chunks, hashing them on the way through"""
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        max_file_size: Optional[int] = None,
+        store: Optional[BlobStore] = None,
+    ):
+        self.chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+        self.max_file_size = max_file_size or settings.MAX_FILE_SIZE
+        self.store = store or blob_store
+
+    async def _read_chunks(self, upload: UploadFile):
+        size = 0
+        while True:
+            chunk = await upload.read(self.chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_file_size:
+                raise FileTooLargeError(upload.filename, self.max_file_size)
+            UPLOAD_BYTES.inc(len(chunk))
+            yield chunk
+
+    async def save_upload(
+        self,
+        upload: UploadFile,
+        destination: Path,
+        task_id: Optional[str] = None,
+        expected_sha256: Optional[str] = None,
+    ) -> Dict[str, object]:
+        """
+        Stream an UploadFile into the blob store and link it at destination
+
+        Content already in the store is not written again. When the client
+        declares a checksum the store already holds, the body is only hashed
+        to verify it and nothing is written to disk at all.
+
+        Args:
+            upload: Incoming multipart file
+            destination: Final path of the stored file
+            task_id: Task holding the reference (defaults to the destination directory name)
+            expected_sha256: Optional checksum declared by the client
+
+        Returns:
+            Dictionary with the stored file name, path, size, sha256 digest and
+            whether the content was already stored
+        """
+        # Reject early when the multipart parser already knows the size
+        if upload.size is not None and upload.size > self.max_file_size:
+            raise FileTooLargeError(upload.filename, self.max_file_size)
+
+        started = time.perf_counter()
+        task_id = task_id or destination.parent.name
+        expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        try:
+            deduplicated = False
+            if expected_sha256 and self.store.has(expected_sha256):
+                size, digest = 0, hashlib.sha256()
+                async for chunk in self._read_chunks(upload):
+                    size += len(chunk)
+                    digest.update(chunk)
+                if digest.hexdigest() != expected_sha256:
+                    raise ChecksumMismatchError(upload.filename)
+                deduplicated = self.store.link(expected_sha256, destination, task_id)
+                if not deduplicated:
+                    # The blob was collected while the body was hashed; read it again into the store
+                    LOGGER.info(f"Blob {expected_sha256} was collected during upload of {upload.filename}, storing it again")
+                    await upload.seek(0)
+            if not deduplicated:
+                size, digest = 0, hashlib.sha256()
+                staged = self.store.staging_path()
+                try:
+                    async with aiofiles.open(staged, 'wb') as f:
+                        async for chunk in self._read_chunks(upload):
+                            size += len(chunk)
+                            digest.update(chunk)
+                            await f.write(chunk)
+                    if expected_sha256 and digest.hexdigest() != expected_sha256:
+                        raise ChecksumMismatchError(upload.filename)
+                    deduplicated = not self.store.add(staged, digest.hexdigest(), size, destination, task_id)
+                except BaseException:
+                    staged.unlink(missing_ok=True)
+                    raise
+        finally:
+            await upload.close()
+
+        sha256 = digest.hexdigest()
+        UPLOAD_FILE_DURATION.observe(time.perf_counter() - started)
+        return {
+            'name': destination.name,
+            'path': str(destination),
+            'size': size,
+            'sha256': sha256,
+            'deduplicated': deduplicated,
+        }
+
+
+    def save_staged(self, staged: Path, sha256: str, size: int, destination: Path, task_id: Optional[str] = None) -> Dict[str, object]:
+        """
+        Move an already hashed file from the blob store's staging directory into the store and link it at destination
+
+        Returns:
+            Same fields as save_upload
+        """
+        deduplicated = not self.store.add(staged, sha256, size, destination, task_id or destination.parent.name)
+        UPLOAD_BYTES.inc(size)
+        return {
+            'name': destination.name,
+            'path': str(destination),
+            'size': size,
+            'sha256': sha256,
+            'deduplicated': deduplicated,
+        }
+
+
+# Create service instance
+ingest_service = IngestService()
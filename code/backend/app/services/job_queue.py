@@ -0,0 +1,319 @@
+"""
+Durable SQLite job queue for post-processing that runs outside the API process
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from ..core.config import settings
+
+LOGGER = logging.getLogger(__name__)
+
+JOBS_FILENAME = "jobs.db"
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'canceled')
+# Retry delays double per attempt up to this many seconds
+MAX_RETRY_DELAY = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    task_id TEXT,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, priority DESC, run_after, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_task_id ON jobs (task_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at);
+-- One queued or running job per task and type, so repeated enqueues are no-ops
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs (type, task_id)
+    WHERE status IN ('queued', 'running') AND task_id IS NOT NULL;
+"""
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before the next attempt of a job that failed attempts times"""
+    return min(settings.JOB_RETRY_DELAY * (2 ** max(attempts - 1, 0)), MAX_RETRY_DELAY)
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(value).isoformat() if value is not None else None
+
+
+class JobQueue:
+    """
+    Jobs shared by the API, which enqueues them, and worker processes, which run them
+
+    A worker claims the most urgent ready job of the types it has room for
+    and holds it under a lease it renews while the job runs. Jobs whose
+    worker died are claimed again once their lease expires; failed jobs are
+    retried with exponential backoff until they run out of attempts.
+    """
+
+    _instances: Dict[Path, "JobQueue"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    @classmethod
+    def for_directory(cls, results_dir: Path) -> "JobQueue":
+        """Return the shared queue kept in a results directory"""
+        key = (Path(results_dir) / JOBS_FILENAME).resolve()
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(key)
+            return cls._instances[key]
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        task_id: Optional[str] = None,
+        priority: int = 0,
+        max_attempts: Optional[int] = None,
+    ) -> int:
+        """
+        Add a job, or return the ID of the queued or running job of the same type for task_id
+
+        Higher priorities run first; jobs of equal priority run oldest first.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT OR IGNORE INTO jobs
+                    (type, task_id, payload, priority, status, max_attempts, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)
+                """,
+                (
+                    job_type, task_id, json.dumps(payload), priority,
+                    max_attempts or settings.JOB_MAX_ATTEMPTS, now, now, now,
+                ),
+            )
+            self._conn.commit()
+            if cursor.rowcount == 1:
+                LOGGER.info(f"Queued {job_type} job {cursor.lastrowid} for task {task_id}")
+                return cursor.lastrowid
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE type = ? AND task_id = ? AND status IN ('queued', 'running')",
+                (job_type, task_id),
+            ).fetchone()
+        return row['id']
+
+    def claim(self, owner: str, job_types: Sequence[str], ttl: float) -> Optional[Dict[str, Any]]:
+        """
+        Take the most urgent ready job of one of job_types
+
+        Ready jobs are queued ones past their retry delay and running ones
+        whose worker stopped renewing the lease.
+        """
+        if not job_types:
+            return None
+        now = time.time()
+        placeholders = ', '.join('?' for _ in job_types)
+        with self._lock:
+            # Take the write lock before choosing, so two workers can never claim the same job
+            # (UPDATE ... RETURNING would do this in one statement but needs SQLite 3.35)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"""
+                    SELECT id FROM jobs
+                    WHERE type IN ({placeholders})
+                        AND ((status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_expires < ?))
+                    ORDER BY priority DESC, run_after, id
+                    LIMIT 1
+                    """,
+                    [*job_types, now, now],
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        """
+                        UPDATE jobs SET status = 'running', owner = ?, lease_expires = ?,
+                            attempts = attempts + 1, updated_at = ?
+                        WHERE id = ?
+                        """,
+                        (owner, now + ttl, now, row['id']),
+                    )
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return self._job(row) if row else None
+
+    def renew(self, owner: str, ttl: float) -> int:
+        """Extend the leases of every job owner is running; returns how many it still holds"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = 'running'", (now + ttl, owner)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def complete(self, job_id: int, owner: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = 'succeeded', owner = NULL, lease_expires = NULL, error = NULL,
+                    updated_at = ?, finished_at = ?
+                WHERE id = ? AND owner = ? AND status = 'running'
+                """,
+                (now, now, job_id, owner),
+            )
+            self._conn.commit()
+
+    def fail(self, job_id: int, owner: str, error: str, retry: bool = True) -> Optional[str]:
+        """
+        Record a failed attempt, queueing the job again unless it is out of attempts or retry is False
+
+        Returns:
+            The job's new status ('queued' or 'failed'), or None if owner no longer held it
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND owner = ? AND status = 'running'",
+                (job_id, owner),
+            ).fetchone()
+            if row is None:
+                return None
+            if retry and row['attempts'] < row['max_attempts']:
+                status, run_after, finished_at = 'queued', now + retry_delay(row['attempts']), None
+            else:
+                status, run_after, finished_at = 'failed', now, now
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, run_after = ?, finished_at = ?, error = ?,
+                    owner = NULL, lease_expires = NULL, updated_at = ?
+                WHERE id = ? AND owner = ?
+                """,
+                (status, run_after, finished_at, error, now, job_id, owner),
+            )
+            self._conn.commit()
+        return status
+
+    def requeue(self, owner: str) -> int:
+        """Hand the running jobs of a stopping worker back to the queue without counting the interrupted attempt"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), run_after = ?,
+                    owner = NULL, lease_expires = NULL, updated_at = ?
+                WHERE owner = ? AND status = 'running'
+                """,
+                (now, now, owner),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def cancel_task(self, task_id: str) -> int:
+        """Cancel the queued and running jobs of a task, e.g. because it is being deleted"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                UPDATE jobs SET status = 'canceled', owner = NULL, lease_expires = NULL, updated_at = ?, finished_at = ?
+                WHERE task_id = ? AND status IN ('queued', 'running')
+                """,
+                (now, now, task_id),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def is_active(self, job_type: str, task_id: str) -> bool:
+        """Whether a job of job_type for task_id is queued or running, i.e. was not canceled or finished"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE type = ? AND task_id = ? AND status IN ('queued', 'running')", (job_type, task_id)
+            ).fetchone()
+        return row is not None
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        job_type: Optional[str] = None,
+        task_id: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Most recent jobs first, optionally filtered"""
+        clauses, params = [], []
+        for column, value in (('status', status), ('type', job_type), ('task_id', task_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ?", [*params, limit]
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Job counts by type and status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT type, status, COUNT(*) AS n FROM jobs GROUP BY type, status").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row['type'], {})[row['status']] = row['n']
+        return counts
+
+    def active_count(self, job_type: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS n FROM jobs WHERE type = ? AND status IN ('queued', 'running')", (job_type,)
+            ).fetchone()
+        return row['n']
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs that ended more than older_than seconds ago"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - older_than,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        for field in ('run_after', 'lease_expires', 'created_at', 'updated_at', 'finished_at'):
+            job[field] = _timestamp(job[field])
+        return job
+
@@ -0,0 +1,168 @@
+"""
+Worker that runs jobs from the durable job queue with per-type concurrency limits
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from ..core.config import settings
+from .job_queue import JobQueue
+from .task_store import WORKER_ID
+from .task_supervisor import task_supervisor
+from .tiles import tile_service
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between purges of old finished jobs
+PURGE_INTERVAL = 3600.0
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler for failures that retrying cannot fix"""
+
+
+class JobHandler(NamedTuple):
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    # Called with the payload and error once a job has failed for good
+    on_failure: Optional[Callable[[Dict[str, Any], str], Any]] = None
+    # Jobs of the type one worker runs at once unless JOB_CONCURRENCY overrides it
+    concurrency: int = 1
+
+
+class JobWorker:
+    """
+    Claims and runs queued jobs
+
+    Each job type runs at most its concurrency limit of jobs at once, and the
+    most urgent ready job of a type with room is claimed first. Leases of running jobs are renewed while they run, so a
+    job whose worker dies is picked up by another worker after JOB_LEASE_TTL.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, worker_id: Optional[str] = None):
+        self._queue = queue
+        # Unique per worker instance so an API process and a worker process never share leases
+        self.worker_id = worker_id or f"{WORKER_ID}:jobs:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, JobHandler] = {}
+        self._running: Dict[int, asyncio.Task] = {}
+        self._running_types: Dict[int, str] = {}
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def queue(self) -> JobQueue:
+        """The queue in RESULTS_DIR, opened on first use rather than at import"""
+        if self._queue is None:
+            self._queue = JobQueue.for_directory(Path(settings.RESULTS_DIR))
+        return self._queue
+
+    def register(
+        self,
+        job_type: str,
+        run: Callable[[Dict[str, Any]], Awaitable[Any]],
+        on_failure: Optional[Callable[[Dict[str, Any], str], Any]] = None,
+        concurrency: int = 1,
+    ) -> None:
+        self.handlers[job_type] = JobHandler(run, on_failure, concurrency)
+
+    def limit(self, job_type: str) -> int:
+        return settings.JOB_CONCURRENCY.get(job_type, self.handlers[job_type].concurrency)
+
+    def _free_types(self) -> List[str]:
+        running: Dict[str, int] = {}
+        for job_type in self._running_types.values():
+            running[job_type] = running.get(job_type, 0) + 1
+        return [job_type for job_type in self.handlers if running.get(job_type, 0) < self.limit(job_type)]
+
+    def fill(self) -> int:
+        """Claim ready jobs until every type is at its limit or nothing is ready; returns how many started"""
+        started = 0
+        while True:
+            job = self.queue.claim(self.worker_id, self._free_types(), settings.JOB_LEASE_TTL)
+            if job is None:
+                return started
+            task = asyncio.create_task(self._execute(job))
+            self._running[job['id']] = task
+            self._running_types[job['id']] = job['type']
+            task.add_done_callback(lambda _, job_id=job['id']: self._done(job_id))
+            started += 1
+
+    def _done(self, job_id: int) -> None:
+        self._running.pop(job_id, None)
+        self._running_types.pop(job_id, None)
+        self._wakeup.set()
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        handler = self.handlers[job['type']]
+        LOGGER.info(f"Running {job['type']} job {job['id']} (attempt {job['attempts']}/{job['max_attempts']})")
+        try:
+            await handler.run(job['payload'])
+        except asyncio.CancelledError:
+            # Stopping; the lease lapses and another worker runs the job again
+            raise
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError)
+            status = self.queue.fail(job['id'], self.worker_id, str(e), retry=retry)
+            if status == 'failed':
+                LOGGER.error(f"{job['type']} job {job['id']} failed for good: {e}")
+                if handler.on_failure is not None:
+                    try:
+                        result = handler.on_failure(job['payload'], str(e))
+                        if asyncio.iscoroutine(result):
+                            await result
+                    except Exception as hook_error:
+                        LOGGER.exception(f"Failure handling of job {job['id']} failed: {hook_error}")
+            else:
+                LOGGER.warning(f"{job['type']} job {job['id']} failed, will retry: {e}")
+            return
+        self.queue.complete(job['id'], self.worker_id)
+        LOGGER.info(f"{job['type']} job {job['id']} succeeded")
+
+    async def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        tasks = [t for t in [self._runner, *self._running.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+        # Let other workers pick the interrupted jobs up right away
+        self.queue.requeue(self.worker_id)
+
+    async def _run(self) -> None:
+        renew_interval = settings.JOB_LEASE_TTL / 3
+        next_renew = next_purge = 0.0
+        while True:
+            now = time.monotonic()
+            try:
+                if now >= next_renew:
+                    next_renew = now + renew_interval
+                    if self._running:
+                        self.queue.renew(self.worker_id, settings.JOB_LEASE_TTL)
+                if now >= next_purge:
+                    next_purge = now + PURGE_INTERVAL
+                    purged = self.queue.purge(settings.JOB_HISTORY_DAYS * 86400)
+                    if purged:
+                        LOGGER.info(f"Purged {purged} finished jobs")
+                self.fill()
+            except Exception as e:
+                LOGGER.exception(f"Job worker iteration failed: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(settings.JOB_POLL_INTERVAL, renew_interval))
+            except asyncio.TimeoutError:
+                pass
+
+
+# Create service instance with the application's job types
+job_worker = JobWorker()
+job_worker.register(
+    'download', task_supervisor.run_download, task_supervisor.fail_download,
+    concurrency=settings.SUPERVISOR_MAX_DOWNLOADS,
+)
+job_worker.register('tiles', lambda payload: tile_service.prerender(payload['task_id']))
@@ -0,0 +1,354 @@
+"""
+In-process metrics registry rendered in the Prometheus text exposition format
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..core.config import settings
+from .task_store import WORKER_ID, TaskStore
+
+LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds in seconds for request and call latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bucket upper bounds in seconds for long transfers
+TRANSFER_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+# Bucket upper bounds in bytes for transfer sizes
+SIZE_BUCKETS = tuple(float(2 ** exponent) for exponent in range(20, 36, 2))
+
+LabelValues = Tuple[str, ...]
+# Series exported by another process: label values and the value (or histogram bucket counts, sum and count)
+SharedSeries = Sequence[Tuple[Sequence[str], Any]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """Base class for a named metric family with optional labels"""
+
+    kind = 'untyped'
+    # Whether series of other processes add up with this one's in a scrape
+    shared = False
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self, shared: SharedSeries = ()) -> List[str]:
+        raise NotImplementedError
+
+    def export(self) -> List[Tuple[LabelValues, Any]]:
+        """Series of this process in a JSON-serializable form"""
+        raise NotImplementedError
+
+    def render(self, shared: SharedSeries = ()) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples(shared))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+
+    kind = 'counter'
+    shared = True
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def export(self) -> List[Tuple[LabelValues, float]]:
+        with self._lock:
+            return sorted(self._values.items())
+
+    def samples(self, shared: SharedSeries = ()) -> List[str]:
+        values = dict(self.export())
+        for key, value in shared:
+            key = tuple(key)
+            values[key] = values.get(key, 0.0) + value
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down
+
+    A gauge may instead be backed by a callback evaluated at scrape time,
+    returning either a number or a mapping of label values to numbers.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback: Optional[Callable[[], object]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def set_function(self, callback: Callable[[], object]) -> None:
+        self._callback = callback
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self, shared: SharedSeries = ()) -> List[str]:
+        # Gauges describe the process answering the scrape; other processes' values are not merged
+        if self._callback is not None:
+            try:
+                result = self._callback()
+            except Exception as e:
+                LOGGER.warning(f"Metric callback for {self.name} failed: {e}")
+                return []
+            items = sorted(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets with a running sum and count"""
+
+    kind = 'histogram'
+    shared = True
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Per-bucket counts followed by the +Inf bucket, sum and count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 3))
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: str) -> float:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def export(self) -> List[Tuple[LabelValues, List[float]]]:
+        with self._lock:
+            return sorted((key, list(series)) for key, series in self._series.items())
+
+    def samples(self, shared: SharedSeries = ()) -> List[str]:
+        merged = dict(self.export())
+        for key, series in shared:
+            key = tuple(key)
+            if len(series) != len(self.buckets) + 3:
+                # Published with other bucket bounds
+                continue
+            own = merged.get(key)
+            merged[key] = [a + b for a, b in zip(own, series)] if own else list(series)
+        lines = []
+        for key, series in sorted(merged.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, math.inf), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, List[Tuple[LabelValues, Any]]]:
+        """Counter and histogram series of this process, for merging into another process's scrape"""
+        return {name: metric.export() for name, metric in self._metrics.items() if metric.shared}
+
+    def render(self, snapshots: Sequence[Dict[str, SharedSeries]] = ()) -> str:
+        """Text exposition of every family, adding in the counters and histograms of snapshots"""
+        return '\n'.join(
+            metric.render([series for snapshot in snapshots for series in snapshot.get(name, ())])
+            for name, metric in self._metrics.items()
+        ) + '\n'
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed sleep"""
+
+    def __init__(self, gauge: Gauge, histogram: Histogram, interval: Optional[float] = None):
+        self.gauge = gauge
+        self.histogram = histogram
+        self.interval = interval or settings.METRICS_LOOP_LAG_INTERVAL
+        self._runner: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.gauge.set(lag)
+            self.histogram.observe(lag)
+
+    async def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+
+class MetricsPublisher:
+    """
+    Shares this process's counters and histograms through the task store
+
+    Job workers have no /metrics endpoint and a scrape reaches a single API
+    worker, so every process publishes a snapshot every
+    METRICS_PUBLISH_INTERVAL and /metrics adds the other processes' ones to
+    its own. Snapshots of processes that stopped publishing are dropped after
+    METRICS_SNAPSHOT_MAX_AGE, which scrapers see as a counter reset.
+    """
+
+    def __init__(self, registry: MetricsRegistry, store: Optional[TaskStore] = None, owner: str = WORKER_ID, interval: Optional[float] = None):
+        self.registry = registry
+        self._store = store
+        self.owner = owner
+        self.interval = interval or settings.METRICS_PUBLISH_INTERVAL
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def store(self) -> TaskStore:
+        if self._store is None:
+            self._store = TaskStore.for_directory(Path(settings.RESULTS_DIR))
+        return self._store
+
+    def publish(self) -> None:
+        self.store.publish_metrics(self.owner, self.registry.snapshot())
+
+    def shared(self) -> List[Dict[str, Any]]:
+        """Snapshots published by the other processes"""
+        return self.store.metric_snapshots(exclude=self.owner, max_age=settings.METRICS_SNAPSHOT_MAX_AGE)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.publish)
+            except Exception as e:
+                LOGGER.warning(f"Failed to publish metrics: {e}")
+
+    async def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+            # Leave the final counts for the processes still scraped
+            try:
+                await asyncio.to_thread(self.publish)
+            except Exception as e:
+                LOGGER.warning(f"Failed to publish metrics: {e}")
+
+
+# Create registry instance and the application's metric families
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time to serve an HTTP request by route template",
+    ("method", "route", "status"),
+)
+UPLOAD_BYTES = registry.counter("upload_bytes_total", "Bytes of uploaded imagery received")
+UPLOAD_FILE_DURATION = registry.histogram("upload_file_ingest_seconds", "Time to ingest one uploaded file")
+NODEODM_REQUEST_DURATION = registry.histogram(
+    "nodeodm_request_duration_seconds", "Latency of NodeODM API calls", ("method", "endpoint"),
+)
+NODEODM_ERRORS = registry.counter(
+    "nodeodm_errors_total", "Failed NodeODM API calls", ("endpoint", "kind"),
+)
+TASKS_IN_FLIGHT = registry.gauge(
+    "tasks_in_flight", "Tasks tracked by the supervisor by last known status", ("status",),
+)
+DOWNLOAD_DURATION = registry.histogram(
+    "asset_download_seconds", "Time to stream and extract a task archive", buckets=TRANSFER_BUCKETS,
+)
+DOWNLOAD_BYTES = registry.histogram(
+    "asset_download_bytes", "Size of streamed task archives", buckets=SIZE_BUCKETS,
+)
+NODE_UP = registry.gauge("nodeodm_node_up", "Whether a pooled NodeODM node answered its last probe", ("node",))
+NODE_QUEUE = registry.gauge("nodeodm_node_queue", "Queued and running tasks last reported by a NodeODM node", ("node",))
+STATUS_CACHE_LOOKUPS = registry.counter(
+    "status_cache_lookups_total", "Task status lookups by outcome (hit, miss or coalesced)", ("result",),
+)
+EVENT_LOOP_LAG = registry.gauge("event_loop_lag_seconds", "Most recent event loop wake-up delay")
+EVENT_LOOP_LAG_HISTOGRAM = registry.histogram("event_loop_lag_distribution_seconds", "Event loop wake-up delays")
+
+loop_lag_monitor = LoopLagMonitor(EVENT_LOOP_LAG, EVENT_LOOP_LAG_HISTOGRAM)
+metrics_publisher = MetricsPublisher(registry)
@@ -0,0 +1,213 @@
+"""
+Pool of NodeODM processing nodes with queue-aware dispatch and failover
+"""
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from pyodm.types import NodeInfo
+
+from ..core.config import settings
+from .metrics import NODE_QUEUE, NODE_UP
+from .nodeodm_client import (
+    NodeODMClient, NodeODMError, NodeODMTaskNotFoundError, NodeODMUnavailableError, nodeodm_client,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PooledNode:
+    """One NodeODM node and what it last reported about itself"""
+
+    def __init__(self, url: str, client: NodeODMClient):
+        self.url = url
+        self.client = client
+        self.info: Optional[NodeInfo] = None
+        self.healthy = True
+        self.last_probe: Optional[float] = None
+        self.failures = 0
+
+    @property
+    def load(self) -> float:
+        """Queued and running tasks per parallel processing slot"""
+        if self.info is None:
+            return float('inf')
+        return (self.info.task_queue_count or 0) / max(self.info.max_parallel_tasks or 1, 1)
+
+    def accepts(self, image_count: int) -> bool:
+        max_images = self.info.max_images if self.info else None
+        return not max_images or image_count <= max_images
+
+
+class NodePool:
+    """
+    Dispatches new tasks to the least loaded healthy node and remembers where each task lives
+
+    Nodes are probed through /info at most every NODEODM_PROBE_INTERVAL seconds
+    when a dispatch needs fresh numbers. A node that cannot be reached is skipped
+    and re-probed on a later dispatch once its probe interval has passed.
+    """
+
+    def __init__(self, urls: Optional[List[str]] = None, clients: Optional[Dict[str, NodeODMClient]] = None):
+        if clients is None:
+            urls = urls or settings.NODEODM_URLS or [settings.NODEODM_URL]
+            clients = {url.rstrip('/'): self._make_client(url) for url in urls}
+        self.nodes: Dict[str, PooledNode] = {url: PooledNode(url, client) for url, client in clients.items()}
+        self.default_url = next(iter(self.nodes))
+        self.probe_interval = settings.NODEODM_PROBE_INTERVAL
+        # NodeODM task UUID -> node URL for tasks created or located by this process
+        self._locations: Dict[str, str] = {}
+
+    @staticmethod
+    def _make_client(url: str) -> NodeODMClient:
+        # Reuse the shared client for the configured default node
+        if url.rstrip('/') == nodeodm_client.base_url:
+            return nodeodm_client
+        return NodeODMClient(base_url=url)
+
+    def client_for(self, node_url: Optional[str] = None) -> NodeODMClient:
+        """Client of the node a task is pinned to (the default node for older tasks)"""
+        node = self.nodes.get((node_url or self.default_url).rstrip('/'))
+        if node is None:
+            # The node was removed from configuration; keep talking to it for its existing tasks
+            node = PooledNode(node_url.rstrip('/'), NodeODMClient(base_url=node_url))
+            self.nodes[node.url] = node
+        return node.client
+
+    def pin(self, nodeodm_task_id: str, node_url: Optional[str]) -> None:
+        self._locations[nodeodm_task_id] = (node_url or self.default_url).rstrip('/')
+
+    async def probe(self, node: PooledNode) -> bool:
+        """Refresh a node's /info and health"""
+        node.last_probe = time.monotonic()
+        try:
+            node.info = await node.client.info()
+        except NodeODMError as e:
+            node.failures += 1
+            if node.healthy:
+                LOGGER.warning(f"NodeODM node {node.url} is unhealthy: {e}")
+            node.healthy = False
+            return False
+        if not node.healthy:
+            LOGGER.info(f"NodeODM node {node.url} is healthy again")
+        node.healthy = True
+        node.failures = 0
+        return True
+
+    async def probe_all(self, stale_only: bool = False) -> None:
+        now = time.monotonic()
+        nodes = [
+            node for node in self.nodes.values()
+            if not stale_only or node.last_probe is None or now - node.last_probe >= self.probe_interval
+        ]
+        await asyncio.gather(*(self.probe(node) for node in nodes))
+
+    async def candidates(self, image_count: int = 0) -> List[PooledNode]:
+        """Healthy nodes able to take image_count images, least loaded first"""
+        await self.probe_all(stale_only=True)
+        nodes = [node for node in self.nodes.values() if node.healthy and node.accepts(image_count)]
+        return sorted(nodes, key=lambda node: node.load)
+
+    async def create_task(
+        self,
+        files: List[Union[str, Path]],
+        options: Optional[Dict[str, Any]] = None,
+        name: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """
+        Create a task on the least loaded healthy node, failing over to the next one
+
+        Returns:
+            URL of the node the task is pinned to and its NodeODM task UUID
+        """
+        return await self._dispatch(
+            lambda client: client.create_task(files, options=options, name=name),
+            image_count=len(files),
+        )
+
+    async def init_task(self, options: Optional[Dict[str, Any]] = None, name: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Open a task for the init/upload/commit flow on the least loaded healthy node
+
+        Returns:
+            URL of the node the task is pinned to and its NodeODM task UUID
+        """
+        return await self._dispatch(lambda client: client.init_task(options, name))
+
+    async def _dispatch(self, operation: Callable[[NodeODMClient], Awaitable[str]], image_count: int = 0) -> Tuple[str, str]:
+        for node in await self.candidates(image_count):
+            try:
+                uuid = await operation(node.client)
+            except NodeODMUnavailableError as e:
+                LOGGER.warning(f"Dispatch to NodeODM node {node.url} failed, trying the next node: {e}")
+                node.healthy = False
+                node.last_probe = time.monotonic()
+                continue
+            if node.info is not None and node.info.task_queue_count is not None:
+                # Count the new task until the next probe reports it
+                node.info.task_queue_count += 1
+            self.pin(uuid, node.url)
+            LOGGER.info(f"Dispatched task {uuid} to NodeODM node {node.url}")
+            return node.url, uuid
+        raise NodeODMUnavailableError("No NodeODM node is available to take the task")
+
+    async def locate(self, nodeodm_task_id: str) -> NodeODMClient:
+        """
+        Find the client of the node holding a task
+
+        Tasks this process created or restored are looked up directly; others
+        are found by asking every healthy node for the task's info. Raises
+        NodeODMTaskNotFoundError only when every node asked answered that it
+        does not know the task, and NodeODMUnavailableError when a node that
+        might hold it could not be asked.
+        """
+        node_url = self._locations.get(nodeodm_task_id)
+        if node_url:
+            return self.client_for(node_url)
+
+        nodes = [node for node in self.nodes.values() if node.healthy] or list(self.nodes.values())
+
+        async def holds(node: PooledNode) -> Optional[bool]:
+            """Whether node holds the task, or None if it could not tell"""
+            try:
+                await node.client.task_info(nodeodm_task_id)
+                return True
+            except NodeODMTaskNotFoundError:
+                return False
+            except NodeODMError as e:
+                LOGGER.warning(f"Could not look up task {nodeodm_task_id} on {node.url}: {e}")
+                return None
+
+        answers = await asyncio.gather(*(holds(node) for node in nodes))
+        for node, found in zip(nodes, answers):
+            if found:
+                self.pin(nodeodm_task_id, node.url)
+                return node.client
+        if None in answers:
+            raise NodeODMUnavailableError(f"Task {nodeodm_task_id} may be on a NodeODM node that is not answering")
+        raise NodeODMTaskNotFoundError(f"Task {nodeodm_task_id} was not found on any NodeODM node")
+
+    def node_status(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                'url': node.url,
+                'healthy': node.healthy,
+                'queue': node.info.task_queue_count if node.info else None,
+                'maxParallelTasks': node.info.max_parallel_tasks if node.info else None,
+            }
+            for node in self.nodes.values()
+        ]
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(node.client.aclose() for node in self.nodes.values()))
+
+
+# Create pool instance
+node_pool = NodePool()
+NODE_UP.set_function(lambda: {(node.url,): int(node.healthy) for node in node_pool.nodes.values()})
+NODE_QUEUE.set_function(lambda: {
+    (node.url,): node.info.task_queue_count or 0 for node in node_pool.nodes.values() if node.info
+})
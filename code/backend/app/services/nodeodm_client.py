@@ -0,0 +1,270 @@
+"""
+Async NodeODM API client built on a pooled httpx connection set
+"""
+
+import asyncio
+import json
+import logging
+import mimetypes
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import aiofiles
+import httpx
+from pyodm.types import NodeInfo, TaskInfo
+
+from ..core.config import settings
+from .metrics import NODEODM_ERRORS, NODEODM_REQUEST_DURATION
+
+LOGGER = logging.getLogger(__name__)
+
+UUID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+# Error payloads NodeODM answers with for task UUIDs it does not know, e.g. "<uuid> not found"
+NOT_FOUND_PATTERN = re.compile(r'not found|invalid uuid', re.IGNORECASE)
+
+
+class NodeODMError(Exception):
+    """Raised when NodeODM rejects a request or answers with an error payload"""
+
+
+class NodeODMUnavailableError(NodeODMError):
+    """Raised when NodeODM cannot be reached at all"""
+
+
+class NodeODMTaskNotFoundError(NodeODMError):
+    """Raised when NodeODM answers that it does not know a task"""
+
+
+def options_to_json(options: Dict[str, Any]) -> str:
+    """Encode a processing options dict the way NodeODM expects it"""
+    return json.dumps([{'name': name, 'value': value} for name, value in options.items()])
+
+
+def endpoint_label(path: str) -> str:
+    """Collapse task UUIDs in a NodeODM path so metrics stay low-cardinality"""
+    return UUID_PATTERN.sub('{uuid}', path)
+
+
+class NodeODMClient:
+    """Async client for the NodeODM REST API sharing one keep-alive connection pool"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        request_timeout: Optional[float] = None,
+        transfer_timeout: Optional[float] = None,
+    ):
+        self.base_url = (base_url or settings.NODEODM_URL).rstrip('/')
+        self.request_timeout = request_timeout or settings.NODEODM_REQUEST_TIMEOUT
+        self.transfer_timeout = transfer_timeout or settings.NODEODM_TIMEOUT
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Lazily create the pooled client so it binds to the running event loop"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.request_timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.NODEODM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.NODEODM_MAX_CONNECTIONS,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def _request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        endpoint = endpoint_label(path)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, timeout=timeout or self.request_timeout, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            NODEODM_ERRORS.inc(endpoint=endpoint, kind='unavailable')
+            raise NodeODMUnavailableError(f"NodeODM server is not reachable at {self.base_url}") from e
+        except httpx.TimeoutException as e:
+            NODEODM_ERRORS.inc(endpoint=endpoint, kind='timeout')
+            raise NodeODMError(f"NodeODM request {method} {path} timed out") from e
+        except httpx.TransportError as e:
+            # Connections reset or closed mid-response, protocol errors and the like
+            NODEODM_ERRORS.inc(endpoint=endpoint, kind='transport')
+            raise NodeODMError(f"NodeODM request {method} {path} failed: {e}") from e
+        finally:
+            NODEODM_REQUEST_DURATION.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
+        if response.status_code >= 400:
+            NODEODM_ERRORS.inc(endpoint=endpoint, kind='http')
+            error = NodeODMTaskNotFoundError if response.status_code == 404 else NodeODMError
+            raise error(f"NodeODM returned HTTP {response.status_code} for {method} {path}: {response.text}")
+        return response
+
+    async def _json(self, method: str, path: str, **kwargs) -> Any:
+        response = await self._request(method, path, **kwargs)
+        data = response.json()
+        if isinstance(data, dict) and 'error' in data:
+            NODEODM_ERRORS.inc(endpoint=endpoint_label(path), kind='error_payload')
+            error = NodeODMTaskNotFoundError if NOT_FOUND_PATTERN.search(str(data['error'])) else NodeODMError
+            raise error(data['error'])
+        return data
+
+    async def info(self) -> NodeInfo:
+        """Get node capacity and queue information"""
+        return NodeInfo(await self._json('GET', '/info'))
+
+    async def task_list(self) -> List[str]:
+        """List the UUIDs of all tasks known to the node"""
+        return [item['uuid'] for item in await self._json('GET', '/task/list')]
+
+    async def task_info(self, uuid: str, timeout: Optional[float] = None) -> TaskInfo:
+        """Get status and progress of a task"""
+        return TaskInfo(await self._json('GET', f'/task/{uuid}/info', timeout=timeout))
+
+    async def init_task(self, options: Optional[Dict[str, Any]] = None, name: Optional[str] = None) -> str:
+        """Open a new task that images can be uploaded to, returning its UUID"""
+        fields = {'options': options_to_json(options or {})}
+        if name:
+            fields['name'] = name
+        data = await self._json('POST', '/task/new/init', data=fields)
+        return data['uuid']
+
+    async def upload_image(
+        self,
+        uuid: str,
+        path: Union[str, Path],
+        filename: Optional[str] = None,
+        mime: Optional[str] = None,
+    ) -> None:
+        """
+        Upload one image from disk to an initialized task
+
+        The file handle is handed to httpx, which streams the multipart body in
+        small chunks with a Content-Length taken from the file size, so an
+        upload never holds the image in memory.
+        """
+        path = Path(path)
+        filename = filename or path.name
+        mime = mime or mimetypes.guess_type(filename)[0] or 'image/jpeg'
+        with path.open('rb') as f:
+            await self._json(
+                'POST',
+                f'/task/new/upload/{uuid}',
+                files={'images': (filename, f, mime)},
+                timeout=self.transfer_timeout,
+            )
+
+    async def upload_image_data(self, uuid: str, filename: str, content: bytes, mime: Optional[str] = None) -> None:
+        """Upload one image already held in memory to an initialized task"""
+        mime = mime or mimetypes.guess_type(filename)[0] or 'image/jpeg'
+        await self._json(
+            'POST',
+            f'/task/new/upload/{uuid}',
+            files={'images': (filename, content, mime)},
+            timeout=self.transfer_timeout,
+        )
+
+    async def commit_task(self, uuid: str) -> None:
+        """Close an initialized task and queue it for processing"""
+        await self._json('POST', f'/task/new/commit/{uuid}')
+
+    async def create_task(
+        self,
+        files: List[Union[str, Path]],
+        options: Optional[Dict[str, Any]] = None,
+        name: Optional[str] = None,
+    ) -> str:
+        """
+        Create a task from images on disk using the init/upload/commit flow
+
+        Args:
+            files: Image paths to upload
+            options: NodeODM processing options
+            name: Optional human friendly task name
+
+        Returns:
+            NodeODM task UUID
+        """
+        if not files:
+            raise NodeODMError("Not enough images")
+
+        uuid = await self.init_task(options, name)
+        semaphore = asyncio.Semaphore(settings.NODEODM_PARALLEL_UPLOADS)
+
+        async def upload(path: Union[str, Path]) -> None:
+            async with semaphore:
+                await self.upload_image(uuid, path)
+
+        try:
+            await asyncio.gather(*(upload(path) for path in files))
+        except BaseException:
+            await self.remove_task(uuid, quiet=True)
+            raise
+        await self.commit_task(uuid)
+        return uuid
+
+    async def cancel_task(self, uuid: str) -> bool:
+        """Cancel a queued or running task"""
+        data = await self._json('POST', '/task/cancel', data={'uuid': uuid})
+        return bool(data.get('success'))
+
+    async def remove_task(self, uuid: str, quiet: bool = False) -> bool:
+        """Remove a task and its assets from the node"""
+        try:
+            data = await self._json('POST', '/task/remove', data={'uuid': uuid})
+        except NodeODMError as e:
+            if not quiet:
+                raise
+            LOGGER.warning(f"Failed to remove NodeODM task {uuid}: {e}")
+            return False
+        return bool(data.get('success'))
+
+    async def iter_asset(self, uuid: str, asset: str = 'all.zip', offset: int = 0) -> AsyncIterator[bytes]:
+        """
+        Stream a task asset in chunks, resuming at offset with an HTTP Range request
+
+        If the node ignores the Range header and sends the whole body again, the
+        first offset bytes are skipped so callers always see a contiguous stream.
+        """
+        headers = {'Range': f'bytes={offset}-'} if offset else None
+        path = f'/task/{uuid}/download/{asset}'
+        try:
+            async with self.client.stream('GET', path, headers=headers, timeout=self.transfer_timeout) as response:
+                if response.status_code == 416 and offset:
+                    # Nothing left past offset, the previous attempt already got everything
+                    return
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise NodeODMError(f"NodeODM returned HTTP {response.status_code} downloading {asset}: {response.text}")
+                skip = offset if response.status_code != 206 else 0
+                # Yield bytes as they arrive so an interruption never loses received data
+                async for chunk in response.aiter_bytes():
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk = chunk[skip:]
+                        skip = 0
+                    yield chunk
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            raise NodeODMUnavailableError(f"NodeODM server is not reachable at {self.base_url}") from e
+        except httpx.TimeoutException as e:
+            raise NodeODMError(f"Download of {asset} for task {uuid} timed out") from e
+        except httpx.TransportError as e:
+            raise NodeODMError(f"Download of {asset} for task {uuid} was interrupted: {e}") from e
+
+    async def download_asset(self, uuid: str, destination: Path, asset: str = 'all.zip') -> Path:
+        """Stream a task asset to destination without buffering it in memory"""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        async with aiofiles.open(destination, 'wb') as f:
+            async for chunk in self.iter_asset(uuid, asset):
+                await f.write(chunk)
+        return destination
+
+
+# Create client instance
+nodeodm_client = NodeODMClient()
@@ -0,0 +1,260 @@
+"""
+Image preprocessing stage that validates, inspects and thins uploads before processing
+"""
+
+import asyncio
+import logging
+import math
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PIL import ExifTags, Image
+
+from ..core.config import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# EXIF tag ids
+TAG_DATETIME_ORIGINAL = 36867
+TAG_FOCAL_LENGTH_35MM = 41989
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE, GPS_ALTITUDE_REF, GPS_ALTITUDE = 1, 2, 3, 4, 5, 6
+
+# Height above take-off recorded by DJI drones in the XMP packet
+RELATIVE_ALTITUDE = re.compile(rb'RelativeAltitude\s*=\s*"([+-]?[0-9.]+)"|<drone-dji:RelativeAltitude>([+-]?[0-9.]+)<')
+XMP_SCAN_BYTES = 256 * 1024
+HASH_SIZE = 8
+EARTH_RADIUS_M = 6371008.8
+
+
+def _rational(value: Any) -> float:
+    if isinstance(value, tuple):
+        return value[0] / value[1] if value[1] else 0.0
+    return float(value)
+
+
+def _degrees(dms: Any, ref: Any) -> float:
+    degrees, minutes, seconds = (_rational(part) for part in dms)
+    value = degrees + minutes / 60 + seconds / 3600
+    ref = ref.decode() if isinstance(ref, bytes) else ref
+    return -value if ref in ('S', 'W') else value
+
+
+def _relative_altitude(path: Path) -> Optional[float]:
+    with open(path, 'rb') as f:
+        match = RELATIVE_ALTITUDE.search(f.read(XMP_SCAN_BYTES))
+    if not match:
+        return None
+    return float(match.group(1) or match.group(2))
+
+
+def difference_hash(image: Image.Image) -> int:
+    """64-bit gradient hash that stays stable across small shifts and exposure changes"""
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return bits
+
+
+def distance_m(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """Great-circle distance between two inspected images' GPS positions"""
+    lat1, lat2 = math.radians(a['latitude']), math.radians(b['latitude'])
+    dlat = lat2 - lat1
+    dlon = math.radians(b['longitude'] - a['longitude'])
+    h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def inspect_image(path: str) -> Dict[str, Any]:
+    """
+    Validate one image and read what preprocessing needs from it
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    result: Dict[str, Any] = {'name': Path(path).name, 'valid': False}
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            result.update({'width': image.width, 'height': image.height, 'format': image.format})
+            exif = image.getexif()
+            # Decode a reduced JPEG scale only; the hash needs a handful of pixels
+            image.draft('L', (HASH_SIZE * 16, HASH_SIZE * 16))
+            result['hash'] = difference_hash(image)
+    except Exception as e:
+        result['error'] = f"Unreadable image: {e}"
+        return result
+    result['valid'] = True
+
+    exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    taken = exif_ifd.get(TAG_DATETIME_ORIGINAL)
+    if taken:
+        try:
+            result['taken_at'] = datetime.strptime(str(taken).strip('\x00'), '%Y:%m:%d %H:%M:%S').isoformat()
+        except ValueError:
+            pass
+    if exif_ifd.get(TAG_FOCAL_LENGTH_35MM):
+        result['focal_length_35mm'] = float(exif_ifd[TAG_FOCAL_LENGTH_35MM])
+
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    try:
+        if GPS_LATITUDE in gps and GPS_LONGITUDE in gps:
+            result['latitude'] = _degrees(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF, 'N'))
+            result['longitude'] = _degrees(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF, 'E'))
+        if GPS_ALTITUDE in gps:
+            below_sea_level = gps.get(GPS_ALTITUDE_REF) in (1, b'\x01')
+            result['altitude'] = -_rational(gps[GPS_ALTITUDE]) if below_sea_level else _rational(gps[GPS_ALTITUDE])
+    except (TypeError, ValueError, ZeroDivisionError) as e:
+        result['gps_error'] = f"Malformed GPS tags: {e}"
+    relative = _relative_altitude(Path(path))
+    if relative is not None:
+        result['relative_altitude'] = relative
+    return result
+
+
+def ground_sample_distance(info: Dict[str, Any]) -> Optional[float]:
+    """Estimated GSD in cm/px from height above ground and 35mm-equivalent focal length"""
+    height = info.get('relative_altitude')
+    focal = info.get('focal_length_35mm')
+    if not height or not focal or height <= 0:
+        return None
+    # A 35mm-equivalent lens maps a 36mm wide frame onto the image width
+    return height * 100 * 36 / (focal * info['width'])
+
+
+def downscale_image(path: str, scale: float, quality: int) -> Dict[str, int]:
+    """Resize an image in place by scale, keeping its EXIF block. Runs in a worker process."""
+    source = Path(path)
+    with Image.open(source) as image:
+        exif = image.info.get('exif')
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        resized = image.resize(size, Image.LANCZOS)
+        partial = source.with_name(source.name + ".part")
+        options = {'quality': quality} if image.format == 'JPEG' else {}
+        if exif:
+            options['exif'] = exif
+        resized.save(partial, format=image.format, **options)
+    # Uploads are hardlinks into the shared blob store, so replace the link instead of writing through it
+    source.unlink()
+    partial.replace(source)
+    return {'width': size[0], 'height': size[1]}
+
+
+def find_near_duplicates(images: List[Dict[str, Any]], max_distance_m: float, max_hash_distance: int) -> List[str]:
+    """
+    Names of frames that repeat the previous kept frame while the drone hovers
+
+    Only geotagged frames are compared, in capture order: a frame within
+    max_distance_m of the last kept frame whose hash differs by at most
+    max_hash_distance bits is a duplicate.
+    """
+    geotagged = [info for info in images if 'latitude' in info]
+    geotagged.sort(key=lambda info: (info.get('taken_at') or '', info['name']))
+    duplicates: List[str] = []
+    kept: Optional[Dict[str, Any]] = None
+    for info in geotagged:
+        if (
+            kept is not None
+            and distance_m(kept, info) <= max_distance_m
+            and bin(kept['hash'] ^ info['hash']).count('1') <= max_hash_distance
+        ):
+            duplicates.append(info['name'])
+            continue
+        kept = info
+    return duplicates
+
+
+class PreprocessService:
+    """Runs validation, EXIF inspection, near-duplicate removal and downscaling on a process pool"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.PREPROCESS_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _map(self, function, *iterables) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(self.pool, function, *args) for args in zip(*iterables)))
+
+    async def run(self, paths: List[Path]) -> Dict[str, Any]:
+        """
+        Preprocess saved images before they are sent for processing
+
+        Returns:
+            Report with the accepted paths, rejected and duplicate frames with
+            reasons, images missing GPS, downscaled images and per-image details
+        """
+        inspected = await self._map(inspect_image, [str(path) for path in paths])
+        by_name = {path.name: path for path in paths}
+        rejected: List[Dict[str, str]] = []
+        missing_gps: List[str] = []
+        valid: List[Dict[str, Any]] = []
+        for info in inspected:
+            if not info['valid']:
+                rejected.append({'name': info['name'], 'reason': info['error']})
+            elif 'latitude' not in info and settings.PREPROCESS_REQUIRE_GPS:
+                rejected.append({'name': info['name'], 'reason': "No GPS position in EXIF"})
+            else:
+                if 'latitude' not in info:
+                    missing_gps.append(info['name'])
+                valid.append(info)
+
+        duplicates = find_near_duplicates(
+            valid, settings.PREPROCESS_DUPLICATE_DISTANCE, settings.PREPROCESS_DUPLICATE_HASH_DISTANCE,
+        ) if settings.PREPROCESS_DROP_DUPLICATES else []
+        dropped = set(duplicates)
+        accepted = [info for info in valid if info['name'] not in dropped]
+
+        downscaled: List[str] = []
+        target = settings.PREPROCESS_TARGET_GSD
+        if target > 0:
+            scales = {}
+            for info in accepted:
+                gsd = ground_sample_distance(info)
+                if gsd and gsd < target:
+                    scales[info['name']] = gsd / target
+            sizes = await self._map(
+                downscale_image,
+                [str(by_name[name]) for name in scales],
+                list(scales.values()),
+                [settings.PREPROCESS_JPEG_QUALITY] * len(scales),
+            )
+            for name, size in zip(scales, sizes):
+                next(info for info in accepted if info['name'] == name).update(size)
+                downscaled.append(name)
+
+        if rejected or duplicates or downscaled:
+            LOGGER.info(
+                f"Preprocessing kept {len(accepted)}/{len(paths)} images "
+                f"({len(rejected)} rejected, {len(duplicates)} duplicates, {len(downscaled)} downscaled)"
+            )
+        for info in inspected:
+            info.pop('hash', None)
+        return {
+            'accepted': [by_name[info['name']] for info in accepted],
+            'rejected': rejected,
+            'duplicates': duplicates,
+            'missing_gps': missing_gps,
+            'downscaled': downscaled,
+            'images': inspected,
+        }
+
+
+# Create service instance
+preprocess_service = PreprocessService()
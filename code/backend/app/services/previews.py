@@ -0,0 +1,94 @@
+"""
+Preview generation stage that renders small orthophoto images for galleries
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+from ..core.config import settings
+from .results_catalog import ARTIFACTS
+
+LOGGER = logging.getLogger(__name__)
+
+PREVIEW_DIR = "previews"
+PREVIEW_FORMAT = "webp"
+
+
+def preview_sizes() -> Dict[str, int]:
+    """Preview name -> longest edge in pixels"""
+    return {'small': settings.PREVIEW_SMALL_SIZE, 'medium': settings.PREVIEW_MEDIUM_SIZE}
+
+
+def render_previews(source: str, output_dir: str, sizes: Dict[str, int], quality: int) -> Dict[str, Dict[str, int]]:
+    """
+    Decode an orthophoto once and write one downscaled image per size
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    Image.MAX_IMAGE_PIXELS = None
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    results: Dict[str, Dict[str, int]] = {}
+    with Image.open(source) as image:
+        image = image.convert('RGBA')
+        # Largest preview first so each smaller one is resampled from it
+        for name, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+            image.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+            path = output / f"{name}.{PREVIEW_FORMAT}"
+            image.save(path, format=PREVIEW_FORMAT.upper(), quality=quality, method=4)
+            results[name] = {'width': image.width, 'height': image.height, 'bytes': path.stat().st_size}
+    return results
+
+
+class PreviewService:
+    """Creates orthophoto previews on a process pool after results are downloaded"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.PREVIEW_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def preview_path(self, task_dir: Path, name: str) -> Optional[Path]:
+        if name not in preview_sizes():
+            return None
+        path = task_dir / PREVIEW_DIR / f"{name}.{PREVIEW_FORMAT}"
+        return path if path.exists() else None
+
+    async def create_previews(self, task_dir: Path) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Render previews for the orthophoto in task_dir
+
+        Returns:
+            Preview name -> dimensions and size, or None if there is no orthophoto
+        """
+        source = task_dir / ARTIFACTS['orthophoto']
+        if not source.exists():
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.pool,
+            render_previews,
+            str(source),
+            str(task_dir / PREVIEW_DIR),
+            preview_sizes(),
+            settings.PREVIEW_QUALITY,
+        )
+
+
+# Create service instance
+preview_service = PreviewService()
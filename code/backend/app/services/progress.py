@@ -0,0 +1,72 @@
+"""
+Progress hub that fans task status updates out to streaming subscribers
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+LOGGER = logging.getLogger(__name__)
+
+# Stages after which no further events are published for a task
+FINAL_STAGES = ('completed', 'failed', 'canceled')
+# Undelivered events kept per subscriber; older ones are dropped since only the latest matters
+SUBSCRIBER_BUFFER = 16
+
+
+class ProgressHub:
+    """
+    Keeps the latest progress event per task and delivers new ones to every subscriber
+
+    The supervisor publishes once per status check, so any number of open
+    streams cost no extra NodeODM calls.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._latest: Dict[str, Dict[str, Any]] = {}
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Register a subscriber; it immediately receives the latest known event"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        if task_id in self._latest:
+            queue.put_nowait(self._latest[task_id])
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[task_id]
+
+    def subscriber_count(self, task_id: Optional[str] = None) -> int:
+        if task_id is not None:
+            return len(self._subscribers.get(task_id, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribed(self) -> List[str]:
+        """IDs of tasks with at least one subscriber"""
+        return list(self._subscribers)
+
+    def latest(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._latest.get(task_id)
+
+    def publish(self, task_id: str, event: Dict[str, Any]) -> None:
+        """Record an event as the task's latest and push it to current subscribers"""
+        event = {'taskId': task_id, **event}
+        if event.get('stage') in FINAL_STAGES:
+            # Finished tasks are answered from their manifest, no need to keep them here
+            self._latest.pop(task_id, None)
+        else:
+            self._latest[task_id] = event
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+# Create hub instance
+progress_hub = ProgressHub()
@@ -0,0 +1,239 @@
+"""
+Cloud-Optimized GeoTIFF conversion and windowed reads of georeferenced outputs
+"""
+
+import asyncio
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+try:
+    import rasterio
+    from rasterio.crs import CRS
+    from rasterio.enums import Resampling
+    from rasterio.io import MemoryFile
+    from rasterio.shutil import copy as copy_raster
+    from rasterio.transform import Affine
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import Window, from_bounds
+except ImportError:  # COG conversion and windowed reads need the optional 'geo' extra
+    rasterio = None
+
+from ..core.config import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# Raster name -> GeoTIFF path relative to the task's results directory
+RASTERS = {
+    'orthophoto': Path("odm_orthophoto") / "odm_orthophoto.tif",
+    'dsm': Path("odm_dem") / "dsm.tif",
+    'dtm': Path("odm_dem") / "dtm.tif",
+}
+RESAMPLING_METHODS = ('nearest', 'bilinear', 'cubic', 'average')
+# Compression codecs that benefit from a horizontal differencing predictor
+PREDICTOR_CODECS = ('DEFLATE', 'LZW', 'ZSTD')
+
+
+class RasterUnavailableError(Exception):
+    """Raised when a raster operation needs rasterio and it is not installed"""
+
+
+class WindowError(ValueError):
+    """Raised when a requested bbox does not overlap the raster"""
+
+
+class WindowTooLargeError(WindowError):
+    """Raised when a requested window would exceed RASTER_MAX_WINDOW_PIXELS"""
+
+
+def describe_raster(path: str) -> Dict[str, Any]:
+    """Size, georeferencing and internal layout of a GeoTIFF"""
+    with rasterio.open(path) as src:
+        return {
+            'width': src.width,
+            'height': src.height,
+            'bands': src.count,
+            'dtype': src.dtypes[0],
+            'crs': src.crs.to_string() if src.crs else None,
+            'bounds': list(src.bounds),
+            'resolution': list(src.res),
+            'nodata': src.nodata,
+            'block_size': list(src.block_shapes[0]),
+            'overviews': src.overviews(1),
+            'bytes': Path(path).stat().st_size,
+        }
+
+
+def convert_to_cog(source: str, block_size: int, compression: str) -> Dict[str, Any]:
+    """
+    Rewrite a GeoTIFF in place as an internally tiled COG with overviews
+
+    Files that are already tiled with overviews are left alone. Runs in a
+    worker process, so it only takes and returns plain values.
+    """
+    path = Path(source)
+    with rasterio.open(path) as src:
+        if src.profile.get('tiled') and src.overviews(1):
+            return describe_raster(source)
+        options = {
+            'BLOCKSIZE': block_size,
+            'COMPRESS': compression,
+            'OVERVIEWS': 'AUTO',
+            'RESAMPLING': 'AVERAGE',
+            'BIGTIFF': 'IF_SAFER',
+        }
+        if compression.upper() in PREDICTOR_CODECS:
+            options['PREDICTOR'] = 'YES'
+        partial = path.with_name(path.name + ".part")
+        copy_raster(src, str(partial), driver='COG', **options)
+    partial.replace(path)
+    return describe_raster(source)
+
+
+def read_window(
+    path: str,
+    bbox: Sequence[float],
+    bbox_crs: Optional[str],
+    resolution: Optional[float],
+    resampling: str,
+    max_pixels: int,
+) -> bytes:
+    """
+    Crop a raster to bbox and return the window as a GeoTIFF
+
+    Only the blocks intersecting the window are read; when a coarser
+    resolution is requested GDAL reads from the closest overview instead.
+
+    Args:
+        path: GeoTIFF to read
+        bbox: (min x, min y, max x, max y) in bbox_crs
+        bbox_crs: CRS of bbox, e.g. 'EPSG:4326'; None means the raster's CRS
+        resolution: Output pixel size in raster CRS units; None keeps native resolution
+        resampling: One of RESAMPLING_METHODS
+        max_pixels: Largest output width x height allowed
+    """
+    with rasterio.open(path) as src:
+        left, bottom, right, top = bbox
+        if bbox_crs and src.crs and CRS.from_user_input(bbox_crs) != src.crs:
+            left, bottom, right, top = transform_bounds(bbox_crs, src.crs, left, bottom, right, top, densify_pts=21)
+        window = from_bounds(left, bottom, right, top, transform=src.transform)
+        col_start = max(0, math.floor(window.col_off))
+        row_start = max(0, math.floor(window.row_off))
+        col_stop = min(src.width, math.ceil(window.col_off + window.width))
+        row_stop = min(src.height, math.ceil(window.row_off + window.height))
+        if col_stop <= col_start or row_stop <= row_start:
+            raise WindowError("The bbox does not overlap the raster")
+        window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+        if resolution:
+            width = max(1, round(window.width * src.res[0] / resolution))
+            height = max(1, round(window.height * src.res[1] / resolution))
+        else:
+            width, height = int(window.width), int(window.height)
+        if width * height > max_pixels:
+            raise WindowTooLargeError(
+                f"The window would be {width}x{height} pixels; request a smaller bbox or a coarser resolution"
+            )
+
+        data = src.read(window=window, out_shape=(src.count, height, width), resampling=Resampling[resampling])
+        transform = src.window_transform(window) * Affine.scale(window.width / width, window.height / height)
+        profile = {
+            'driver': 'GTiff',
+            'width': width,
+            'height': height,
+            'count': src.count,
+            'dtype': src.dtypes[0],
+            'crs': src.crs,
+            'transform': transform,
+            'nodata': src.nodata,
+            'compress': 'DEFLATE',
+        }
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as dst:
+                dst.write(data)
+                dst.colorinterp = src.colorinterp
+            return memfile.read()
+
+
+class RasterService:
+    """Converts georeferenced outputs to COGs at ingest and serves windows of them"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.COG_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def available(self) -> bool:
+        return rasterio is not None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def raster_path(self, task_dir: Path, name: str) -> Optional[Path]:
+        if name not in RASTERS:
+            return None
+        path = task_dir / RASTERS[name]
+        return path if path.exists() else None
+
+    async def create_cogs(self, task_dir: Path) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Convert the task's orthophoto and DEM GeoTIFFs to COGs
+
+        Returns:
+            Raster name -> description, or None if rasterio is missing or there are no GeoTIFFs
+        """
+        if not self.available:
+            return None
+        names = [name for name in RASTERS if self.raster_path(task_dir, name)]
+        if not names:
+            return None
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self.pool,
+                    convert_to_cog,
+                    str(task_dir / RASTERS[name]),
+                    settings.COG_BLOCK_SIZE,
+                    settings.COG_COMPRESSION,
+                )
+                for name in names
+            ),
+            return_exceptions=True,
+        )
+        rasters: Dict[str, Dict[str, Any]] = {}
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                LOGGER.warning(f"Failed to convert {name} in {task_dir} to a COG: {result}")
+                continue
+            rasters[name] = result
+        return rasters or None
+
+    async def read_window(
+        self,
+        path: Path,
+        bbox: Sequence[float],
+        bbox_crs: Optional[str] = 'EPSG:4326',
+        resolution: Optional[float] = None,
+        resampling: str = 'bilinear',
+    ) -> bytes:
+        """Crop a raster to bbox off the event loop; see read_window"""
+        if not self.available:
+            raise RasterUnavailableError("Raster windows need the optional 'geo' extra (rasterio)")
+        return await asyncio.to_thread(
+            read_window, str(path), bbox, bbox_crs, resolution, resampling, settings.RASTER_MAX_WINDOW_PIXELS,
+        )
+
+
+# Create service instance
+raster_service = RasterService()
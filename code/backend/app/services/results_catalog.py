@@ -0,0 +1,320 @@
+"""
+Persistent SQLite catalog of processed tasks used to serve result listings
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "catalog.db"
+
+# Artifact name -> path relative to the task's results directory
+ARTIFACTS = {
+    'orthophoto': Path("odm_orthophoto") / "odm_orthophoto.png",
+    'report': Path("odm_report") / "report.pdf",
+}
+
+SORT_COLUMNS = ('created_at', 'completed_at', 'task_name')
+
+# Columns added after the first release, created on older catalogs at startup
+MIGRATED_COLUMNS = {
+    'previews': 'TEXT',
+    'pinned': 'INTEGER NOT NULL DEFAULT 0',
+    'last_accessed_at': 'TEXT',
+    'fingerprint': 'TEXT',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    task_name TEXT NOT NULL DEFAULT '',
+    nodeodm_task_id TEXT,
+    status TEXT,
+    created_at TEXT,
+    completed_at TEXT,
+    has_orthophoto INTEGER NOT NULL DEFAULT 0,
+    orthophoto_size INTEGER,
+    has_report INTEGER NOT NULL DEFAULT 0,
+    report_size INTEGER,
+    previews TEXT,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    last_accessed_at TEXT,
+    fingerprint TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_ortho_created ON tasks (has_orthophoto, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_ortho_completed ON tasks (has_orthophoto, completed_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_ortho_name ON tasks (has_orthophoto, task_name);
+CREATE INDEX IF NOT EXISTS idx_tasks_nodeodm ON tasks (nodeodm_task_id);
+"""
+
+# Indexes on migrated columns, created once the columns exist
+MIGRATED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_tasks_fingerprint ON tasks (fingerprint);
+"""
+
+
+class ResultsCatalog:
+    """Index of task metadata and artifact availability kept next to the results"""
+
+    _instances: Dict[Path, "ResultsCatalog"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, results_dir: Path):
+        self.results_dir = Path(results_dir)
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.results_dir / CATALOG_FILENAME
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+            for column, column_type in MIGRATED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+            self._conn.executescript(MIGRATED_INDEXES)
+            self._conn.commit()
+
+    @classmethod
+    def for_directory(cls, results_dir: Path) -> "ResultsCatalog":
+        """Return the shared catalog for a results directory"""
+        key = Path(results_dir).resolve()
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(key)
+            return cls._instances[key]
+
+    def upsert_manifest(self, manifest: Dict[str, Any]) -> None:
+        """Record the metadata fields of a task manifest"""
+        task_id = manifest.get('task_id')
+        if not task_id:
+            return
+        row = (
+            task_id,
+            manifest.get('task_name') or manifest.get('taskName') or '',
+            manifest.get('nodeodm_task_id'),
+            manifest.get('status'),
+            manifest.get('created_at'),
+            manifest.get('completed_at'),
+            json.dumps(manifest['previews']) if manifest.get('previews') else None,
+            int(bool(manifest.get('pinned'))),
+            manifest.get('fingerprint'),
+            datetime.utcnow().isoformat(),
+        )
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO tasks (task_id, task_name, nodeodm_task_id, status, created_at, completed_at, previews, pinned, fingerprint, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    task_name = excluded.task_name,
+                    nodeodm_task_id = excluded.nodeodm_task_id,
+                    status = excluded.status,
+                    created_at = excluded.created_at,
+                    completed_at = excluded.completed_at,
+                    previews = excluded.previews,
+                    pinned = excluded.pinned,
+                    fingerprint = excluded.fingerprint,
+                    updated_at = excluded.updated_at
+                """,
+                row,
+            )
+            self._conn.commit()
+
+    def refresh_artifacts(self, task_id: str) -> Dict[str, Optional[int]]:
+        """Stat a task's artifacts and record their availability and sizes"""
+        sizes: Dict[str, Optional[int]] = {}
+        for name, relative in ARTIFACTS.items():
+            path = self.results_dir / task_id / relative
+            sizes[name] = path.stat().st_size if path.exists() else None
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO tasks (task_id, has_orthophoto, orthophoto_size, has_report, report_size, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    has_orthophoto = excluded.has_orthophoto,
+                    orthophoto_size = excluded.orthophoto_size,
+                    has_report = excluded.has_report,
+                    report_size = excluded.report_size,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    task_id,
+                    int(sizes['orthophoto'] is not None),
+                    sizes['orthophoto'],
+                    int(sizes['report'] is not None),
+                    sizes['report'],
+                    datetime.utcnow().isoformat(),
+                ),
+            )
+            self._conn.commit()
+        return sizes
+
+    def record_access(self, task_id: str, accessed_at: Optional[str] = None) -> None:
+        """Remember when a task's results were last viewed, for least recently used eviction"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET last_accessed_at = ? WHERE task_id = ?",
+                (accessed_at or datetime.utcnow().isoformat(), task_id),
+            )
+            self._conn.commit()
+
+    def least_recently_used(self) -> List[Dict[str, Any]]:
+        """All rows ordered by last access (falling back to completion, then creation), oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT * FROM tasks
+                ORDER BY COALESCE(last_accessed_at, completed_at, created_at, '') ASC, task_id ASC
+                """
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def remove(self, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            self._conn.commit()
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        item['previews'] = json.loads(item['previews']) if item.get('previews') else {}
+        return item
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def find_by_nodeodm_task_id(self, nodeodm_task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE nodeodm_task_id = ?", (nodeodm_task_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def find_by_fingerprint(self, fingerprint: str, statuses: Sequence[str], exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Tasks with an image-set fingerprint and one of statuses, oldest first"""
+        placeholders = ', '.join('?' for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT * FROM tasks
+                WHERE fingerprint = ? AND status IN ({placeholders}) AND task_id != ?
+                ORDER BY created_at ASC, task_id ASC
+                """,
+                [fingerprint, *statuses, exclude or ''],
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def list_tasks(
+        self,
+        page: int = 1,
+        page_size: int = 100,
+        sort: str = 'created_at',
+        order: str = 'desc',
+        name: Optional[str] = None,
+        with_orthophoto: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return one page of catalog rows plus the total number of matches
+
+        Args:
+            page: 1-based page number
+            page_size: Rows per page
+            sort: One of SORT_COLUMNS
+            order: 'asc' or 'desc'
+            name: Optional case-insensitive substring filter on the task name
+            with_orthophoto: Only include tasks whose orthophoto PNG is available
+
+        Returns:
+            Tuple of (rows, total)
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {sort}")
+        direction = 'ASC' if order.lower() == 'asc' else 'DESC'
+
+        clauses = []
+        params: List[Any] = []
+        if with_orthophoto:
+            clauses.append("has_orthophoto = 1")
+        if name:
+            escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("task_name LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM tasks {where} ORDER BY {sort} {direction}, task_id {direction} LIMIT ? OFFSET ?",
+                [*params, page_size, (max(page, 1) - 1) * page_size],
+            ).fetchall()
+        return [self._decode(row) for row in rows], total
+
+    def rebuild(self, manifests: Optional[Iterable[Dict[str, Any]]] = None) -> int:
+        """
+        Re-index every task directory under the results directory
+
+        Rows for task directories that no longer exist are dropped, so this also
+        repairs a catalog that drifted from what is on disk.
+        """
+        if manifests is None:
+            manifests = self._scan_manifests()
+        seen = set()
+        for manifest in manifests:
+            self.upsert_manifest(manifest)
+            self.refresh_artifacts(manifest['task_id'])
+            seen.add(manifest['task_id'])
+
+        with self._lock:
+            indexed = [row[0] for row in self._conn.execute("SELECT task_id FROM tasks")]
+        stale = [task_id for task_id in indexed if task_id not in seen]
+        for task_id in stale:
+            self.remove(task_id)
+        LOGGER.info(f"Rebuilt results catalog: {len(seen)} tasks indexed, {len(stale)} stale rows removed")
+        return len(seen)
+
+    def _scan_manifests(self) -> Iterable[Dict[str, Any]]:
+        for task_dir in self.results_dir.iterdir():
+            if not task_dir.is_dir():
+                continue
+            manifest: Dict[str, Any] = {}
+            manifest_path = task_dir / "manifest.json"
+            if manifest_path.exists():
+                try:
+                    with open(manifest_path, 'r', encoding='utf-8') as f:
+                        manifest = json.load(f)
+                except Exception as e:
+                    LOGGER.warning(f"Failed to read manifest for task {task_dir.name}: {e}")
+            if not isinstance(manifest, dict):
+                manifest = {}
+            manifest['task_id'] = task_dir.name
+            yield manifest
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from ..core.config import settings
+
+    parser = argparse.ArgumentParser(description="Maintain the results catalog")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: re-index all tasks under RESULTS_DIR")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == "rebuild":
+        indexed = ResultsCatalog(Path(settings.RESULTS_DIR)).rebuild()
+        print(f"Indexed {indexed} tasks")
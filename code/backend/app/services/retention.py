@@ -0,0 +1,382 @@
+"""
+Retention janitor that keeps uploads and results within configured disk policies
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..core.config import settings
+from .blob_store import BlobStore, blob_store
+from .elevation import ElevationService, elevation_service
+from .file_storage import FileStorageService, file_storage_service, is_valid_task_id
+from .node_pool import NodePool, node_pool
+from .status_cache import StatusCache, status_cache
+from .task_supervisor import ACTIVE_STATUSES, TaskSupervisor, task_supervisor
+from .tiles import TileService, tile_service
+
+LOGGER = logging.getLogger(__name__)
+
+# Minimum seconds between last-access updates of the same task
+ACCESS_RECORD_INTERVAL = 60
+# Text outputs gzipped in place when compacting an old task
+COMPRESSIBLE_SUFFIXES = ('.log', '.txt')
+# Seconds a task without a status counts as still uploading after its uploads or manifest last changed
+UPLOAD_IDLE_TIMEOUT = 24 * 3600
+
+
+def directory_size(path: Path) -> int:
+    """Bytes used by the files under path, counting hardlinked files once"""
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.st_nlink > 1:
+                key = (stat.st_dev, stat.st_ino)
+                if key in seen:
+                    continue
+                seen.add(key)
+            total += stat.st_size
+    return total
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+class RetentionService:
+    """
+    Applies retention policies to finished tasks on a background loop
+
+    Each sweep plans, then (unless it is a dry run) applies, these actions:
+    - delete_uploads: drop the raw images of tasks whose results were downloaded
+    - compact: gzip logs and remove RETENTION_TRIM_PATHS of tasks completed
+      more than RETENTION_COMPACT_AFTER_DAYS ago
+    - evict: delete whole tasks, least recently viewed first, while results
+      and uploads together exceed RETENTION_MAX_BYTES
+
+    Tasks still processing or downloading are never touched, and tasks whose
+    manifest sets 'pinned' are exempt from every policy.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[FileStorageService] = None,
+        store: Optional[BlobStore] = None,
+        tiles: Optional[TileService] = None,
+        elevation: Optional[ElevationService] = None,
+        supervisor: Optional[TaskSupervisor] = None,
+        pool: Optional[NodePool] = None,
+        cache: Optional[StatusCache] = None,
+        upload_dir: Optional[Path] = None,
+    ):
+        self.storage = storage or file_storage_service
+        self.store = store or blob_store
+        self.tiles = tiles or tile_service
+        self.elevation = elevation or elevation_service
+        self.supervisor = supervisor or task_supervisor
+        self.pool = pool or node_pool
+        self.cache = cache or status_cache
+        self.upload_dir = Path(upload_dir or settings.UPLOAD_DIR)
+        self._accessed: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self._runner: Optional[asyncio.Task] = None
+
+    def record_access(self, task_id: str) -> None:
+        """Note that a task's results were viewed; updates are throttled per task"""
+        now = time.monotonic()
+        if now - self._accessed.get(task_id, float('-inf')) < ACCESS_RECORD_INTERVAL:
+            return
+        self._accessed[task_id] = now
+        try:
+            self.storage.catalog.record_access(task_id)
+        except Exception as e:
+            LOGGER.warning(f"Failed to record access to task {task_id}: {e}")
+
+    def set_pinned(self, task_id: str, pinned: bool) -> Optional[Dict[str, Any]]:
+        """Pin or unpin a task; returns its manifest, or None if the task does not exist"""
+        if not is_valid_task_id(task_id):
+            raise ValueError(f"Invalid task ID: {task_id}")
+        if self.storage.read_manifest(task_id) is None:
+            return None
+        return self.storage.update_manifest(task_id, {'pinned': pinned})
+
+    def _is_active(self, task_id: str, status: Optional[str]) -> bool:
+        """
+        Whether a task is in flight and must not be touched
+
+        Uploads only get a status once NodeODM has the task, so a task
+        without one is still being uploaded unless its files and manifest
+        have not changed for UPLOAD_IDLE_TIMEOUT, i.e. the upload was abandoned.
+        """
+        if status in ACTIVE_STATUSES or self.supervisor.is_watched(task_id):
+            return True
+        if status:
+            return False
+        changed = 0.0
+        for path in (self.upload_dir / task_id, self.storage.results_dir / task_id / "manifest.json"):
+            try:
+                changed = max(changed, path.stat().st_mtime)
+            except OSError:
+                continue
+        return time.time() - changed < UPLOAD_IDLE_TIMEOUT
+
+    def _compactable(self, task_dir: Path) -> List[Path]:
+        paths = [task_dir / name for name in settings.RETENTION_TRIM_PATHS if (task_dir / name).exists()]
+        for root, _, files in os.walk(task_dir):
+            for name in files:
+                path = Path(root) / name
+                if path.suffix in COMPRESSIBLE_SUFFIXES and path.stat().st_size >= settings.RETENTION_COMPRESS_MIN_BYTES:
+                    if not any(parent in paths for parent in path.parents):
+                        paths.append(path)
+        return paths
+
+    def plan(self) -> Dict[str, Any]:
+        """
+        Work out what a sweep would do without changing anything
+
+        Returns:
+            Current usage, the quota, and a list of actions with the task, the
+            reason and the bytes each is expected to free
+        """
+        now = datetime.utcnow()
+        compact_before = now - timedelta(days=settings.RETENTION_COMPACT_AFTER_DAYS)
+        actions: List[Dict[str, Any]] = []
+        evictable: List[Dict[str, Any]] = []
+        usage = 0
+
+        for row in self.storage.catalog.least_recently_used():
+            task_id = row['task_id']
+            results_dir = self.storage.results_dir / task_id
+            upload_dir = self.upload_dir / task_id
+            results_bytes = directory_size(results_dir) if results_dir.exists() else 0
+            upload_bytes = directory_size(upload_dir) if upload_dir.exists() else 0
+            usage += results_bytes + upload_bytes
+            if row['pinned'] or self._is_active(task_id, row['status']):
+                continue
+
+            if settings.RETENTION_DELETE_UPLOADS and row['status'] == 'completed' and upload_dir.exists():
+                actions.append({
+                    'task_id': task_id,
+                    'action': 'delete_uploads',
+                    'bytes': upload_bytes,
+                    'reason': "Results are downloaded",
+                })
+
+            completed_at = _parse_time(row['completed_at'])
+            if (
+                settings.RETENTION_COMPACT_AFTER_DAYS > 0
+                and row['status'] == 'completed'
+                and completed_at is not None
+                and completed_at < compact_before
+            ):
+                paths = self._compactable(results_dir)
+                if paths:
+                    # Only trimmed directories are counted; gzip frees an unknown share of each log
+                    trimmed = sum(directory_size(p) if p.is_dir() else 0 for p in paths)
+                    actions.append({
+                        'task_id': task_id,
+                        'action': 'compact',
+                        'bytes': trimmed,
+                        'paths': [str(p.relative_to(results_dir)) for p in paths],
+                        'reason': f"Completed more than {settings.RETENTION_COMPACT_AFTER_DAYS:g} days ago",
+                    })
+            evictable.append({'task_id': task_id, 'bytes': results_bytes + upload_bytes})
+
+        planned_usage = usage - sum(action['bytes'] for action in actions)
+        quota = settings.RETENTION_MAX_BYTES
+        if quota and planned_usage > quota:
+            for candidate in evictable:
+                if planned_usage <= quota:
+                    break
+                # Evicting supersedes anything else planned for the task
+                superseded = [action for action in actions if action['task_id'] == candidate['task_id']]
+                actions = [action for action in actions if action['task_id'] != candidate['task_id']]
+                planned_usage += sum(action['bytes'] for action in superseded) - candidate['bytes']
+                actions.append({
+                    'task_id': candidate['task_id'],
+                    'action': 'evict',
+                    'bytes': candidate['bytes'],
+                    'reason': "Least recently used task over the disk quota",
+                })
+
+        return {
+            'generated_at': now.isoformat(),
+            'usage_bytes': usage,
+            'quota_bytes': quota or None,
+            'planned_usage_bytes': planned_usage,
+            'reclaimable_bytes': sum(action['bytes'] for action in actions),
+            'actions': actions,
+        }
+
+    async def sweep(self, dry_run: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Plan and apply the retention policies
+
+        Args:
+            dry_run: Only report the plan (defaults to RETENTION_DRY_RUN)
+
+        Returns:
+            The plan, with 'applied' and, after a real sweep, the bytes freed
+        """
+        dry_run = settings.RETENTION_DRY_RUN if dry_run is None else dry_run
+        async with self._lock:
+            report = await asyncio.to_thread(self.plan)
+            report['dry_run'] = dry_run
+            if dry_run:
+                if report['actions']:
+                    LOGGER.info(
+                        f"Retention dry run: {len(report['actions'])} actions would free "
+                        f"{report['reclaimable_bytes']} bytes"
+                    )
+                return report
+
+            freed = 0
+            for action in report['actions']:
+                try:
+                    freed += await self._apply(action)
+                except Exception as e:
+                    action['error'] = str(e)
+                    LOGGER.warning(f"Retention {action['action']} of task {action['task_id']} failed: {e}")
+            _, blob_bytes = await asyncio.to_thread(self.store.collect)
+            report['freed_bytes'] = freed
+            report['freed_blob_bytes'] = blob_bytes
+            if report['actions']:
+                LOGGER.info(f"Retention sweep applied {len(report['actions'])} actions, freed {freed} bytes")
+            return report
+
+    async def _apply(self, action: Dict[str, Any]) -> int:
+        task_id = action['task_id']
+        if action['action'] == 'evict':
+            deleted = await self.delete_task(task_id, collect=False)
+            return deleted['freed_bytes'] if deleted else 0
+        if action['action'] == 'delete_uploads':
+            return await asyncio.to_thread(self._delete_uploads, task_id)
+        if action['action'] == 'compact':
+            return await asyncio.to_thread(self._compact, task_id, action['paths'])
+        raise ValueError(f"Unknown retention action {action['action']}")
+
+    def _delete_uploads(self, task_id: str) -> int:
+        upload_dir = self.upload_dir / task_id
+        freed = directory_size(upload_dir)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        self.store.release(task_id)
+        self.storage.update_manifest(task_id, {'uploads_deleted_at': datetime.utcnow().isoformat()})
+        return freed
+
+    def _compact(self, task_id: str, paths: List[str]) -> int:
+        task_dir = self.storage.results_dir / task_id
+        before = directory_size(task_dir)
+        for relative in paths:
+            path = task_dir / relative
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            elif path.is_file():
+                compressed = path.with_name(path.name + ".gz")
+                with open(path, 'rb') as source, gzip.open(compressed, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                path.unlink()
+        self.storage.update_manifest(task_id, {
+            'compacted_at': datetime.utcnow().isoformat(),
+            'compacted': paths,
+        })
+        return before - directory_size(task_dir)
+
+    async def delete_task(self, task_id: str, remove_remote: bool = True, collect: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Delete everything stored for a task
+
+        Stops tracking it, removes it from its NodeODM node, and deletes its
+        results, uploads, tile pyramid, blob references and catalog row.
+
+        Returns:
+            The task ID and bytes freed, or None if nothing is stored for the task
+
+        Raises:
+            ValueError: If task_id is not a single path component
+        """
+        if not is_valid_task_id(task_id):
+            raise ValueError(f"Invalid task ID: {task_id}")
+        results_dir = self.storage.results_dir / task_id
+        upload_dir = self.upload_dir / task_id
+        manifest = self.storage.read_manifest(task_id) or {}
+        if not results_dir.exists() and not upload_dir.exists() and self.storage.catalog.get(task_id) is None:
+            return None
+
+        self.supervisor.forget(task_id)
+        nodeodm_task_id = manifest.get('nodeodm_task_id')
+        if nodeodm_task_id:
+            self.cache.invalidate(nodeodm_task_id)
+            if remove_remote:
+                await self.pool.client_for(manifest.get('node_url')).remove_task(nodeodm_task_id, quiet=True)
+
+        def remove_files() -> int:
+            freed = 0
+            for path in (results_dir, upload_dir):
+                if path.exists():
+                    freed += directory_size(path)
+                    shutil.rmtree(path, ignore_errors=True)
+            return freed
+
+        # Open DEM handles would keep deleted files' space in use
+        self.elevation.invalidate(task_id)
+        freed = await asyncio.to_thread(remove_files)
+        self.tiles.invalidate(task_id)
+        self.store.release(task_id)
+        self.storage.catalog.remove(task_id)
+        self._accessed.pop(task_id, None)
+        if collect:
+            await asyncio.to_thread(self.store.collect)
+        LOGGER.info(f"Deleted task {task_id} ({freed} bytes)")
+        return {'task_id': task_id, 'freed_bytes': freed}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.RETENTION_INTERVAL)
+            # With several workers only the one holding the lease sweeps; it keeps the lease while it lives
+            if not self.supervisor.store.acquire('retention', self.supervisor.worker_id, settings.RETENTION_INTERVAL * 2):
+                continue
+            try:
+                await self.sweep()
+            except Exception as e:
+                LOGGER.exception(f"Retention sweep failed: {e}")
+
+    async def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+
+# Create service instance
+retention_service = RetentionService()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Apply upload and results retention policies")
+    parser.add_argument("command", choices=["plan", "sweep"], help="plan: report what a sweep would do; sweep: apply it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    report = asyncio.run(retention_service.sweep(dry_run=args.command == "plan"))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,128 @@
+"""
+Result reuse for resubmissions of an image set that was already processed with the same options
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, AsyncContextManager, Dict, Iterable, Optional
+
+from ..core.config import settings
+from .file_storage import FileStorageService, file_storage_service
+from .task_store import WORKER_ID
+from .task_supervisor import ACTIVE_STATUSES, TaskSupervisor, task_supervisor
+
+LOGGER = logging.getLogger(__name__)
+
+# Resubmissions chain at most this deep before the chain is assumed broken
+MAX_ALIAS_DEPTH = 10
+
+
+def task_fingerprint(sha256s: Iterable[str], options: Dict[str, Any]) -> str:
+    """Hash of the sorted image content hashes and the processing options, independent of file names and order"""
+    payload = json.dumps({'images': sorted(sha256s), 'options': options}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def preprocess_options() -> Optional[Dict[str, Any]]:
+    """Preprocessing settings that change which images NodeODM receives, or None when preprocessing is off"""
+    if not settings.PREPROCESS_ENABLED:
+        return None
+    return {
+        'require_gps': settings.PREPROCESS_REQUIRE_GPS,
+        'drop_duplicates': settings.PREPROCESS_DROP_DUPLICATES,
+        'duplicate_distance': settings.PREPROCESS_DUPLICATE_DISTANCE,
+        'duplicate_hash_distance': settings.PREPROCESS_DUPLICATE_HASH_DISTANCE,
+        'target_gsd': settings.PREPROCESS_TARGET_GSD,
+        'jpeg_quality': settings.PREPROCESS_JPEG_QUALITY,
+    }
+
+
+class ReuseService:
+    """
+    Answers a resubmitted image set from the task that already has it
+
+    Each task's fingerprint is stored in its manifest and indexed in the
+    results catalog. A new task matching a completed one gets hardlinks to its
+    results at once; one matching an in-flight task is attached to it and
+    receives its progress events and, on completion, its results.
+    """
+
+    def __init__(self, storage: Optional[FileStorageService] = None, supervisor: Optional[TaskSupervisor] = None):
+        self.storage = storage or file_storage_service
+        self.supervisor = supervisor or task_supervisor
+
+    def fingerprint(self, sha256s: Iterable[str], odm_options: Dict[str, Any]) -> str:
+        return task_fingerprint(sha256s, {'odm': odm_options, 'preprocess': preprocess_options()})
+
+    def lock(self, fingerprint: str) -> AsyncContextManager[None]:
+        """
+        Lock serializing submissions of one fingerprint across every worker
+
+        Hold it from the reuse lookup until the new task is recorded as
+        processing, so a duplicate click waits and then attaches instead of
+        starting a second run. It is a lease in the shared task store, so a
+        holder that dies only blocks duplicates for NODEODM_TIMEOUT.
+        """
+        owner = f"{WORKER_ID}:{uuid.uuid4().hex}"
+        return self.supervisor.store.hold(f"reuse:{fingerprint}", owner, settings.NODEODM_TIMEOUT)
+
+    def _root(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Follow a chain of in-flight resubmissions to the task that is actually processing"""
+        for _ in range(MAX_ALIAS_DEPTH):
+            manifest = self.storage.read_manifest(task_id)
+            if not manifest or not manifest.get('reused_from') or manifest.get('status') == 'completed':
+                return manifest
+            task_id = manifest['reused_from']
+        return None
+
+    def find(self, fingerprint: str, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Manifest of the task a new submission can reuse
+
+        Completed tasks whose results are still on disk win over in-flight
+        ones; among either the oldest is chosen.
+        """
+        rows = self.storage.catalog.find_by_fingerprint(fingerprint, ('completed', *ACTIVE_STATUSES), exclude=exclude)
+        for row in sorted(rows, key=lambda row: row['status'] != 'completed'):
+            if row['status'] == 'completed' and not row['has_orthophoto']:
+                continue
+            manifest = self._root(row['task_id'])
+            if manifest and manifest.get('status') in ('completed', *ACTIVE_STATUSES):
+                manifest.setdefault('task_id', row['task_id'])
+                return manifest
+        return None
+
+    async def reuse(self, task_id: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer task_id from an earlier task with the same fingerprint, if there is one
+
+        Returns:
+            {'status', 'reused_from'} describing the new task, or None if it has to be processed
+        """
+        if not settings.REUSE_ENABLED:
+            return None
+        source = self.find(fingerprint, exclude=task_id)
+        if source is None:
+            return None
+        source_task_id = source['task_id']
+
+        if source['status'] == 'completed':
+            await asyncio.to_thread(self.storage.link_results, source_task_id, task_id)
+            self.storage.update_manifest(task_id, {
+                'status': 'completed',
+                'reused_from': source_task_id,
+                'completed_at': datetime.utcnow().isoformat(),
+            })
+        else:
+            self.storage.update_manifest(task_id, {'status': 'processing', 'reused_from': source_task_id})
+            self.supervisor.attach(source_task_id, task_id)
+        LOGGER.info(f"Task {task_id} reuses {source['status']} task {source_task_id}")
+        return {'status': 'completed' if source['status'] == 'completed' else 'processing', 'reused_from': source_task_id}
+
+
+# Create service instance
+reuse_service = ReuseService()
@@ -0,0 +1,106 @@
+"""
+Short-lived, coalescing cache of NodeODM task status lookups
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from pyodm.types import TaskInfo, TaskStatus
+
+from ..core.config import settings
+from .metrics import STATUS_CACHE_LOOKUPS
+from .node_pool import NodePool, node_pool
+
+LOGGER = logging.getLogger(__name__)
+
+# States a task never leaves, cached without expiry
+TERMINAL_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELED)
+
+
+class StatusCache:
+    """
+    Caches task info for STATUS_CACHE_TTL seconds and shares in-flight lookups
+
+    Concurrent lookups for the same task wait on one upstream call, and the
+    supervisor primes the cache with every status it fetches, so NodeODM load
+    follows the number of active tasks rather than the number of viewers.
+    Terminal states are kept until evicted, least recently used first.
+    """
+
+    def __init__(self, pool: Optional[NodePool] = None, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.pool = pool or node_pool
+        self.ttl = ttl if ttl is not None else settings.STATUS_CACHE_TTL
+        self.max_entries = max_entries or settings.STATUS_CACHE_MAX_ENTRIES
+        # NodeODM task UUID -> (info, expiry on the monotonic clock or None for terminal states)
+        self._entries: "OrderedDict[str, Tuple[TaskInfo, Optional[float]]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, nodeodm_task_id: str, info: TaskInfo) -> None:
+        """Store fresh task info, e.g. from a supervisor status check"""
+        expires = None if info.status in TERMINAL_STATUSES else time.monotonic() + self.ttl
+        self._entries[nodeodm_task_id] = (info, expires)
+        self._entries.move_to_end(nodeodm_task_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, nodeodm_task_id: str) -> None:
+        self._entries.pop(nodeodm_task_id, None)
+
+    def _cached(self, nodeodm_task_id: str) -> Optional[TaskInfo]:
+        entry = self._entries.get(nodeodm_task_id)
+        if entry is None:
+            return None
+        info, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._entries[nodeodm_task_id]
+            return None
+        self._entries.move_to_end(nodeodm_task_id)
+        return info
+
+    async def get(self, nodeodm_task_id: str) -> TaskInfo:
+        """Return task info from cache, a lookup already in flight, or one new upstream call"""
+        info = self._cached(nodeodm_task_id)
+        if info is not None:
+            self.hits += 1
+            STATUS_CACHE_LOOKUPS.inc(result='hit')
+            return info
+
+        lookup = self._pending.get(nodeodm_task_id)
+        if lookup is not None:
+            self.coalesced += 1
+            STATUS_CACHE_LOOKUPS.inc(result='coalesced')
+        else:
+            self.misses += 1
+            STATUS_CACHE_LOOKUPS.inc(result='miss')
+            # Run the upstream call as its own task so one caller going away does not cancel it for the rest
+            lookup = asyncio.create_task(self._fetch(nodeodm_task_id))
+            self._pending[nodeodm_task_id] = lookup
+            lookup.add_done_callback(lambda _: self._pending.pop(nodeodm_task_id, None))
+        return await asyncio.shield(lookup)
+
+    async def _fetch(self, nodeodm_task_id: str) -> TaskInfo:
+        client = await self.pool.locate(nodeodm_task_id)
+        info = await client.task_info(nodeodm_task_id)
+        self.put(nodeodm_task_id, info)
+        return info
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
+
+
+# Create cache instance
+status_cache = StatusCache()
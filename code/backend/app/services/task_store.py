@@ -0,0 +1,258 @@
+"""
+Shared SQLite store of live task state and worker leases for multi-worker deployments
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set
+
+LOGGER = logging.getLogger(__name__)
+
+STATE_FILENAME = "state.db"
+# Identifies this process in leases; unique even when workers share a host and PIDs are reused
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Seconds between attempts while waiting for a lease held by another worker
+LEASE_POLL_INTERVAL = 0.25
+
+TASK_FIELDS = ('nodeodm_task_id', 'node_url', 'status', 'stage', 'node_status', 'progress', 'download_bytes', 'error', 'reused_from')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    nodeodm_task_id TEXT,
+    node_url TEXT,
+    status TEXT,
+    stage TEXT,
+    node_status TEXT,
+    progress REAL,
+    download_bytes INTEGER,
+    error TEXT,
+    reused_from TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+CREATE INDEX IF NOT EXISTS idx_tasks_reused_from ON tasks (reused_from);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_owner ON leases (owner);
+CREATE TABLE IF NOT EXISTS metrics (
+    owner TEXT PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def task_lease(task_id: str) -> str:
+    """Lease name giving one worker the right to poll and download a task"""
+    return f"task:{task_id}"
+
+
+class TaskStore:
+    """
+    Live state of in-flight tasks shared by every worker process on the host
+
+    Rows hold what the owning worker last learned about a task (NodeODM
+    mapping, node, status, progress, bytes downloaded), so any worker can
+    answer for any task. Leases are rows that expire unless their owner
+    renews them; a task is driven only by the worker holding its lease, and
+    a crashed worker's tasks are claimed by the others once its leases lapse.
+    """
+
+    _instances: Dict[Path, "TaskStore"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Writers from other processes hold the database briefly; wait for them instead of failing
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    @classmethod
+    def for_directory(cls, results_dir: Path) -> "TaskStore":
+        """Return the shared store kept in a results directory"""
+        key = (Path(results_dir) / STATE_FILENAME).resolve()
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(key)
+            return cls._instances[key]
+
+    def upsert(self, task_id: str, **fields: Any) -> None:
+        """Create a task row or update the given fields of it"""
+        unknown = set(fields) - set(TASK_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown task fields: {', '.join(sorted(unknown))}")
+        columns = ['task_id', *fields, 'updated_at']
+        updates = ', '.join(f"{column} = excluded.{column}" for column in [*fields, 'updated_at'])
+        with self._lock:
+            self._conn.execute(
+                f"""
+                INSERT INTO tasks ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+                ON CONFLICT(task_id) DO UPDATE SET {updates}
+                """,
+                [task_id, *fields.values(), time.time()],
+            )
+            self._conn.commit()
+
+    def insert_missing(self, task_id: str, **fields: Any) -> bool:
+        """Create a task row unless one exists; True if it was created"""
+        columns = ['task_id', *fields, 'updated_at']
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT OR IGNORE INTO tasks ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [task_id, *fields.values(), time.time()],
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, task_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM tasks WHERE task_id IN ({', '.join('?' for _ in task_ids)})", task_ids,
+            ).fetchall()
+        return {row['task_id']: dict(row) for row in rows}
+
+    def attached(self, task_id: str, statuses: Sequence[str]) -> List[str]:
+        """IDs of resubmissions in one of statuses waiting on task_id's results"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT task_id FROM tasks
+                WHERE reused_from = ? AND status IN ({', '.join('?' for _ in statuses)})
+                ORDER BY task_id
+                """,
+                [task_id, *statuses],
+            ).fetchall()
+        return [row['task_id'] for row in rows]
+
+    def unowned(self, statuses: Sequence[str]) -> List[Dict[str, Any]]:
+        """Rows of tasks in one of statuses that run on NodeODM and that no live lease covers"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT tasks.* FROM tasks
+                LEFT JOIN leases ON leases.name = 'task:' || tasks.task_id AND leases.expires_at >= ?
+                WHERE tasks.status IN ({', '.join('?' for _ in statuses)})
+                    AND tasks.nodeodm_task_id IS NOT NULL
+                    AND tasks.reused_from IS NULL
+                    AND leases.name IS NULL
+                """,
+                [time.time(), *statuses],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            self._conn.execute("DELETE FROM leases WHERE name = ?", (task_lease(task_id),))
+            self._conn.commit()
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or extend a lease; False while another owner holds it unexpired"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                """,
+                (name, owner, now + ttl, now),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def renew(self, owner: str, ttl: float) -> Set[str]:
+        """Extend every unexpired lease of owner and return the names it still holds"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at >= ?", (now + ttl, owner, now)
+            )
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT name FROM leases WHERE owner = ? AND expires_at >= ?", (owner, now)
+            ).fetchall()
+        return {row['name'] for row in rows}
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+            self._conn.commit()
+
+    def release_all(self, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+            self._conn.commit()
+
+    def publish_metrics(self, owner: str, snapshot: Dict[str, Any]) -> None:
+        """Replace the metrics snapshot last published by owner"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metrics (owner, snapshot, updated_at) VALUES (?, ?, ?)",
+                (owner, json.dumps(snapshot), time.time()),
+            )
+            self._conn.commit()
+
+    def metric_snapshots(self, exclude: Optional[str] = None, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Snapshots published by other owners; ones older than max_age are dropped"""
+        with self._lock:
+            if max_age is not None:
+                self._conn.execute("DELETE FROM metrics WHERE updated_at < ?", (time.time() - max_age,))
+                self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT snapshot FROM metrics WHERE owner IS NOT ?", (exclude,)
+            ).fetchall()
+        return [json.loads(row['snapshot']) for row in rows]
+
+    @asynccontextmanager
+    async def hold(self, name: str, owner: str, ttl: float) -> AsyncIterator[None]:
+        """
+        Wait for a lease, hold it for the block and release it afterwards
+
+        The lease is renewed every third of its TTL while the block runs, so a
+        block that outlasts the TTL keeps it; only a crashed holder lets it
+        lapse, after at most ttl seconds.
+        """
+        while not self.acquire(name, owner, ttl):
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+        async def renew() -> None:
+            while True:
+                await asyncio.sleep(ttl / 3)
+                if not self.acquire(name, owner, ttl):
+                    LOGGER.warning(f"Lease {name} was taken over by another worker while held")
+
+        renewal = asyncio.create_task(renew())
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            self.release(name, owner)
@@ -0,0 +1,555 @@
+"""
+Task supervisor that tracks every in-flight NodeODM task from one polling loop
+"""
+
+import asyncio
+import logging
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pyodm.types import TaskInfo, TaskStatus
+
+from ..core.config import settings
+from .file_storage import FileStorageService, file_storage_service
+from .job_queue import JobQueue
+from .metrics import TASKS_IN_FLIGHT
+from .node_pool import NodePool, node_pool
+from .nodeodm_client import NodeODMError
+from .progress import FINAL_STAGES, ProgressHub, progress_hub
+from .status_cache import StatusCache, status_cache
+from .task_store import WORKER_ID, TaskStore, task_lease
+
+LOGGER = logging.getLogger(__name__)
+
+# Manifest status values for tasks the supervisor still owns
+ACTIVE_STATUSES = ('processing', 'downloading')
+# Minimum seconds between download progress updates of one task
+DOWNLOAD_PROGRESS_INTERVAL = 1.0
+# Finishing tasks goes ahead of warming tile caches
+DOWNLOAD_JOB_PRIORITY = 10
+TILES_JOB_PRIORITY = 0
+
+
+class DownloadCanceled(Exception):
+    """Raised inside a download job whose task was deleted while it ran"""
+
+
+class WatchedTask:
+    """Polling state for one in-flight task"""
+
+    def __init__(self, task_id: str, nodeodm_task_id: str, node_url: Optional[str] = None):
+        self.task_id = task_id
+        self.nodeodm_task_id = nodeodm_task_id
+        self.node_url = node_url
+        self.next_check = time.monotonic()
+        self.last_checked: Optional[float] = None
+        self.last_progress: Optional[float] = None
+        self.status = 'pending'
+        self.errors = 0
+
+
+class TaskSupervisor:
+    """
+    Drives in-flight tasks and checks them in batches with adaptive intervals
+
+    Task state is mirrored into the shared task store. With several worker
+    processes each task is driven only by the worker holding its lease; the
+    other workers follow its state from the store to serve progress streams
+    and claim its tasks once its leases lapse. Tasks NodeODM has finished
+    are handed to the job queue, whose workers download and post-process
+    their assets outside the API process.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[FileStorageService] = None,
+        pool: Optional[NodePool] = None,
+        hub: Optional[ProgressHub] = None,
+        cache: Optional[StatusCache] = None,
+        store: Optional[TaskStore] = None,
+        worker_id: Optional[str] = None,
+        jobs: Optional[JobQueue] = None,
+    ):
+        self.storage = storage or file_storage_service
+        self.pool = pool or node_pool
+        self.hub = hub or progress_hub
+        self.cache = cache or status_cache
+        self._store = store
+        self.worker_id = worker_id or WORKER_ID
+        self._jobs = jobs
+        self._watched: Dict[str, WatchedTask] = {}
+        # Task ID -> state last published for a stream of a task another worker drives
+        self._followed: Dict[str, tuple] = {}
+        self._next_sync = 0.0
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._follower: Optional[asyncio.Task] = None
+
+    @property
+    def store(self) -> TaskStore:
+        """Shared task store, opened on first use so importing the module creates no database"""
+        if self._store is None:
+            self._store = TaskStore.for_directory(self.storage.results_dir)
+        return self._store
+
+    @property
+    def jobs(self) -> JobQueue:
+        """Shared job queue, opened on first use like the task store"""
+        if self._jobs is None:
+            self._jobs = JobQueue.for_directory(self.storage.results_dir)
+        return self._jobs
+
+    @property
+    def watched_count(self) -> int:
+        return len(self._watched)
+
+    @property
+    def downloading_count(self) -> int:
+        """Download jobs queued or running in any worker"""
+        return self.jobs.active_count('download')
+
+    def status_counts(self) -> Dict[tuple, int]:
+        """In-flight task counts keyed by (status,) for the tasks_in_flight gauge"""
+        counts: Dict[tuple, int] = {('downloading',): self.downloading_count}
+        for watched in self._watched.values():
+            counts[(watched.status,)] = counts.get((watched.status,), 0) + 1
+        return counts
+
+    def watch(self, task_id: str, nodeodm_task_id: str, node_url: Optional[str] = None) -> bool:
+        """
+        Record a new task in the shared store and drive it from this worker
+
+        Returns:
+            False if another worker already holds the task's lease
+        """
+        if not self.store.acquire(task_lease(task_id), self.worker_id, settings.TASK_LEASE_TTL):
+            return False
+        self.store.upsert(
+            task_id,
+            nodeodm_task_id=nodeodm_task_id,
+            node_url=node_url,
+            status='processing',
+            stage='processing',
+            error=None,
+        )
+        self._track(task_id, nodeodm_task_id, node_url)
+        return True
+
+    def _track(self, task_id: str, nodeodm_task_id: str, node_url: Optional[str] = None) -> None:
+        """Start polling a task this worker holds the lease of, checking it on the next loop iteration"""
+        self._watched[task_id] = WatchedTask(task_id, nodeodm_task_id, node_url)
+        self.pool.pin(nodeodm_task_id, node_url)
+        self._wakeup.set()
+
+    def unwatch(self, task_id: str) -> None:
+        self._watched.pop(task_id, None)
+
+    def forget(self, task_id: str) -> None:
+        """Stop tracking a task in every worker and cancel its jobs, e.g. because it is being deleted"""
+        self._finish_attached(task_id, 'failed', "The task these results were reused from was deleted")
+        self.unwatch(task_id)
+        self.jobs.cancel_task(task_id)
+        self.store.remove(task_id)
+
+    def _record(self, task_id: str, **fields) -> None:
+        """Mirror a task's state into the shared store; finished tasks give up their lease"""
+        self.store.upsert(task_id, **fields)
+        if fields.get('status') in FINAL_STAGES:
+            self.store.release(task_lease(task_id), self.worker_id)
+
+    def attach(self, source_task_id: str, task_id: str) -> None:
+        """Have task_id follow an in-flight task's progress and receive its results when it completes"""
+        self.store.upsert(task_id, status='processing', stage='processing', reused_from=source_task_id)
+        latest = self.hub.latest(source_task_id)
+        if latest is not None:
+            self.hub.publish(task_id, latest)
+
+    def _publish(self, task_id: str, event: Dict) -> None:
+        """Publish an event for a task and every resubmission attached to it"""
+        self.hub.publish(task_id, event)
+        for attached_id in self.store.attached(task_id, ACTIVE_STATUSES):
+            self.hub.publish(attached_id, event)
+
+    def _complete_attached(self, task_id: str) -> None:
+        """Link a completed task's results into each attached resubmission"""
+        for attached_id in self.store.attached(task_id, ACTIVE_STATUSES):
+            try:
+                self.storage.link_results(task_id, attached_id)
+            except Exception as e:
+                LOGGER.exception(f"Failed to link results of task {task_id} into {attached_id}: {e}")
+                self.storage.update_manifest(attached_id, {'status': 'failed', 'error': str(e)})
+                self._record(attached_id, status='failed', stage='failed', error=str(e))
+                self.hub.publish(attached_id, {'stage': 'failed', 'status': 'failed', 'error': str(e)})
+                continue
+            self.storage.update_manifest(attached_id, {
+                'status': 'completed',
+                'completed_at': datetime.utcnow().isoformat(),
+            })
+            self._record(attached_id, status='completed', stage='completed', progress=100.0)
+            self.hub.publish(attached_id, {
+                'stage': 'completed',
+                'status': 'completed',
+                'progress': 100.0,
+                'results': self.storage.result_links(attached_id),
+            })
+
+    def _finish_attached(self, task_id: str, status: str, error: str = '') -> None:
+        for attached_id in self.store.attached(task_id, ACTIVE_STATUSES):
+            self.storage.update_manifest(attached_id, {
+                'status': status,
+                'error': error or '',
+                'completed_at': datetime.utcnow().isoformat(),
+            })
+            self._record(attached_id, status=status, stage=status, error=error or '')
+            self.hub.publish(attached_id, {'stage': status, 'status': status, 'error': error or ''})
+
+    def is_watched(self, task_id: str) -> bool:
+        return task_id in self._watched
+
+    def check_soon(self, task_id: str) -> None:
+        """Move a task's next status check forward, e.g. for a new progress subscriber"""
+        row = self.store.get(task_id)
+        if row and row['reused_from']:
+            task_id = row['reused_from']
+        watched = self._watched.get(task_id)
+        if watched is not None:
+            watched.next_check = time.monotonic()
+            self._wakeup.set()
+
+    def restore(self) -> int:
+        """
+        Record in-flight tasks from the manifests in RESULTS_DIR in the shared store and claim those no worker drives
+
+        Tasks left downloading get their download job queued again; that is
+        a no-op while the job is still queued or running.
+
+        Returns:
+            Number of tasks this worker claimed
+        """
+        waiting = []
+        for manifest in self.storage.iter_manifests():
+            if manifest.get('status') not in ACTIVE_STATUSES:
+                continue
+            if manifest.get('reused_from'):
+                waiting.append(manifest)
+            elif not manifest.get('nodeodm_task_id'):
+                continue
+            self.store.insert_missing(
+                manifest['task_id'],
+                nodeodm_task_id=manifest.get('nodeodm_task_id'),
+                node_url=manifest.get('node_url'),
+                status=manifest['status'],
+                stage=manifest['status'],
+                reused_from=manifest.get('reused_from'),
+            )
+            if manifest['status'] == 'downloading' and not manifest.get('reused_from'):
+                self._enqueue_download(manifest['task_id'], manifest['nodeodm_task_id'], manifest.get('node_url'))
+        for manifest in waiting:
+            # The source may have finished while the server was down
+            source_task_id = manifest['reused_from']
+            source = self.storage.read_manifest(source_task_id) or {}
+            if source.get('status') == 'completed':
+                self._complete_attached(source_task_id)
+            elif source.get('status') not in ACTIVE_STATUSES:
+                self._finish_attached(source_task_id, 'failed', source.get('error') or "Source task is gone")
+        restored = self._claim()
+        if restored:
+            LOGGER.info(f"Claimed {restored} in-flight tasks from the shared task store")
+        return restored
+
+    def _claim(self) -> int:
+        """Poll processing tasks whose lease lapsed, e.g. because the worker holding it stopped"""
+        claimed = 0
+        # Downloading tasks are driven by their job instead
+        for row in self.store.unowned(('processing',)):
+            if self.store.acquire(task_lease(row['task_id']), self.worker_id, settings.TASK_LEASE_TTL):
+                self._track(row['task_id'], row['nodeodm_task_id'], row['node_url'])
+                claimed += 1
+        return claimed
+
+    def _sync(self) -> None:
+        """Renew this worker's leases, let go of tasks it lost or that were deleted, and claim orphaned ones"""
+        held = self.store.renew(self.worker_id, settings.TASK_LEASE_TTL)
+        local = set(self._watched)
+        rows = self.store.get_many(local)
+        for task_id in local:
+            if task_lease(task_id) not in held or task_id not in rows:
+                LOGGER.warning(f"Task {task_id} is no longer driven by this worker")
+                self.unwatch(task_id)
+        claimed = self._claim()
+        if claimed:
+            LOGGER.info(f"Claimed {claimed} tasks whose worker stopped renewing its leases")
+
+    def _publish_followed(self) -> None:
+        """Publish store updates for streamed tasks that another worker drives"""
+        task_ids = [task_id for task_id in self.hub.subscribed() if not self.is_watched(task_id)]
+        self._followed = {task_id: state for task_id, state in self._followed.items() if task_id in task_ids}
+        rows = self.store.get_many(task_ids)
+        sources = self.store.get_many({
+            row['reused_from'] for row in rows.values() if row['reused_from'] and row['status'] in ACTIVE_STATUSES
+        })
+        for task_id, row in rows.items():
+            source = sources.get(row['reused_from']) if row['status'] in ACTIVE_STATUSES else None
+            if source and self.is_watched(source['task_id']):
+                # Published directly by this worker
+                continue
+            # Resubmissions show the progress of the task producing their results
+            current = source or row
+            state = (row['status'], current['stage'], current['node_status'], current['progress'], current['download_bytes'])
+            if self._followed.get(task_id) == state:
+                continue
+            self._followed[task_id] = state
+            self.hub.publish(task_id, self._row_event(row, current))
+
+    def _row_event(self, row: Dict, current: Dict) -> Dict:
+        """Progress event for a task from its shared store row"""
+        status = row['status']
+        if status == 'completed':
+            return {
+                'stage': 'completed',
+                'status': 'completed',
+                'progress': 100.0,
+                'results': self.storage.result_links(row['task_id']),
+            }
+        if status not in ACTIVE_STATUSES:
+            return {'stage': status, 'status': status, 'error': row['error'] or ''}
+        event = {
+            'stage': current['stage'] or status,
+            'status': current['node_status'] or status,
+            'progress': float(current['progress'] or 0),
+        }
+        if current['stage'] == 'downloading':
+            event['status'] = 'downloading'
+            event['downloaded_bytes'] = current['download_bytes'] or 0
+        return event
+
+    async def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        if self._follower is None or self._follower.done():
+            self._follower = asyncio.create_task(self._follow())
+
+    async def stop(self) -> None:
+        tasks = [t for t in [self._runner, self._follower] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+        self._follower = None
+        # Let the other workers claim this worker's tasks right away
+        self.store.release_all(self.worker_id)
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now >= self._next_sync:
+                self._next_sync = now + settings.TASK_LEASE_RENEW_INTERVAL
+                try:
+                    self._sync()
+                except Exception as e:
+                    LOGGER.exception(f"Supervisor lease renewal failed: {e}")
+
+            now = time.monotonic()
+            due = [w for w in self._watched.values() if w.next_check <= now]
+            if due:
+                try:
+                    await self._check_batch(due)
+                except Exception as e:
+                    LOGGER.exception(f"Supervisor batch check failed: {e}")
+
+            if self._watched:
+                delay = min(w.next_check for w in self._watched.values()) - time.monotonic()
+            else:
+                delay = settings.SUPERVISOR_MAX_INTERVAL
+            delay = max(min(delay, self._next_sync - time.monotonic()), 0.1)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _follow(self) -> None:
+        while True:
+            await asyncio.sleep(settings.PROGRESS_FOLLOW_INTERVAL)
+            try:
+                self._publish_followed()
+            except Exception as e:
+                LOGGER.exception(f"Following shared task state failed: {e}")
+
+    async def _check_batch(self, due: List[WatchedTask]) -> None:
+        """Check all due tasks using one task list call per node and bounded parallel info calls"""
+        by_node: Dict[Optional[str], List[WatchedTask]] = {}
+        for watched in due:
+            by_node.setdefault(watched.node_url, []).append(watched)
+        semaphore = asyncio.Semaphore(settings.SUPERVISOR_MAX_CONCURRENT_CHECKS)
+        await asyncio.gather(*(self._check_node(node_url, tasks, semaphore) for node_url, tasks in by_node.items()))
+
+    async def _check_node(self, node_url: Optional[str], due: List[WatchedTask], semaphore: asyncio.Semaphore) -> None:
+        client = self.pool.client_for(node_url)
+        try:
+            known = set(await client.task_list())
+        except NodeODMError as e:
+            LOGGER.warning(f"Supervisor could not list tasks on NodeODM node {node_url or 'default'}: {e}")
+            for watched in due:
+                self._backoff(watched)
+            return
+
+        async def check(watched: WatchedTask) -> None:
+            if watched.nodeodm_task_id not in known:
+                self._finish(watched, 'failed', "Task no longer exists on NodeODM")
+                return
+            async with semaphore:
+                try:
+                    info = await client.task_info(watched.nodeodm_task_id)
+                except NodeODMError as e:
+                    LOGGER.warning(f"Status check for task {watched.task_id} failed: {e}")
+                    self._backoff(watched)
+                    return
+            # Status lookups from viewers are answered from what the supervisor just fetched
+            self.cache.put(watched.nodeodm_task_id, info)
+            self._handle_info(watched, info)
+
+        await asyncio.gather(*(check(w) for w in due))
+
+    def _handle_info(self, watched: WatchedTask, info: TaskInfo) -> None:
+        LOGGER.info(f"Task {watched.task_id} status: {info.status} ({info.progress}%)")
+        self._record(watched.task_id, stage='processing', node_status=str(info.status), progress=float(info.progress or 0))
+        self._publish(watched.task_id, {
+            'stage': 'processing',
+            'status': str(info.status),
+            'progress': float(info.progress or 0),
+        })
+        if info.status == TaskStatus.COMPLETED:
+            self.unwatch(watched.task_id)
+            self._start_download(watched)
+            return
+        if info.status in (TaskStatus.FAILED, TaskStatus.CANCELED):
+            status = 'failed' if info.status == TaskStatus.FAILED else 'canceled'
+            self._finish(watched, status, info.last_error)
+            return
+
+        now = time.monotonic()
+        watched.status = 'queued' if info.status == TaskStatus.QUEUED else 'running'
+        watched.next_check = now + self._next_interval(watched, info, now)
+        watched.last_checked = now
+        watched.last_progress = float(info.progress or 0)
+        watched.errors = 0
+
+    def _next_interval(self, watched: WatchedTask, info: TaskInfo, now: float) -> float:
+        """Poll slowly while queued and faster as a running task approaches completion"""
+        if info.status == TaskStatus.QUEUED:
+            return settings.SUPERVISOR_QUEUED_INTERVAL
+
+        progress = float(info.progress or 0)
+        remaining = max(100.0 - progress, 0.0)
+        if watched.last_progress is not None and watched.last_checked is not None and progress > watched.last_progress:
+            # Aim for a few checks over the estimated time left
+            rate = (progress - watched.last_progress) / max(now - watched.last_checked, 0.001)
+            interval = remaining / rate / 4
+        else:
+            interval = settings.SUPERVISOR_MAX_INTERVAL * remaining / 100.0
+        return min(max(interval, settings.SUPERVISOR_MIN_INTERVAL), settings.SUPERVISOR_MAX_INTERVAL)
+
+    def _backoff(self, watched: WatchedTask) -> None:
+        watched.errors += 1
+        interval = settings.SUPERVISOR_MIN_INTERVAL * (2 ** watched.errors)
+        watched.next_check = time.monotonic() + min(interval, settings.SUPERVISOR_MAX_INTERVAL)
+
+    def _finish(self, watched: WatchedTask, status: str, error: str = '') -> None:
+        LOGGER.error(f"Task {watched.task_id} ended with status {status}. Error: {error}")
+        self.unwatch(watched.task_id)
+        self.storage.update_manifest(watched.task_id, {
+            'status': status,
+            'error': error or '',
+            'completed_at': datetime.utcnow().isoformat(),
+        })
+        self._record(watched.task_id, status=status, stage=status, error=error or '')
+        self.hub.publish(watched.task_id, {'stage': status, 'status': status, 'error': error or ''})
+        self._finish_attached(watched.task_id, status, error)
+
+    def _start_download(self, watched: WatchedTask) -> None:
+        """Hand a task NodeODM finished to a job worker, which downloads and post-processes its assets"""
+        self.storage.update_manifest(watched.task_id, {'status': 'downloading'})
+        self._record(watched.task_id, status='downloading', stage='downloading', progress=100.0, download_bytes=0)
+        self._publish(watched.task_id, {'stage': 'downloading', 'status': 'downloading', 'progress': 100.0})
+        self._enqueue_download(watched.task_id, watched.nodeodm_task_id, watched.node_url)
+        # Nothing is left to poll; the job carries the task from here
+        self.store.release(task_lease(watched.task_id), self.worker_id)
+
+    def _enqueue_download(self, task_id: str, nodeodm_task_id: str, node_url: Optional[str]) -> int:
+        return self.jobs.enqueue(
+            'download',
+            {'task_id': task_id, 'nodeodm_task_id': nodeodm_task_id, 'node_url': node_url},
+            task_id=task_id,
+            priority=DOWNLOAD_JOB_PRIORITY,
+        )
+
+    async def run_download(self, payload: Dict) -> None:
+        """
+        Download job: fetch and post-process a finished task's assets, then complete it
+
+        Raises on failure so the job queue retries it; progress is written to
+        the shared task store, from which the API streams it. Deleting the
+        task cancels the job, which another worker may be running; that is
+        checked with each progress update and before the task is completed,
+        and the files written so far are removed.
+        """
+        task_id = payload['task_id']
+        reported = 0.0
+
+        def check_canceled() -> None:
+            if not self.jobs.is_active('download', task_id):
+                raise DownloadCanceled(task_id)
+
+        def on_progress(downloaded: int) -> None:
+            nonlocal reported
+            now = time.monotonic()
+            if now - reported < DOWNLOAD_PROGRESS_INTERVAL:
+                return
+            reported = now
+            check_canceled()
+            self._record(task_id, download_bytes=downloaded)
+
+        LOGGER.info(f"Downloading assets for task {task_id}")
+        try:
+            await self.storage.download_assets(
+                payload['nodeodm_task_id'],
+                task_id,
+                client=self.pool.client_for(payload.get('node_url')),
+                on_progress=on_progress,
+            )
+            check_canceled()
+        except DownloadCanceled:
+            LOGGER.info(f"Task {task_id} was deleted during its download; discarding its files")
+            await asyncio.to_thread(shutil.rmtree, self.storage.results_dir / task_id, True)
+            self.store.remove(task_id)
+            return
+        self.storage.update_manifest(task_id, {
+            'status': 'completed',
+            'completed_at': datetime.utcnow().isoformat(),
+        })
+        self._record(task_id, status='completed', stage='completed')
+        self.hub.publish(task_id, {
+            'stage': 'completed',
+            'status': 'completed',
+            'progress': 100.0,
+            'results': self.storage.result_links(task_id),
+        })
+        self._complete_attached(task_id)
+        if settings.TILES_AT_INGEST:
+            self.jobs.enqueue('tiles', {'task_id': task_id}, task_id=task_id, priority=TILES_JOB_PRIORITY)
+
+    def fail_download(self, payload: Dict, error: str) -> None:
+        """Mark a task failed once its download job has run out of attempts"""
+        task_id = payload['task_id']
+        self.storage.update_manifest(task_id, {'status': 'failed', 'error': error})
+        self._record(task_id, status='failed', stage='failed', error=error)
+        self.hub.publish(task_id, {'stage': 'failed', 'status': 'failed', 'error': error})
+        self._finish_attached(task_id, 'failed', error)
+
+
+# Create supervisor instance
+task_supervisor = TaskSupervisor()
+TASKS_IN_FLIGHT.set_function(task_supervisor.status_counts)
@@ -0,0 +1,394 @@
+"""
+Tile pyramid service for serving orthophotos in viewer-sized pieces
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, ContextManager, Dict, List, Optional
+
+from PIL import Image
+
+try:
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+except ImportError:  # Windowed tile rendering needs the optional 'geo' extra
+    rasterio = None
+
+from ..core.config import settings
+from .file_lock import file_lock
+from .file_storage import FileStorageService, file_storage_service
+from .rasters import RASTERS
+
+LOGGER = logging.getLogger(__name__)
+
+# Orthophotos are trusted pipeline output and routinely exceed Pillow's bomb limit
+Image.MAX_IMAGE_PIXELS = None
+
+METADATA_FILENAME = "tiles.json"
+# Minimum seconds between access-time updates of a cached pyramid
+TOUCH_INTERVAL = 60
+# Orthophoto PNG relative to the task's results directory
+ORTHOPHOTO_PNG = Path("odm_orthophoto") / "odm_orthophoto.png"
+
+
+class TileService:
+    """
+    Builds and serves an XYZ-style tile pyramid for each task's orthophoto
+
+    Zoom 0 fits the whole orthophoto in one tile and the highest zoom is full
+    resolution. With the optional 'geo' extra, tiles are read window by
+    window from the orthophoto GeoTIFF (from its closest COG overview) and
+    rendered on first request, so memory stays at a few tiles and the first
+    tile does not wait for the rest. Without it the orthophoto PNG is decoded
+    once and cut into a whole pyramid. Pyramids live in TILE_CACHE_DIR
+    (prepared under a per-task file lock, so worker processes never build
+    the same one twice) and whole pyramids are evicted least recently used
+    first once the cache grows past TILE_CACHE_MAX_BYTES.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[FileStorageService] = None,
+        cache_dir: Optional[Path] = None,
+        max_bytes: Optional[int] = None,
+        tile_size: Optional[int] = None,
+    ):
+        self.storage = storage or file_storage_service
+        self.cache_dir = Path(cache_dir or settings.TILE_CACHE_DIR)
+        self.max_bytes = max_bytes or settings.TILE_CACHE_MAX_BYTES
+        self.tile_size = tile_size or settings.TILE_SIZE
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._touched: Dict[str, float] = {}
+        self._builds: Dict[str, asyncio.Task] = {}
+
+    def pyramid_dir(self, task_id: str) -> Path:
+        return self.cache_dir / task_id
+
+    def _index(self) -> "OrderedDict[str, int]":
+        """Load cached pyramid sizes ordered by last access"""
+        if self._entries is None:
+            entries = []
+            if self.cache_dir.exists():
+                for pyramid in self.cache_dir.iterdir():
+                    metadata = pyramid / METADATA_FILENAME
+                    if pyramid.is_dir() and metadata.exists():
+                        # Tiles rendered on demand are not counted in the metadata
+                        size = sum(path.stat().st_size for path in pyramid.rglob("*.png"))
+                        entries.append((metadata.stat().st_mtime, pyramid.name, size))
+            self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        return self._entries
+
+    def _read_metadata(self, task_id: str) -> Optional[Dict[str, Any]]:
+        metadata_path = self.pyramid_dir(task_id) / METADATA_FILENAME
+        if not metadata_path.exists():
+            return None
+        try:
+            return json.loads(metadata_path.read_text())
+        except Exception as e:
+            LOGGER.warning(f"Unreadable tile metadata for task {task_id}: {e}")
+            return None
+
+    def _sources(self, task_id: str) -> List[Path]:
+        """Orthophotos tiles can be cut from, preferring the GeoTIFF when it can be read by window"""
+        task_dir = self.storage.results_dir / task_id
+        candidates = [ORTHOPHOTO_PNG]
+        if rasterio is not None:
+            candidates.insert(0, RASTERS['orthophoto'])
+        return [task_dir / path for path in candidates if (task_dir / path).exists()]
+
+    def _is_current(self, task_id: str, metadata: Optional[Dict[str, Any]]) -> bool:
+        if not metadata or 'source' not in metadata:
+            return False
+        try:
+            stat = (self.storage.results_dir / task_id / metadata['source']).stat()
+        except OSError:
+            return False
+        return metadata.get('source_size') == stat.st_size and metadata.get('source_mtime') == stat.st_mtime
+
+    def _touch(self, task_id: str) -> None:
+        index = self._index()
+        if task_id in index:
+            index.move_to_end(task_id)
+        now = time.time()
+        if now - self._touched.get(task_id, 0) > TOUCH_INTERVAL:
+            self._touched[task_id] = now
+            metadata_path = self.pyramid_dir(task_id) / METADATA_FILENAME
+            if metadata_path.exists():
+                metadata_path.touch()
+
+    def _locked(self, task_id: str) -> ContextManager[None]:
+        """Hold a task's pyramid lock, shared with every process using the cache directory"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        return file_lock(self.cache_dir / f".{task_id}.lock")
+
+    async def ensure_pyramid(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return pyramid metadata for a task, preparing the pyramid if needed
+
+        Concurrent callers for the same task share one preparation, and other
+        processes wait on the task's lock instead of repeating it.
+
+        Returns:
+            Metadata dictionary, or None if the task has no orthophoto
+        """
+        sources = self._sources(task_id)
+        if not sources:
+            return None
+        metadata = self._read_metadata(task_id)
+        if self._is_current(task_id, metadata):
+            self._touch(task_id)
+            return metadata
+
+        build = self._builds.get(task_id)
+        if build is None:
+            build = asyncio.create_task(self._build(task_id, sources))
+            self._builds[task_id] = build
+            build.add_done_callback(lambda _: self._builds.pop(task_id, None))
+        return await asyncio.shield(build)
+
+    async def _build(self, task_id: str, sources: List[Path]) -> Optional[Dict[str, Any]]:
+        started = time.monotonic()
+        metadata = await asyncio.to_thread(self._prepare, task_id, sources)
+        if metadata is None:
+            return None
+
+        index = self._index()
+        index[task_id] = metadata['bytes']
+        index.move_to_end(task_id)
+        self._evict(keep=task_id)
+        LOGGER.info(
+            f"Prepared tile pyramid for task {task_id} ({metadata['max_zoom'] + 1} levels, "
+            f"{'on demand' if metadata['windowed'] else 'prebuilt'}) in {time.monotonic() - started:.1f}s"
+        )
+        return metadata
+
+    def _prepare(self, task_id: str, sources: List[Path]) -> Optional[Dict[str, Any]]:
+        """Write a pyramid's metadata, cutting every tile when the source cannot be read by window"""
+        with self._locked(task_id):
+            metadata = self._read_metadata(task_id)
+            if self._is_current(task_id, metadata):
+                # Another process prepared it while this one waited for the lock
+                return metadata
+            for source in sources:
+                described = describe_source(source)
+                if described is not None:
+                    break
+            else:
+                return None
+
+            target = self.pyramid_dir(task_id)
+            relative = str(source.relative_to(self.storage.results_dir / task_id))
+            if described['windowed']:
+                shutil.rmtree(target, ignore_errors=True)
+                target.mkdir(parents=True)
+                metadata = pyramid_metadata(described['width'], described['height'], self.tile_size, source, relative, windowed=True)
+                _write_json(target / METADATA_FILENAME, metadata)
+                return metadata
+
+            staging = self.cache_dir / f".{task_id}.building"
+            shutil.rmtree(staging, ignore_errors=True)
+            metadata = build_pyramid(source, staging, self.tile_size, relative)
+            shutil.rmtree(target, ignore_errors=True)
+            staging.replace(target)
+            return metadata
+
+    def _evict(self, keep: str) -> None:
+        index = self._index()
+        total = sum(index.values())
+        for task_id in list(index):
+            if total <= self.max_bytes:
+                break
+            if task_id == keep or task_id in self._builds:
+                continue
+            total -= index.pop(task_id)
+            shutil.rmtree(self.pyramid_dir(task_id), ignore_errors=True)
+            LOGGER.info(f"Evicted tile pyramid for task {task_id}")
+
+    def _added(self, task_id: str, size: int) -> None:
+        index = self._index()
+        index[task_id] = index.get(task_id, 0) + size
+        index.move_to_end(task_id)
+        self._evict(keep=task_id)
+
+    async def get_tile(self, task_id: str, z: int, x: int, y: int) -> Optional[Path]:
+        """Return the path of one tile, rendering it if needed, or None if the task or tile does not exist"""
+        metadata = await self.ensure_pyramid(task_id)
+        if not metadata or not 0 <= z <= metadata['max_zoom']:
+            return None
+        level = metadata['levels'][z]
+        if not (0 <= x < level['cols'] and 0 <= y < level['rows']):
+            return None
+        tile_path = self.pyramid_dir(task_id) / str(z) / str(x) / f"{y}.png"
+        if tile_path.exists():
+            return tile_path
+        if not metadata['windowed']:
+            return None
+        source = self.storage.results_dir / task_id / metadata['source']
+        self._added(task_id, await asyncio.to_thread(render_tile, source, metadata, z, x, y, tile_path))
+        return tile_path
+
+    async def prerender(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Prepare a task's pyramid and render every tile not rendered yet (TILES_AT_INGEST)"""
+        metadata = await self.ensure_pyramid(task_id)
+        if not metadata or not metadata['windowed']:
+            return metadata
+
+        def render_missing() -> int:
+            source = self.storage.results_dir / task_id / metadata['source']
+            rendered = 0
+            for level in metadata['levels']:
+                for x in range(level['cols']):
+                    for y in range(level['rows']):
+                        tile_path = self.pyramid_dir(task_id) / str(level['z']) / str(x) / f"{y}.png"
+                        if not tile_path.exists():
+                            rendered += render_tile(source, metadata, level['z'], x, y, tile_path)
+            return rendered
+
+        self._added(task_id, await asyncio.to_thread(render_missing))
+        return metadata
+
+    def invalidate(self, task_id: str) -> None:
+        """Drop a task's cached pyramid"""
+        self._index().pop(task_id, None)
+        shutil.rmtree(self.pyramid_dir(task_id), ignore_errors=True)
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    partial = path.with_name(f".{path.name}.{os.getpid()}.part")
+    partial.write_text(json.dumps(data))
+    partial.replace(path)
+
+
+def describe_source(source: Path) -> Optional[Dict[str, Any]]:
+    """
+    Size of an orthophoto and whether tiles can be read from it by window
+
+    GeoTIFFs qualify when rasterio is installed and they hold 8-bit bands;
+    other images are only read through their header here. Returns None for
+    a source tiles cannot be cut from.
+    """
+    if source.suffix.lower() in ('.tif', '.tiff'):
+        if rasterio is None:
+            return None
+        with rasterio.open(source) as src:
+            if src.dtypes[0] != 'uint8':
+                return None
+            return {'width': src.width, 'height': src.height, 'windowed': True}
+    with Image.open(source) as image:
+        return {'width': image.width, 'height': image.height, 'windowed': False}
+
+
+def pyramid_metadata(width: int, height: int, tile_size: int, source: Path, relative: str, windowed: bool, total_bytes: int = 0) -> Dict[str, Any]:
+    """Zoom levels of a pyramid; each level halves the one above it, rounding up"""
+    stat = source.stat()
+    max_zoom = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+    levels = []
+    for z in range(max_zoom + 1):
+        scale = 2 ** (max_zoom - z)
+        level_width, level_height = math.ceil(width / scale), math.ceil(height / scale)
+        levels.append({
+            'z': z,
+            'width': level_width,
+            'height': level_height,
+            'cols': math.ceil(level_width / tile_size),
+            'rows': math.ceil(level_height / tile_size),
+        })
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'min_zoom': 0,
+        'max_zoom': max_zoom,
+        'levels': levels,
+        'bytes': total_bytes,
+        'windowed': windowed,
+        'source': relative,
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+    }
+
+
+def render_tile(source: Path, metadata: Dict[str, Any], z: int, x: int, y: int, target: Path) -> int:
+    """
+    Read one tile's window of a GeoTIFF and write it as a PNG; returns its size in bytes
+
+    The window is read straight at the tile's resolution, so GDAL uses the
+    closest COG overview and only the blocks under the tile are decoded.
+    Edge tiles are padded with transparency to the full tile size.
+    """
+    tile_size = metadata['tile_size']
+    scale = 2 ** (metadata['max_zoom'] - z)
+    level = metadata['levels'][z]
+    col_off, row_off = x * tile_size * scale, y * tile_size * scale
+    window = Window(
+        col_off, row_off,
+        min(tile_size * scale, metadata['width'] - col_off),
+        min(tile_size * scale, metadata['height'] - row_off),
+    )
+    width = min(tile_size, level['width'] - x * tile_size)
+    height = min(tile_size, level['height'] - y * tile_size)
+    with rasterio.open(source) as src:
+        indexes = [1, 2, 3] if src.count >= 3 else [1]
+        data = src.read(indexes, window=window, out_shape=(len(indexes), height, width), resampling=Resampling.average)
+        mask = src.dataset_mask(window=window, out_shape=(height, width))
+    bands = [Image.frombytes('L', (width, height), band.tobytes()) for band in data]
+    if len(bands) == 1:
+        bands *= 3
+    tile = Image.new('RGBA', (tile_size, tile_size), (0, 0, 0, 0))
+    tile.paste(Image.merge('RGBA', (*bands, Image.frombytes('L', (width, height), mask.tobytes()))), (0, 0))
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Another process may render the same tile; whichever finishes last wins, both are identical
+    partial = target.with_name(f".{target.name}.{os.getpid()}.part")
+    tile.save(partial, format='PNG')
+    partial.replace(target)
+    return target.stat().st_size
+
+
+def build_pyramid(source: Path, target: Path, tile_size: int, relative: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Cut an image into a full tile pyramid under target/{z}/{x}/{y}.png
+
+    The source is decoded once in its own mode and tiles are converted to
+    RGBA one at a time; each lower zoom level is produced by halving the
+    previous one, so no level is resampled from full resolution twice.
+    """
+    total_bytes = 0
+    image = Image.open(source)
+    # Loading a single-frame image releases its file handle
+    level = image if image.mode in ('RGB', 'RGBA', 'L', 'LA') else image.convert('RGBA')
+    level.load()
+    width, height = level.size
+    metadata = pyramid_metadata(width, height, tile_size, source, relative or source.name, windowed=False)
+
+    for z in range(metadata['max_zoom'], -1, -1):
+        level_width, level_height = level.size
+        for x in range(metadata['levels'][z]['cols']):
+            column_dir = target / str(z) / str(x)
+            column_dir.mkdir(parents=True, exist_ok=True)
+            for y in range(metadata['levels'][z]['rows']):
+                box = (x * tile_size, y * tile_size, min((x + 1) * tile_size, level_width), min((y + 1) * tile_size, level_height))
+                tile = Image.new('RGBA', (tile_size, tile_size), (0, 0, 0, 0))
+                # Edge tiles are padded with transparency to the full tile size
+                tile.paste(level.crop(box).convert('RGBA'), (0, 0))
+                tile_path = column_dir / f"{y}.png"
+                tile.save(tile_path, format='PNG')
+                total_bytes += tile_path.stat().st_size
+        if z:
+            level = level.reduce(2)
+
+    metadata['bytes'] = total_bytes
+    (target / METADATA_FILENAME).write_text(json.dumps(metadata))
+    return metadata
+
+
+# Create service instance
+tile_service = TileService()
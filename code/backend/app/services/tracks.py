@@ -0,0 +1,397 @@
+"""
+Robot track storage in append-only columnar files with time, bbox and simplified queries
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import math
+import mmap
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, ContextManager, Dict, List, Optional, Sequence, Tuple
+
+from ..core.config import settings
+from .file_lock import file_lock
+
+LOGGER = logging.getLogger(__name__)
+
+# Column name -> array typecode; each column is a raw native-endian array file, 32 bytes per sample
+COLUMNS = {'t': 'd', 'lat': 'd', 'lon': 'd', 'heading': 'f', 'speed': 'f'}
+META_FILENAME = "track.json"
+LOCK_FILENAME = ".lock"
+# Metres per degree of latitude, and of longitude at the equator
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+# Simplified results kept in memory; appends change the sample count and so miss the cache
+SIMPLIFIED_CACHE_SIZE = 32
+
+
+class TrackError(ValueError):
+    """Raised for malformed samples or queries"""
+
+
+class Samples:
+    """A batch of samples held column-wise in typed arrays"""
+
+    def __init__(self):
+        self.columns: Dict[str, array] = {name: array(code) for name, code in COLUMNS.items()}
+
+    def __len__(self) -> int:
+        return len(self.columns['t'])
+
+    def append(self, t: float, lat: float, lon: float, heading: float = math.nan, speed: float = math.nan) -> None:
+        for name, value in zip(COLUMNS, (t, lat, lon, heading, speed)):
+            self.columns[name].append(value)
+
+    def take(self, indices: Sequence[int]) -> "Samples":
+        taken = Samples()
+        for name, column in self.columns.items():
+            taken.columns[name] = array(COLUMNS[name], (column[i] for i in indices))
+        return taken
+
+    def to_dict(self) -> Dict[str, List[Optional[float]]]:
+        """JSON-ready columns; NaN headings and speeds become null"""
+        return {
+            name: [None if value != value else value for value in column.tolist()]
+            for name, column in self.columns.items()
+        }
+
+
+def parse_sample(line: str) -> Tuple[float, float, float, float, float]:
+    """
+    Parse one sample line
+
+    Lines are either JSON objects with t, lat, lon and optional heading and
+    speed, or the same values comma-separated in that order.
+    """
+    try:
+        if line.startswith('{'):
+            record = json.loads(line)
+            values = [record['t'], record['lat'], record['lon'], record.get('heading'), record.get('speed')]
+        else:
+            values = line.split(',')
+            values += [None] * (5 - len(values))
+            if len(values) != 5:
+                raise ValueError
+        t, lat, lon, heading, speed = (math.nan if value in (None, '') else float(value) for value in values)
+    except (ValueError, KeyError, TypeError):
+        raise TrackError(f"Malformed sample: {line[:100]}")
+    if not (math.isfinite(t) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        raise TrackError(f"Sample out of range: {line[:100]}")
+    return t, lat, lon, heading, speed
+
+
+def simplify(xs: Sequence[float], ys: Sequence[float], tolerance: float) -> List[int]:
+    """
+    Indices of the points kept by a radial distance pass followed by Douglas-Peucker
+
+    The radial pass drops points within tolerance of the last kept one,
+    which removes most of a high-rate track in linear time before the
+    Douglas-Peucker pass. Coordinates are planar and in the tolerance's units.
+    """
+    count = len(xs)
+    if count <= 2 or tolerance <= 0:
+        return list(range(count))
+    squared = tolerance * tolerance
+    radial = [0]
+    for i in range(1, count - 1):
+        last = radial[-1]
+        if (xs[i] - xs[last]) ** 2 + (ys[i] - ys[last]) ** 2 > squared:
+            radial.append(i)
+    radial.append(count - 1)
+
+    keep = [False] * len(radial)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(radial) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[radial[first]], ys[radial[first]]
+        dx, dy = xs[radial[last]] - ax, ys[radial[last]] - ay
+        length = dx * dx + dy * dy
+        worst, worst_distance = -1, squared
+        for k in range(first + 1, last):
+            px, py = xs[radial[k]] - ax, ys[radial[k]] - ay
+            if length:
+                # Squared distance to the segment
+                u = min(max((px * dx + py * dy) / length, 0.0), 1.0)
+                ex, ey = px - u * dx, py - u * dy
+            else:
+                ex, ey = px, py
+            distance = ex * ex + ey * ey
+            if distance > worst_distance:
+                worst, worst_distance = k, distance
+        if worst != -1:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [radial[k] for k in range(len(radial)) if keep[k]]
+
+
+class TrackService:
+    """
+    Stores robot GPS/odometry tracks for drawing over orthophotos
+
+    Each track is a directory with one append-only file per column (see
+    COLUMNS) and a small JSON metadata file. Samples are kept in time order,
+    so time ranges are found by binary search over the memory-mapped
+    timestamp column and only the matching slice of each column is read.
+    Appends take a file lock, so several API workers can write to one track.
+    """
+
+    def __init__(self, tracks_dir: Optional[Path] = None):
+        self.tracks_dir = Path(tracks_dir or settings.TRACKS_DIR)
+        self.tracks_dir.mkdir(parents=True, exist_ok=True)
+        self._simplified: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _track_dir(self, track_id: str) -> Path:
+        if not track_id or Path(track_id).name != track_id or track_id in ('.', '..'):
+            raise TrackError(f"Invalid track ID: {track_id}")
+        return self.tracks_dir / track_id
+
+    def _meta_path(self, track_id: str) -> Path:
+        return self._track_dir(track_id) / META_FILENAME
+
+    def create(self, name: Optional[str] = None, task_id: Optional[str] = None) -> Dict[str, Any]:
+        track_id = str(uuid.uuid4())
+        self._track_dir(track_id).mkdir(parents=True)
+        meta = {
+            'track_id': track_id,
+            'name': name,
+            'task_id': task_id,
+            'created_at': datetime.utcnow().isoformat(),
+            'count': 0,
+            'start': None,
+            'end': None,
+            'bbox': None,
+        }
+        self._write_meta(track_id, meta)
+        return meta
+
+    def get(self, track_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self._meta_path(track_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def list(self, task_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        tracks = []
+        for path in sorted(self.tracks_dir.glob(f"*/{META_FILENAME}")):
+            meta = self.get(path.parent.name)
+            if meta and (task_id is None or meta.get('task_id') == task_id):
+                tracks.append(meta)
+        return sorted(tracks, key=lambda meta: meta['created_at'], reverse=True)
+
+    def delete(self, track_id: str) -> bool:
+        track_dir = self._track_dir(track_id)
+        if not track_dir.is_dir():
+            return False
+        with self._locked(track_id):
+            for path in track_dir.iterdir():
+                if path.name != LOCK_FILENAME:
+                    path.unlink()
+        (track_dir / LOCK_FILENAME).unlink(missing_ok=True)
+        track_dir.rmdir()
+        return True
+
+    def _write_meta(self, track_id: str, meta: Dict[str, Any]) -> None:
+        path = self._meta_path(track_id)
+        partial = path.with_name(path.name + ".part")
+        partial.write_text(json.dumps(meta))
+        partial.replace(path)
+
+    def _locked(self, track_id: str) -> ContextManager[None]:
+        return file_lock(self._track_dir(track_id) / LOCK_FILENAME)
+
+    def _count(self, track_id: str) -> int:
+        """Samples stored in every column; a write cut short leaves some columns longer"""
+        track_dir = self._track_dir(track_id)
+        counts = []
+        for name, code in COLUMNS.items():
+            path = track_dir / f"{name}.bin"
+            counts.append(path.stat().st_size // array(code).itemsize if path.exists() else 0)
+        return min(counts)
+
+    def append(self, track_id: str, samples: Samples) -> Dict[str, int]:
+        """
+        Append a batch of samples, sorted by time
+
+        Samples older than the last stored one are dropped so the track stays
+        ordered for binary search.
+
+        Returns:
+            Counts of stored and dropped samples and the track's new length
+        """
+        if self.get(track_id) is None:
+            raise KeyError(track_id)
+        order = sorted(range(len(samples)), key=samples.columns['t'].__getitem__)
+        track_dir = self._track_dir(track_id)
+        with self._locked(track_id):
+            meta = self.get(track_id)
+            count = self._count(track_id)
+            last = self._read_column(track_id, 't', count - 1, count)[0] if count else -math.inf
+            order = [i for i in order if samples.columns['t'][i] >= last]
+            batch = samples.take(order)
+            for name, column in batch.columns.items():
+                path = track_dir / f"{name}.bin"
+                with open(path, 'r+b' if path.exists() else 'wb') as f:
+                    # Drop the tail of an earlier write that was cut short
+                    f.truncate(count * column.itemsize)
+                    f.seek(0, 2)
+                    column.tofile(f)
+            if len(batch):
+                lats, lons = batch.columns['lat'], batch.columns['lon']
+                bbox = [min(lons), min(lats), max(lons), max(lats)]
+                if meta['bbox']:
+                    bbox = [
+                        min(bbox[0], meta['bbox'][0]), min(bbox[1], meta['bbox'][1]),
+                        max(bbox[2], meta['bbox'][2]), max(bbox[3], meta['bbox'][3]),
+                    ]
+                meta.update({
+                    'count': count + len(batch),
+                    'start': meta['start'] if count else batch.columns['t'][0],
+                    'end': batch.columns['t'][-1],
+                    'bbox': bbox,
+                })
+                self._write_meta(track_id, meta)
+        return {'stored': len(batch), 'dropped': len(samples) - len(batch), 'count': count + len(batch)}
+
+    def _read_column(self, track_id: str, name: str, start: int, stop: int) -> array:
+        column = array(COLUMNS[name])
+        with open(self._track_dir(track_id) / f"{name}.bin", 'rb') as f:
+            f.seek(start * column.itemsize)
+            column.fromfile(f, stop - start)
+        return column
+
+    def _time_slice(self, track_id: str, count: int, start: Optional[float], end: Optional[float]) -> Tuple[int, int]:
+        """Sample index range with start <= t <= end, found by binary search over the mapped timestamps"""
+        if count == 0 or (start is None and end is None):
+            return 0, count
+        with open(self._track_dir(track_id) / "t.bin", 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped).cast('d')
+            try:
+                lo = bisect.bisect_left(view, start, 0, count) if start is not None else 0
+                hi = bisect.bisect_right(view, end, lo, count) if end is not None else count
+            finally:
+                view.release()
+        return lo, hi
+
+    def read(
+        self,
+        track_id: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        bbox: Optional[Sequence[float]] = None,
+    ) -> Samples:
+        """Samples between start and end (unix seconds, inclusive) inside bbox (min lon, min lat, max lon, max lat)"""
+        if self.get(track_id) is None:
+            raise KeyError(track_id)
+        count = self._count(track_id)
+        lo, hi = self._time_slice(track_id, count, start, end)
+        samples = Samples()
+        if hi <= lo:
+            return samples
+        for name in COLUMNS:
+            samples.columns[name] = self._read_column(track_id, name, lo, hi)
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            lats, lons = samples.columns['lat'], samples.columns['lon']
+            samples = samples.take([
+                i for i in range(len(samples))
+                if min_lat <= lats[i] <= max_lat and min_lon <= lons[i] <= max_lon
+            ])
+        return samples
+
+    def simplified(
+        self,
+        track_id: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        bbox: Optional[Sequence[float]] = None,
+        tolerance: float = 0.0,
+        max_points: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Samples reduced with Douglas-Peucker for drawing
+
+        tolerance is in metres. While the result has more than max_points
+        (capped at TRACK_MAX_POINTS) samples the tolerance is doubled,
+        starting from TRACK_MIN_TOLERANCE if none was given. Results are
+        cached until the track grows.
+
+        Returns:
+            {'tolerance': tolerance used, 'total': samples before simplification, 'samples': Samples}
+        """
+        # Simplification always keeps both ends
+        max_points = max(min(max_points or settings.TRACK_MAX_POINTS, settings.TRACK_MAX_POINTS), 2)
+        key = (track_id, self._count(track_id), start, end, tuple(bbox) if bbox else None, tolerance, max_points)
+        with self._cache_lock:
+            if key in self._simplified:
+                self._simplified.move_to_end(key)
+                return self._simplified[key]
+
+        samples = self.read(track_id, start, end, bbox)
+        lats, lons = samples.columns['lat'], samples.columns['lon']
+        if len(samples):
+            # Local equirectangular projection; plenty accurate over a field
+            scale = METERS_PER_DEGREE_LON * math.cos(math.radians(sum(lats) / len(lats)))
+            xs = [lon * scale for lon in lons]
+            ys = [lat * METERS_PER_DEGREE_LAT for lat in lats]
+        else:
+            xs = ys = []
+        indices = simplify(xs, ys, tolerance)
+        while len(indices) > max_points:
+            tolerance = tolerance * 2 if tolerance > 0 else settings.TRACK_MIN_TOLERANCE
+            indices = simplify(xs, ys, tolerance)
+        result = {'tolerance': tolerance, 'total': len(samples), 'samples': samples.take(indices)}
+
+        with self._cache_lock:
+            self._simplified[key] = result
+            while len(self._simplified) > SIMPLIFIED_CACHE_SIZE:
+                self._simplified.popitem(last=False)
+        return result
+
+    async def ingest(self, track_id: str, lines: AsyncIterator[str]) -> Dict[str, int]:
+        """
+        Append samples from a stream of lines in batches of TRACK_BATCH_SIZE
+
+        Blank lines are skipped; a malformed line fails the request after the
+        samples before it have been stored.
+        """
+        totals = {'received': 0, 'stored': 0, 'dropped': 0, 'count': 0}
+        batch = Samples()
+
+        async def flush() -> None:
+            nonlocal batch
+            result = await asyncio.to_thread(self.append, track_id, batch)
+            totals['stored'] += result['stored']
+            totals['dropped'] += result['dropped']
+            totals['count'] = result['count']
+            batch = Samples()
+
+        async for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(*parse_sample(line))
+            except TrackError:
+                if len(batch):
+                    await flush()
+                raise
+            totals['received'] += 1
+            if len(batch) >= settings.TRACK_BATCH_SIZE:
+                await flush()
+        await flush()
+        return totals
+
+
+# Create service instance
+track_service = TrackService()
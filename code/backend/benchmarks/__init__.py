@@ -0,0 +1,3 @@
+"""
+Load and performance benchmarks for the Drone Imagery API
+"""
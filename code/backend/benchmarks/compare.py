@@ -0,0 +1,64 @@
+"""
+Compare two benchmark result files metric by metric
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+# Metrics where a larger number is an improvement; everything else is better when smaller
+HIGHER_IS_BETTER = ('per_second',)
+# Descriptive numbers that are inputs to a scenario rather than results
+SKIPPED = ('count', 'images', 'bytes', 'tasks', 'concurrency')
+
+
+def flatten(scenarios: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in scenarios.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in SKIPPED:
+            yield name, float(value)
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any]) -> Iterator[Tuple[str, float, float, float, bool]]:
+    """
+    Yield (metric, baseline, candidate, change, improved) for metrics in both runs
+
+    change is the relative difference from the baseline.
+    """
+    before = dict(flatten(baseline['scenarios']))
+    for name, after in flatten(candidate['scenarios']):
+        if name not in before or not before[name]:
+            continue
+        change = (after - before[name]) / before[name]
+        higher_is_better = any(marker in name for marker in HIGHER_IS_BETTER)
+        yield name, before[name], after, change, (change > 0) == higher_is_better
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression")
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+    regressions = 0
+    for name, before, after, change, improved in compare(baseline, candidate):
+        flag = ''
+        if abs(change) >= args.threshold:
+            flag = 'better' if improved else 'REGRESSION'
+            regressions += not improved
+        print(f"{name:55} {before:>12.3f} {after:>12.3f} {change:>+8.1%} {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Local stand-in for NodeODM with configurable latency and asset sizes
+
+Implements the subset of the NodeODM REST API the backend uses. Tasks move
+from QUEUED to RUNNING when committed and complete processing_time seconds
+later; every task serves the same generated all.zip holding an orthophoto
+PNG and a report.
+"""
+
+import argparse
+import asyncio
+import io
+import re
+import time
+import uuid
+import zipfile
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from PIL import Image
+
+UUID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+QUEUED, RUNNING, FAILED, COMPLETED, CANCELED = 10, 20, 30, 40, 50
+
+
+def build_archive(orthophoto_size: int, report_bytes: int) -> bytes:
+    """all.zip with a noise orthophoto of orthophoto_size x orthophoto_size pixels and a report"""
+    buffer = io.BytesIO()
+    image = Image.effect_noise((orthophoto_size, orthophoto_size), 48).convert('RGB')
+    png = io.BytesIO()
+    image.save(png, format='PNG', compress_level=1)
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr("odm_orthophoto/odm_orthophoto.png", png.getvalue())
+        archive.writestr("odm_report/report.pdf", b"%PDF-1.4\n" + b"0" * max(report_bytes - 9, 0))
+    return buffer.getvalue()
+
+
+class FakeNode:
+    """In-memory task table of the stand-in node"""
+
+    def __init__(self, processing_time: float, archive: bytes, max_parallel_tasks: int = 2):
+        self.processing_time = processing_time
+        self.archive = archive
+        self.max_parallel_tasks = max_parallel_tasks
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.calls: Counter = Counter()
+        self.received_bytes = 0
+
+    def new_task(self, name: Optional[str]) -> str:
+        task_uuid = str(uuid.uuid4())
+        self.tasks[task_uuid] = {
+            'name': name or task_uuid,
+            'created': time.time(),
+            'committed': None,
+            'images': 0,
+            'status': QUEUED,
+        }
+        return task_uuid
+
+    def status(self, task: Dict[str, Any]) -> int:
+        if task['status'] in (QUEUED, RUNNING) and task['committed'] is not None:
+            if time.time() - task['committed'] >= self.processing_time:
+                task['status'] = COMPLETED
+            else:
+                task['status'] = RUNNING
+        return task['status']
+
+    def info(self, task_uuid: str) -> Dict[str, Any]:
+        task = self.tasks[task_uuid]
+        status = self.status(task)
+        elapsed = time.time() - task['committed'] if task['committed'] else 0.0
+        if status == COMPLETED:
+            progress = 100.0
+        elif status == RUNNING:
+            progress = min(99.0, 100.0 * elapsed / self.processing_time) if self.processing_time else 99.0
+        else:
+            progress = 0.0
+        return {
+            'uuid': task_uuid,
+            'name': task['name'],
+            'dateCreated': int(task['created'] * 1000),
+            'processingTime': int(elapsed * 1000) if task['committed'] else -1,
+            'status': {'code': status},
+            'options': [],
+            'imagesCount': task['images'],
+            'progress': round(progress, 1),
+        }
+
+    def queue_count(self) -> int:
+        return sum(1 for task in self.tasks.values() if self.status(task) in (QUEUED, RUNNING))
+
+
+def create_app(
+    latency: float = 0.0,
+    processing_time: float = 3600.0,
+    orthophoto_size: int = 1024,
+    report_bytes: int = 1048576,
+) -> FastAPI:
+    """
+    Build the stand-in node
+
+    Args:
+        latency: Seconds added to every API call
+        processing_time: Seconds from commit until a task completes
+        orthophoto_size: Edge in pixels of the orthophoto in all.zip
+        report_bytes: Size of the report in all.zip
+    """
+    node = FakeNode(processing_time, build_archive(orthophoto_size, report_bytes))
+    app = FastAPI(title="Fake NodeODM")
+    app.state.node = node
+
+    def missing(task_uuid: str) -> JSONResponse:
+        return JSONResponse({'error': f"{task_uuid} not found"})
+
+    @app.middleware("http")
+    async def count_and_delay(request: Request, call_next):
+        if not request.url.path.startswith('/_bench'):
+            node.calls[f"{request.method} {UUID_PATTERN.sub('{uuid}', request.url.path)}"] += 1
+            if latency:
+                await asyncio.sleep(latency)
+        return await call_next(request)
+
+    async def receive_images(request: Request, task_uuid: str) -> None:
+        form = await request.form()
+        for image in form.getlist('images'):
+            data = await image.read()
+            node.received_bytes += len(data)
+            node.tasks[task_uuid]['images'] += 1
+
+    @app.get("/info")
+    async def info():
+        return {
+            'version': '2.2.0',
+            'taskQueueCount': node.queue_count(),
+            'maxImages': None,
+            'maxParallelTasks': node.max_parallel_tasks,
+            'engine': 'odm',
+            'engineVersion': 'fake',
+        }
+
+    @app.post("/task/new/init")
+    async def init_task(request: Request):
+        form = await request.form()
+        return {'uuid': node.new_task(form.get('name'))}
+
+    @app.post("/task/new/upload/{task_uuid}")
+    async def upload_images(task_uuid: str, request: Request):
+        if task_uuid not in node.tasks:
+            return missing(task_uuid)
+        await receive_images(request, task_uuid)
+        return {'success': True}
+
+    @app.post("/task/new/commit/{task_uuid}")
+    async def commit_task(task_uuid: str):
+        if task_uuid not in node.tasks:
+            return missing(task_uuid)
+        node.tasks[task_uuid]['committed'] = time.time()
+        return {'uuid': task_uuid}
+
+    @app.post("/task/new")
+    async def new_task(request: Request):
+        form = await request.form()
+        task_uuid = node.new_task(form.get('name'))
+        await receive_images(request, task_uuid)
+        node.tasks[task_uuid]['committed'] = time.time()
+        return {'uuid': task_uuid}
+
+    @app.get("/task/list")
+    async def task_list():
+        return [{'uuid': task_uuid} for task_uuid in node.tasks]
+
+    @app.get("/task/{task_uuid}/info")
+    async def task_info(task_uuid: str):
+        if task_uuid not in node.tasks:
+            return missing(task_uuid)
+        return node.info(task_uuid)
+
+    @app.get("/task/{task_uuid}/download/{asset}")
+    async def download(task_uuid: str, asset: str, request: Request):
+        if task_uuid not in node.tasks or node.status(node.tasks[task_uuid]) != COMPLETED:
+            return missing(task_uuid)
+        data = node.archive
+        match = re.match(r'bytes=(\d+)-', request.headers.get('range', ''))
+        if match:
+            start = int(match.group(1))
+            if start >= len(data):
+                return Response(status_code=416, headers={'Content-Range': f"bytes */{len(data)}"})
+            return Response(
+                data[start:],
+                status_code=206,
+                media_type='application/zip',
+                headers={'Content-Range': f"bytes {start}-{len(data) - 1}/{len(data)}"},
+            )
+        return Response(data, media_type='application/zip', headers={'Accept-Ranges': 'bytes'})
+
+    @app.post("/task/cancel")
+    async def cancel_task(request: Request):
+        task = node.tasks.get((await request.form()).get('uuid'))
+        if task is not None:
+            task['status'] = CANCELED
+        return {'success': task is not None}
+
+    @app.post("/task/remove")
+    async def remove_task(request: Request):
+        return {'success': node.tasks.pop((await request.form()).get('uuid'), None) is not None}
+
+    @app.get("/_bench/stats")
+    async def stats():
+        return {'calls': dict(node.calls), 'tasks': len(node.tasks), 'received_bytes': node.received_bytes}
+
+    @app.post("/_bench/reset")
+    async def reset():
+        node.calls.clear()
+        node.received_bytes = 0
+        return {'success': True}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a stand-in NodeODM for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API call")
+    parser.add_argument("--processing-time", type=float, default=3600.0, help="Seconds from commit to completion")
+    parser.add_argument("--orthophoto-size", type=int, default=1024, help="Orthophoto edge in pixels")
+    parser.add_argument("--report-bytes", type=int, default=1048576, help="Size of the report in all.zip")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency, args.processing_time, args.orthophoto_size, args.report_bytes),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,446 @@
+"""
+Benchmark runner that drives the API against a local stand-in NodeODM
+
+Starts benchmarks.fake_nodeodm and the FastAPI app as separate processes on
+a scratch RESULTS_DIR/UPLOAD_DIR seeded with synthetic completed tasks, runs
+the selected scenarios over HTTP and writes one JSON document with the
+results so runs can be compared with benchmarks.compare.
+
+Usage:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --scenarios listing status --tasks 10000
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ('upload', 'listing', 'status', 'artifacts')
+SCHEMA_VERSION = 1
+PAGE_SIZE_KB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+# Results listing queries timed against the seeded catalog
+LISTING_QUERIES = {
+    'first_page': {},
+    'deep_page': {'page': 50},
+    'by_name': {'sort': 'task_name', 'order': 'asc'},
+    'name_filter': {'name': 'flight 012'},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency statistics in milliseconds for samples in seconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(0.50) * 1000, 3),
+        'p95_ms': round(percentile(0.95) * 1000, 3),
+        'p99_ms': round(percentile(0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def process_rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process from /proc, or None where that is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE_KB
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def child_pids(pid: int) -> List[int]:
+    """Direct and indirect children of a process, such as its worker pools"""
+    parents: Dict[int, int] = {}
+    for entry in Path("/proc").glob("[0-9]*"):
+        try:
+            stat = (entry / "stat").read_text()
+            parents[int(entry.name)] = int(stat.rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    found, frontier = [], [pid]
+    while frontier:
+        current = frontier.pop()
+        children = [child for child, parent in parents.items() if parent == current]
+        found.extend(children)
+        frontier.extend(children)
+    return found
+
+
+class RssSampler:
+    """Samples the RSS of a process and of its whole process tree on a background thread"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self.peak_tree_kb = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = process_rss_kb(self.pid) or 0
+        tree = rss + sum(process_rss_kb(child) or 0 for child in child_pids(self.pid))
+        self.peak_kb = max(self.peak_kb, rss)
+        self.peak_tree_kb = max(self.peak_tree_kb, tree)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def result(self) -> Dict[str, Optional[float]]:
+        if not self.peak_kb:
+            return {'peak_rss_mb': None, 'peak_tree_rss_mb': None}
+        return {'peak_rss_mb': round(self.peak_kb / 1024, 1), 'peak_tree_rss_mb': round(self.peak_tree_kb / 1024, 1)}
+
+
+async def run_requests(
+    request: Callable[[int], Awaitable[Any]],
+    total: int,
+    concurrency: int,
+) -> Tuple[float, List[float]]:
+    """
+    Issue total requests from concurrency workers
+
+    Returns:
+        Wall time in seconds and the latency of every request
+    """
+    indices = iter(range(total))
+    latencies: List[float] = []
+
+    async def worker() -> None:
+        for index in indices:
+            started = time.perf_counter()
+            await request(index)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    return time.perf_counter() - started, latencies
+
+
+def make_images(count: int, edge: int) -> List[Tuple[str, bytes]]:
+    """Distinct JPEG flight images; each is one noise frame with unique trailing bytes"""
+    image = Image.effect_noise((edge, edge * 3 // 4), 32).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    frame = buffer.getvalue()
+    return [(f"DJI_{index:04d}.JPG", frame + uuid.uuid4().bytes) for index in range(count)]
+
+
+def seed_results(results_dir: Path, count: int, artifact_edge: int) -> List[str]:
+    """
+    Write count completed tasks with manifests and an orthophoto into results_dir
+
+    Every task links the same orthophoto file so seeding stays fast and small.
+    """
+    source = results_dir / "seed_orthophoto.png"
+    Image.effect_noise((artifact_edge, artifact_edge), 48).convert('RGB').save(source, format='PNG', compress_level=1)
+    started = datetime(2024, 1, 1)
+    task_ids = []
+    for index in range(count):
+        task_id = str(uuid.uuid4())
+        ortho_dir = results_dir / task_id / "odm_orthophoto"
+        ortho_dir.mkdir(parents=True)
+        try:
+            os.link(source, ortho_dir / "odm_orthophoto.png")
+        except OSError:
+            shutil.copyfile(source, ortho_dir / "odm_orthophoto.png")
+        created = started + timedelta(minutes=index)
+        manifest = {
+            'task_id': task_id,
+            'task_name': f"Flight {index:05d}",
+            'nodeodm_task_id': str(uuid.uuid4()),
+            'status': 'completed',
+            'created_at': created.isoformat(),
+            'completed_at': (created + timedelta(minutes=30)).isoformat(),
+        }
+        (results_dir / task_id / "manifest.json").write_text(json.dumps(manifest))
+        task_ids.append(task_id)
+    source.unlink()
+    return task_ids
+
+
+def start_process(args: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log = open(log_path, 'wb')
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 300.0) -> float:
+    """Poll url until it answers; returns seconds waited"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready within {timeout} seconds")
+
+
+def stop_process(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def bench_upload(client: httpx.AsyncClient, server: subprocess.Popen, args: argparse.Namespace) -> Dict[str, Any]:
+    """Upload one flight through each upload endpoint, timing the request and sampling RSS"""
+    images = make_images(args.images, args.image_edge)
+    total_bytes = sum(len(data) for _, data in images)
+    results: Dict[str, Any] = {'images': len(images), 'bytes': total_bytes}
+    for endpoint in ('/api/v1/upload/', '/api/v1/upload/stream'):
+        files = [('files', (name, data, 'image/jpeg')) for name, data in images]
+        with RssSampler(server.pid) as sampler:
+            started = time.perf_counter()
+            response = await client.post(endpoint, files=files, data={'task_name': 'benchmark flight'})
+            elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        results[endpoint.rstrip('/').rsplit('/', 1)[-1]] = {
+            'seconds': round(elapsed, 3),
+            'mb_per_second': round(total_bytes / elapsed / 1e6, 2),
+            'images_per_second': round(len(images) / elapsed, 2),
+            **sampler.result(),
+        }
+    return results
+
+
+async def bench_listing(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Any]:
+    """Latency of results listing queries against the seeded catalog"""
+    results: Dict[str, Any] = {'tasks': args.tasks}
+    for label, params in LISTING_QUERIES.items():
+        async def fetch(index: int, params=params) -> None:
+            (await client.get('/api/v1/results/', params=params)).raise_for_status()
+
+        _, latencies = await run_requests(fetch, args.requests, 1)
+        results[label] = summarize(latencies)
+
+    async def fetch_first_page(index: int) -> None:
+        (await client.get('/api/v1/results/')).raise_for_status()
+
+    elapsed, latencies = await run_requests(fetch_first_page, args.requests, args.concurrency)
+    results['concurrent'] = {
+        'concurrency': args.concurrency,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        **summarize(latencies),
+    }
+    return results
+
+
+async def bench_status(client: httpx.AsyncClient, fake_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Many clients polling the status of a few running tasks, and the NodeODM calls that causes"""
+    async with httpx.AsyncClient(base_url=fake_url) as fake:
+        task_ids = []
+        for index in range(args.status_tasks):
+            created = (await fake.post('/task/new/init', data={'name': f"poll {index}"})).json()['uuid']
+            await fake.post(f'/task/new/commit/{created}')
+            task_ids.append(created)
+        # Warm up node lookups so the timed run measures steady-state polling
+        for task_id in task_ids:
+            (await client.get(f'/api/v1/upload/{task_id}/status')).raise_for_status()
+        await fake.post('/_bench/reset')
+
+        async def poll(index: int) -> None:
+            (await client.get(f'/api/v1/upload/{task_ids[index % len(task_ids)]}/status')).raise_for_status()
+
+        elapsed, latencies = await run_requests(poll, args.requests * 5, args.concurrency)
+        calls = (await fake.get('/_bench/stats')).json()['calls']
+    upstream = calls.get('GET /task/{uuid}/info', 0)
+    return {
+        'tasks': len(task_ids),
+        'concurrency': args.concurrency,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'upstream_info_calls': upstream,
+        'upstream_calls_per_request': round(upstream / len(latencies), 4),
+        **summarize(latencies),
+    }
+
+
+async def bench_artifacts(client: httpx.AsyncClient, task_ids: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    """Throughput of orthophoto downloads spread over the seeded tasks"""
+    sample = random.Random(0).sample(task_ids, min(len(task_ids), args.requests))
+    received = 0
+
+    async def fetch(index: int) -> None:
+        nonlocal received
+        response = await client.get(f'/api/v1/results/{sample[index % len(sample)]}/orthophoto.png')
+        response.raise_for_status()
+        received += len(response.content)
+
+    elapsed, latencies = await run_requests(fetch, args.requests * 5, args.concurrency)
+    return {
+        'concurrency': args.concurrency,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'mb_per_second': round(received / elapsed / 1e6, 2),
+        **summarize(latencies),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_scenarios(args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    results_dir = workdir / "results"
+    results_dir.mkdir(parents=True, exist_ok=True)
+    task_ids: List[str] = []
+    if {'listing', 'artifacts'} & set(args.scenarios):
+        task_ids = seed_results(results_dir, args.tasks, args.artifact_edge)
+
+    fake_port, api_port = free_port(), free_port()
+    fake_url, api_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{api_port}"
+    env = {
+        **os.environ,
+        'NODEODM_URL': fake_url,
+        'NODEODM_URLS': '[]',
+        'RESULTS_DIR': str(results_dir),
+        'UPLOAD_DIR': str(workdir / "uploads"),
+        'BLOB_STORE_DIR': str(workdir / "blobs"),
+        'TILE_CACHE_DIR': str(workdir / "tile_cache"),
+        'DEBUG': 'false',
+    }
+    fake = start_process(
+        [
+            sys.executable, '-m', 'benchmarks.fake_nodeodm', '--port', str(fake_port),
+            '--latency', str(args.latency), '--processing-time', str(args.processing_time),
+            '--orthophoto-size', str(args.orthophoto_size),
+        ],
+        env,
+        workdir / "fake_nodeodm.log",
+    )
+    server = None
+    try:
+        wait_ready(f"{fake_url}/info", fake)
+        server = start_process(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(api_port), '--log-level', 'warning'],
+            env,
+            workdir / "server.log",
+        )
+        # Includes indexing the seeded results into an empty catalog
+        startup = wait_ready(f"{api_url}/health", server)
+        scenarios: Dict[str, Any] = {'startup': {'seconds': round(startup, 3), 'rss_mb': None}}
+        rss = process_rss_kb(server.pid)
+        scenarios['startup']['rss_mb'] = round(rss / 1024, 1) if rss else None
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout, limits=limits) as client:
+            for scenario in args.scenarios:
+                print(f"Running {scenario} benchmark...", file=sys.stderr)
+                if scenario == 'upload':
+                    scenarios['upload'] = await bench_upload(client, server, args)
+                elif scenario == 'listing':
+                    scenarios['listing'] = await bench_listing(client, args)
+                elif scenario == 'status':
+                    scenarios['status'] = await bench_status(client, fake_url, args)
+                elif scenario == 'artifacts':
+                    scenarios['artifacts'] = await bench_artifacts(client, task_ids, args)
+        return scenarios
+    finally:
+        if server is not None:
+            stop_process(server)
+        stop_process(fake)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API against a local stand-in NodeODM")
+    parser.add_argument("--scenarios", nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--workdir", help="Scratch directory (a temporary one is created and removed by default)")
+    parser.add_argument("--images", type=int, default=200, help="Images in the uploaded flight")
+    parser.add_argument("--image-edge", type=int, default=2000, help="Width in pixels of each uploaded image")
+    parser.add_argument("--tasks", type=int, default=10000, help="Synthetic completed tasks seeded in RESULTS_DIR")
+    parser.add_argument("--artifact-edge", type=int, default=1024, help="Edge in pixels of the seeded orthophotos")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per listing query (x5 for throughput runs)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients for throughput runs")
+    parser.add_argument("--status-tasks", type=int, default=50, help="Running tasks polled by the status benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stand-in NodeODM adds to every call")
+    parser.add_argument("--processing-time", type=float, default=3600.0, help="Seconds a stand-in task takes to complete")
+    parser.add_argument("--orthophoto-size", type=int, default=1024, help="Orthophoto edge in the stand-in all.zip")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds")
+    args = parser.parse_args(argv)
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="dbd-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    try:
+        scenarios = asyncio.run(run_scenarios(args, workdir))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        'schema': SCHEMA_VERSION,
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'workdir')},
+        },
+        'scenarios': scenarios,
+    }
+    text = json.dumps(document, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,39 @@
 #!/usr/bin/env python3
 """
 Development server runner for the Drone Imagery API
+
+Also starts a job worker (worker.py) next to the server for queued downloads
+and post-processing, unless JOB_WORKER_IN_API runs them in the API process.
 """
 
+import subprocess
+import sys
+from pathlib import Path
+
 import uvicorn
 from app.core.config import settings
 
+# Seconds a job worker gets to hand its running jobs back before it is killed
+WORKER_STOP_TIMEOUT = 10
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG,
-        log_level="info"
-    )
+    worker = None
+    if not settings.JOB_WORKER_IN_API:
+        worker = subprocess.Popen([sys.executable, str(Path(__file__).with_name("worker.py"))])
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=settings.WORKERS,
+            # Reloading supports a single worker only
+            reload=settings.DEBUG and settings.WORKERS == 1,
+            log_level="info"
+        )
+    finally:
+        if worker is not None:
+            worker.terminate()
+            try:
+                worker.wait(WORKER_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                worker.kill()
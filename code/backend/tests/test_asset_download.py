@@ -0,0 +1,94 @@
+"""
+Tests for the streaming asset download and extraction pipeline
+"""
+
+import io
+import os
+import zipfile
+
+import httpx
+import pytest
+
+from app.services.asset_download import AssetDownloader, StreamingZipExtractor
+from app.services.nodeodm_client import NodeODMClient
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream that forces zipfile to emit data descriptors"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def build_archive(streamed: bool = False) -> bytes:
+    members = {
+        'odm_orthophoto/odm_orthophoto.png': os.urandom(300_000),
+        'odm_report/report.pdf': b'%PDF' * 50_000,
+        'odm_logs/log.txt': b'log line\n' * 1000,
+    }
+    target = Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(target, 'w') as archive:
+        for name, content in members.items():
+            method = zipfile.ZIP_STORED if name.endswith('.png') else zipfile.ZIP_DEFLATED
+            archive.writestr(name, content, compress_type=method)
+    data = bytes(target.data) if streamed else target.getvalue()
+    return data, members
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_extractor_handles_small_chunks(tmp_path, streamed):
+    """Members come out intact whether sizes are in headers or data descriptors"""
+    data, members = build_archive(streamed)
+    extractor = StreamingZipExtractor(tmp_path)
+    for i in range(0, len(data), 777):
+        extractor.feed(data[i:i + 777])
+    extractor.close()
+
+    assert sorted(extractor.extracted) == sorted(members)
+    for name, content in members.items():
+        assert (tmp_path / name).read_bytes() == content
+
+
+def test_extractor_only_writes_selected_members(tmp_path):
+    data, _ = build_archive()
+    extractor = StreamingZipExtractor(tmp_path, include=['odm_orthophoto/', 'odm_report/'])
+    extractor.feed(data)
+    extractor.close()
+
+    assert (tmp_path / 'odm_report' / 'report.pdf').exists()
+    assert not (tmp_path / 'odm_logs').exists()
+
+
+@pytest.mark.asyncio
+async def test_download_resumes_with_range(tmp_path):
+    """An interrupted transfer continues from the last byte received"""
+    data, members = build_archive()
+    ranges = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        range_header = request.headers.get('range')
+        ranges.append(range_header)
+        if range_header is None:
+            async def broken():
+                yield data[:100_000]
+                raise httpx.ReadError("connection reset")
+            return httpx.Response(200, content=broken())
+        start = int(range_header.split('=')[1].rstrip('-'))
+        return httpx.Response(206, content=data[start:])
+
+    client = NodeODMClient(base_url="http://nodeodm.test")
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    downloader = AssetDownloader(client)
+
+    extracted = await downloader.download('abc', tmp_path, include=[])
+
+    assert ranges == [None, 'bytes=100000-']
+    assert sorted(extracted) == sorted(members)
+    await client.aclose()
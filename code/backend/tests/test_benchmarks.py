@@ -0,0 +1,77 @@
+"""
+Tests for the benchmark stand-in NodeODM and result helpers
+"""
+
+import io
+import zipfile
+
+import httpx
+import pytest
+from pyodm.types import TaskStatus
+
+from app.services.nodeodm_client import NodeODMClient
+from benchmarks.compare import compare
+from benchmarks.fake_nodeodm import create_app
+from benchmarks.run import summarize
+
+
+def fake_client(app) -> NodeODMClient:
+    client = NodeODMClient(base_url="http://fake")
+    client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake")
+    return client
+
+
+@pytest.mark.asyncio
+async def test_fake_node_speaks_the_client_protocol(tmp_path):
+    app = create_app(processing_time=0.0, orthophoto_size=16, report_bytes=64)
+    client = fake_client(app)
+    images = []
+    for index in range(3):
+        path = tmp_path / f"DJI_{index}.JPG"
+        path.write_bytes(b"jpeg" * 10)
+        images.append(path)
+
+    try:
+        uuid = await client.create_task(images, name="bench")
+        info = await client.task_info(uuid)
+        archive = b"".join([chunk async for chunk in client.iter_asset(uuid)])
+        tail = b"".join([chunk async for chunk in client.iter_asset(uuid, offset=10)])
+        assert await client.remove_task(uuid)
+    finally:
+        await client.aclose()
+
+    assert info.status == TaskStatus.COMPLETED
+    assert info.images_count == 3
+    assert tail == archive[10:]
+    names = zipfile.ZipFile(io.BytesIO(archive)).namelist()
+    assert names == ["odm_orthophoto/odm_orthophoto.png", "odm_report/report.pdf"]
+    node = app.state.node
+    assert node.received_bytes == 120
+    assert node.calls["POST /task/new/upload/{uuid}"] == 3
+
+
+@pytest.mark.asyncio
+async def test_fake_tasks_run_until_processing_time_passes():
+    client = fake_client(create_app(processing_time=3600.0, orthophoto_size=16))
+    try:
+        uuid = await client.init_task(name="long")
+        await client.commit_task(uuid)
+        info = await client.task_info(uuid)
+    finally:
+        await client.aclose()
+
+    assert info.status == TaskStatus.RUNNING
+    assert 0 <= info.progress < 1
+
+
+def test_summarize_and_compare():
+    stats = summarize([0.001 * n for n in range(1, 101)])
+    assert stats['count'] == 100
+    assert stats['p50_ms'] == pytest.approx(51.0)
+    assert stats['max_ms'] == pytest.approx(100.0)
+
+    baseline = {'scenarios': {'listing': {'first_page': {'p95_ms': 10.0}}, 'artifacts': {'requests_per_second': 100.0}}}
+    candidate = {'scenarios': {'listing': {'first_page': {'p95_ms': 20.0}}, 'artifacts': {'requests_per_second': 150.0}}}
+    rows = {name: (change, improved) for name, _, _, change, improved in compare(baseline, candidate)}
+    assert rows['listing.first_page.p95_ms'] == (pytest.approx(1.0), False)
+    assert rows['artifacts.requests_per_second'] == (pytest.approx(0.5), True)
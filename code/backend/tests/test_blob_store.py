@@ -0,0 +1,91 @@
+"""
+Tests for the content-addressed upload blob store
+"""
+
+import hashlib
+import os
+import time
+
+from app.services.blob_store import BlobStore
+
+
+def stage(store: BlobStore, payload: bytes):
+    staged = store.staging_path()
+    staged.write_bytes(payload)
+    return staged, hashlib.sha256(payload).hexdigest()
+
+
+def test_identical_uploads_share_one_blob(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    payload = b"image" * 1000
+
+    for task_id in ("first", "second"):
+        staged, sha256 = stage(store, payload)
+        store.add(staged, sha256, len(payload), tmp_path / "uploads" / task_id / "DJI_0001.JPG", task_id)
+
+    first = tmp_path / "uploads" / "first" / "DJI_0001.JPG"
+    second = tmp_path / "uploads" / "second" / "DJI_0001.JPG"
+    assert first.read_bytes() == payload
+    assert first.stat().st_ino == second.stat().st_ino
+    assert list(store.staging_dir.iterdir()) == []
+    stats = store.stats()
+    assert (stats['blobs'], stats['references']) == (1, 2)
+    assert stats['stored_bytes'] == len(payload)
+    assert stats['saved_bytes'] == len(payload)
+
+
+def test_blobs_are_collected_once_unreferenced(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    shared, sha_shared = stage(store, b"shared")
+    store.add(shared, sha_shared, 6, tmp_path / "a" / "shared.JPG", "a")
+    assert store.link(sha_shared, tmp_path / "b" / "shared.JPG", "b")
+    only, sha_only = stage(store, b"only-a")
+    store.add(only, sha_only, 6, tmp_path / "a" / "only.JPG", "a")
+
+    assert store.release("a") == 2
+    assert store.collect() == (1, 6)
+    assert store.has(sha_shared)
+    assert not store.has(sha_only)
+
+    store.release("b")
+    store.collect()
+    assert store.stats()['blobs'] == 0
+
+
+def test_collect_spares_in_flight_staging_and_relinked_blobs(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    blob, sha256 = stage(store, b"image")
+    store.add(blob, sha256, 5, tmp_path / "a" / "DJI_0001.JPG", "a")
+    store.release("a")
+    in_flight, _ = stage(store, b"half an ima")
+    abandoned, _ = stage(store, b"crashed")
+    os.utime(abandoned, (time.time() - 2 * 86400,) * 2)
+
+    # Linked again between the orphan listing and its deletion
+    original = store._transaction
+    calls = []
+
+    def relink_first():
+        if not calls:
+            calls.append(True)
+            store.link(sha256, tmp_path / "b" / "DJI_0001.JPG", "b")
+        return original()
+
+    store._transaction = relink_first
+    assert store.collect() == (0, 0)
+    assert (tmp_path / "b" / "DJI_0001.JPG").read_bytes() == b"image"
+    assert in_flight.exists()
+    assert not abandoned.exists()
+
+
+def test_add_ingests_staged_copy_when_blob_was_collected(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    first, sha256 = stage(store, b"image")
+    store.add(first, sha256, 5, tmp_path / "a" / "DJI_0001.JPG", "a")
+    store.release("a")
+    store.collect()
+
+    assert not store.link(sha256, tmp_path / "b" / "DJI_0001.JPG", "b")
+    again, _ = stage(store, b"image")
+    assert store.add(again, sha256, 5, tmp_path / "b" / "DJI_0001.JPG", "b")
+    assert (tmp_path / "b" / "DJI_0001.JPG").read_bytes() == b"image"
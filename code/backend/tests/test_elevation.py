@@ -0,0 +1,83 @@
+"""
+Tests for DEM elevation sampling
+"""
+
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+from rasterio.transform import from_origin
+from rasterio.warp import transform
+
+from app.services.elevation import ElevationService, SamplingError
+from app.services.file_storage import FileStorageService
+
+ORIGIN_X, ORIGIN_Y = 500000.0, 4000000.0
+
+
+@pytest.fixture
+def elevation(tmp_path):
+    """A task with a 200x200 DSM at 0.5 m/pixel whose elevation is 100 + x + 2y metres from its top-left corner"""
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    path = storage.results_dir / "task" / "odm_dem" / "dsm.tif"
+    path.parent.mkdir(parents=True)
+    cols, rows = np.meshgrid(np.arange(200), np.arange(200))
+    data = (100.0 + (cols + 0.5) * 0.5 + (rows + 0.5) * 0.5 * 2).astype(np.float32)
+    data[150:, 150:] = -9999.0
+    with rasterio.open(
+        path, 'w', driver='GTiff', width=200, height=200, count=1, dtype='float32',
+        crs='EPSG:32617', transform=from_origin(ORIGIN_X, ORIGIN_Y, 0.5, 0.5), nodata=-9999.0,
+    ) as dst:
+        dst.write(data, 1)
+    return ElevationService(storage=storage, cache_size=1)
+
+
+@pytest.mark.asyncio
+async def test_points_are_interpolated_in_one_pass(elevation, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.ELEVATION_WINDOW_SIZE', 64)
+    points = [
+        [ORIGIN_X + 10.0, ORIGIN_Y - 20.0],
+        [ORIGIN_X + 33.3, ORIGIN_Y - 7.7],
+        [ORIGIN_X + 90.0, ORIGIN_Y - 90.0],  # nodata
+        [ORIGIN_X - 5.0, ORIGIN_Y],  # off the model
+    ]
+    result = await elevation.points("task", "dsm", points, crs="EPSG:32617")
+
+    assert result['crs'] == "EPSG:32617"
+    assert result['elevations'][:2] == [pytest.approx(150.0), pytest.approx(148.7)]
+    assert result['elevations'][2:] == [None, None]
+    # Longitude/latitude input is reprojected
+    (lon,), (lat,) = transform("EPSG:32617", "EPSG:4326", [ORIGIN_X + 10.0], [ORIGIN_Y - 20.0])
+    lonlat = await elevation.points("task", "dsm", [[lon, lat]])
+    assert lonlat['elevations'] == [pytest.approx(150.0, abs=1e-3)]
+
+    # The handle is reused until another DEM pushes it out of the LRU
+    with elevation._borrow(elevation.dem_path("task", "dsm")) as handle:
+        await elevation.points("task", "dsm", points, crs="EPSG:32617")
+        with elevation._borrow(elevation.dem_path("task", "dsm")) as again:
+            assert again is handle
+        # A handle dropped while a query holds it stays open until that query returns it
+        elevation.invalidate("task")
+        assert not handle.dataset.closed
+    assert handle.dataset.closed
+
+    assert await elevation.points("task", "dtm", points) is None
+    with pytest.raises(SamplingError):
+        await elevation.points("task", "dsm", [[1.0, 2.0, 3.0]])
+
+
+@pytest.mark.asyncio
+async def test_profile_samples_evenly_along_the_line(elevation):
+    line = [[ORIGIN_X + 10.0, ORIGIN_Y - 10.0], [ORIGIN_X + 20.0, ORIGIN_Y - 10.0], [ORIGIN_X + 20.0, ORIGIN_Y - 15.25]]
+
+    result = await elevation.profile("task", "dsm", line, crs="EPSG:32617", spacing=1.0)
+
+    assert result['length'] == pytest.approx(15.25)
+    # Every metre plus the final vertex
+    assert result['distances'][:3] == [0.0, 1.0, 2.0] and result['distances'][-1] == 15.25
+    assert len(result['distances']) == 17
+    assert result['coordinates'][10] == pytest.approx([ORIGIN_X + 20.0, ORIGIN_Y - 10.0])
+    for (x, y), value in zip(result['coordinates'], result['elevations']):
+        assert value == pytest.approx(100.0 + (x - ORIGIN_X) + 2 * (ORIGIN_Y - y), abs=1e-3)
+    with pytest.raises(SamplingError):
+        await elevation.profile("task", "dsm", line, crs="EPSG:32617", spacing=1e-6)
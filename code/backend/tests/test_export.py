@@ -0,0 +1,74 @@
+"""
+Tests for the streaming multi-task zip export
+"""
+
+import io
+import zipfile
+
+import pytest
+
+from app.core.config import settings
+from app.services.export import ExportError, ExportService
+from app.services.file_storage import FileStorageService
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    return ExportService(storage=FileStorageService(results_dir=tmp_path / "results"))
+
+
+def add_task(exporter, task_id, task_name=None, files=()):
+    exporter.storage.write_manifest(task_id, {'task_id': task_id, 'task_name': task_name, 'status': 'completed'})
+    for relative, data in files:
+        path = exporter.storage.results_dir / task_id / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def test_export_streams_a_zip_with_one_folder_per_task(exporter, monkeypatch):
+    monkeypatch.setattr(settings, 'EXPORT_CHUNK_SIZE', 1024)
+    ortho = bytes(range(256)) * 40
+    add_task(exporter, "aaaaaaaa-1111", "North field / June", [
+        ("odm_orthophoto/odm_orthophoto.png", ortho),
+        ("odm_report/report.pdf", b"%PDF report"),
+        ("task_output.txt", b"log line\n" * 1000),
+    ])
+    # A compacted task only has its gzipped log and no report
+    add_task(exporter, "bbbbbbbb-2222", None, [
+        ("odm_orthophoto/odm_orthophoto.png", b"png"),
+        ("task_output.txt.gz", b"gzipped"),
+    ])
+
+    entries = exporter.plan(["aaaaaaaa-1111", "bbbbbbbb-2222", "aaaaaaaa-1111"], ["orthophoto", "report", "log"])
+    chunks = list(exporter.stream(entries))
+
+    # Streamed piecewise rather than assembled in one buffer
+    assert len(chunks) > 5
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    infos = {info.filename: info for info in archive.infolist()}
+    assert list(infos) == [
+        "North_field_June-aaaaaaaa/odm_orthophoto.png",
+        "North_field_June-aaaaaaaa/report.pdf",
+        "North_field_June-aaaaaaaa/task_output.txt",
+        "bbbbbbbb-2222/odm_orthophoto.png",
+        "bbbbbbbb-2222/task_output.txt.gz",
+    ]
+    assert archive.read("North_field_June-aaaaaaaa/odm_orthophoto.png") == ortho
+    assert infos["North_field_June-aaaaaaaa/odm_orthophoto.png"].compress_type == zipfile.ZIP_STORED
+    assert infos["bbbbbbbb-2222/task_output.txt.gz"].compress_type == zipfile.ZIP_STORED
+    log = infos["North_field_June-aaaaaaaa/task_output.txt"]
+    assert log.compress_type == zipfile.ZIP_DEFLATED
+    assert log.compress_size < log.file_size
+
+
+def test_export_rejects_unknown_tasks_and_artifacts(exporter, monkeypatch):
+    add_task(exporter, "t", files=[("odm_orthophoto/odm_orthophoto.png", b"png")])
+
+    with pytest.raises(ExportError, match="missing"):
+        exporter.plan(["t", "missing"])
+    with pytest.raises(ExportError, match="pointcloud"):
+        exporter.plan(["t"], ["orthophoto", "pointcloud"])
+    monkeypatch.setattr(settings, 'EXPORT_MAX_TASKS', 1)
+    with pytest.raises(ExportError):
+        exporter.plan(["t", "u"])
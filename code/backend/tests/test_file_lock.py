@@ -0,0 +1,26 @@
+"""
+Tests for the cross-process file lock
+"""
+
+import threading
+import time
+
+from app.services.file_lock import file_lock
+
+
+def test_lock_is_exclusive_until_released(tmp_path):
+    path = tmp_path / ".lock"
+    events = []
+
+    def contender():
+        with file_lock(path):
+            events.append("contender")
+
+    with file_lock(path):
+        thread = threading.Thread(target=contender)
+        thread.start()
+        time.sleep(0.2)
+        events.append("holder")
+    thread.join(timeout=5)
+
+    assert events == ["holder", "contender"]
@@ -0,0 +1,84 @@
+"""
+Tests for vegetation index rasters
+"""
+
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+import numpy as np
+from rasterio.transform import from_origin
+
+from app.core.config import settings
+from app.services.file_storage import FileStorageService
+from app.services.indices import IndexService, IndexUnavailableError
+
+
+def write_orthophoto(storage, task_id, bands=5):
+    """600x400 orthophoto: NDVI 0.5 / NDRE 0.2 on the left, NDVI 0.8 / NDRE 0.5 on the right, top rows masked"""
+    path = storage.results_dir / task_id / "odm_orthophoto" / "odm_orthophoto.tif"
+    path.parent.mkdir(parents=True)
+    data = np.zeros((bands, 400, 600), dtype=np.uint16)
+    data[0] = 100
+    if bands >= 5:
+        data[3] = 200
+        data[4, :, :300] = 300
+        data[4, :, 300:] = 900
+        data[3, :, 300:] = 300
+    with rasterio.open(
+        path, 'w', driver='GTiff', width=600, height=400, count=bands, dtype='uint16',
+        crs='EPSG:32617', transform=from_origin(500000.0, 4000000.0, 0.05, 0.05), nodata=0,
+    ) as dst:
+        data[:, :100, :] = 0
+        dst.write(data)
+    storage.write_manifest(task_id, {'task_id': task_id, 'status': 'completed'})
+    return path
+
+
+@pytest.fixture
+def indices(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'COG_BLOCK_SIZE', 128)
+    monkeypatch.setattr(settings, 'INDEX_WINDOW_SIZE', 256)
+    service = IndexService(storage=FileStorageService(results_dir=tmp_path / "results"), max_workers=2)
+    yield service
+    service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_indices_are_computed_in_blocks_and_cached(indices):
+    write_orthophoto(indices.storage, "t")
+
+    results = await indices.ensure_indices("t")
+
+    ndvi, ndre = results['ndvi'], results['ndre']
+    # The masked top 100 rows are excluded
+    assert ndvi['count'] == 600 * 300
+    assert ndvi['min'] == pytest.approx(0.5)
+    assert ndvi['max'] == pytest.approx(0.8)
+    assert ndvi['mean'] == pytest.approx(0.65)
+    assert ndvi['std'] == pytest.approx(0.15)
+    assert (ndvi['p10'], ndvi['p90']) == (pytest.approx(0.505), pytest.approx(0.805))
+    assert ndre['mean'] == pytest.approx(0.35)
+    with rasterio.open(indices.index_path("t", "ndvi")) as src:
+        values = src.read(1)
+        assert src.dtypes[0] == 'float32'
+        assert src.block_shapes[0] == (128, 128)
+        assert src.overviews(1)
+    assert np.isnan(values[:100]).all()
+    assert values[200, 100] == pytest.approx(0.5)
+    assert values[200, 500] == pytest.approx(0.8)
+
+    # A second request reuses the cached raster
+    mtime = indices.index_path("t", "ndvi").stat().st_mtime_ns
+    assert await indices.ensure_index("t", "ndvi") == ndvi
+    assert indices.index_path("t", "ndvi").stat().st_mtime_ns == mtime
+    assert indices.storage.read_manifest("t")['indices']['ndre'] == ndre
+
+
+@pytest.mark.asyncio
+async def test_rgb_orthophotos_and_unknown_indices(indices):
+    write_orthophoto(indices.storage, "rgb", bands=3)
+
+    with pytest.raises(IndexUnavailableError):
+        await indices.ensure_index("rgb", "ndvi")
+    assert await indices.ensure_index("rgb", "evi") is None
+    assert await indices.ensure_index("missing", "ndvi") is None
@@ -0,0 +1,81 @@
+"""
+Tests for the streaming upload ingest service
+"""
+
+import hashlib
+import io
+
+import pytest
+from fastapi import UploadFile
+
+from app.services.blob_store import BlobStore
+from app.services.ingest import ChecksumMismatchError, FileTooLargeError, IngestService
+
+
+@pytest.mark.asyncio
+async def test_save_upload_streams_and_hashes(tmp_path):
+    """Stored file matches the upload byte for byte and carries its sha256"""
+    payload = b"x" * 2500
+    upload = UploadFile(io.BytesIO(payload), filename="DJI_0001.JPG")
+    service = IngestService(chunk_size=1024, max_file_size=10_000, store=BlobStore(tmp_path / "blobs"))
+
+    stored = await service.save_upload(upload, tmp_path / "task" / "DJI_0001.JPG")
+
+    assert (tmp_path / "task" / "DJI_0001.JPG").read_bytes() == payload
+    assert stored['size'] == len(payload)
+    assert stored['sha256'] == hashlib.sha256(payload).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_save_upload_aborts_past_limit(tmp_path):
+    """Oversized uploads are rejected mid-stream and leave nothing behind"""
+    upload = UploadFile(io.BytesIO(b"x" * 5000), filename="big.JPG")
+    store = BlobStore(tmp_path / "blobs")
+    service = IngestService(chunk_size=1024, max_file_size=2048, store=store)
+
+    with pytest.raises(FileTooLargeError):
+        await service.save_upload(upload, tmp_path / "task" / "big.JPG")
+
+    assert not (tmp_path / "task").exists()
+    assert list(store.staging_dir.iterdir()) == []
+    assert store.stats()['blobs'] == 0
+
+
+@pytest.mark.asyncio
+async def test_declared_checksum_of_stored_image_skips_writes(tmp_path):
+    """A repeat upload with a known checksum is verified without touching the store"""
+    payload = b"y" * 3000
+    sha256 = hashlib.sha256(payload).hexdigest()
+    store = BlobStore(tmp_path / "blobs")
+    service = IngestService(chunk_size=1024, max_file_size=10_000, store=store)
+    await service.save_upload(UploadFile(io.BytesIO(payload), filename="a.JPG"), tmp_path / "first" / "a.JPG")
+    store.staging_path = lambda: pytest.fail("repeat upload was written to staging")
+
+    stored = await service.save_upload(
+        UploadFile(io.BytesIO(payload), filename="a.JPG"), tmp_path / "second" / "a.JPG", expected_sha256=sha256
+    )
+
+    assert stored['deduplicated'] is True
+    assert (tmp_path / "second" / "a.JPG").read_bytes() == payload
+    with pytest.raises(ChecksumMismatchError):
+        await service.save_upload(
+            UploadFile(io.BytesIO(b"z" * 3000), filename="b.JPG"), tmp_path / "third" / "b.JPG", expected_sha256=sha256
+        )
+
+
+@pytest.mark.asyncio
+async def test_declared_checksum_is_stored_again_if_blob_vanishes(tmp_path):
+    """A blob collected between the lookup and the link is re-ingested from the upload"""
+    payload = b"z" * 3000
+    sha256 = hashlib.sha256(payload).hexdigest()
+    store = BlobStore(tmp_path / "blobs")
+    service = IngestService(chunk_size=1024, max_file_size=10_000, store=store)
+    store.has = lambda digest: True
+
+    stored = await service.save_upload(
+        UploadFile(io.BytesIO(payload), filename="a.JPG"), tmp_path / "task" / "a.JPG", expected_sha256=sha256
+    )
+
+    assert stored['deduplicated'] is False
+    assert stored['size'] == len(payload)
+    assert (tmp_path / "task" / "a.JPG").read_bytes() == payload
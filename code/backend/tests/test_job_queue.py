@@ -0,0 +1,85 @@
+"""
+Tests for the durable job queue and its worker
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.job_queue import JobQueue
+from app.services.job_worker import JobWorker, PermanentJobError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.db")
+
+
+def test_claims_by_priority_and_retries_with_backoff(queue, monkeypatch):
+    monkeypatch.setattr(settings, 'JOB_RETRY_DELAY', 0.0)
+    low = queue.enqueue('tiles', {'task_id': 'a'}, task_id='a')
+    high = queue.enqueue('download', {'task_id': 'b'}, task_id='b', priority=10, max_attempts=2)
+    # Enqueueing a task's active job again is a no-op
+    assert queue.enqueue('download', {'task_id': 'b'}, task_id='b') == high
+
+    assert queue.claim('w1', ['tiles'], ttl=30)['id'] == low
+    job = queue.claim('w1', ['download', 'tiles'], ttl=30)
+    assert (job['id'], job['attempts'], job['payload']) == (high, 1, {'task_id': 'b'})
+    assert queue.claim('w2', ['download', 'tiles'], ttl=30) is None
+
+    assert queue.fail(high, 'w1', "node unreachable") == 'queued'
+    assert queue.claim('w2', ['download'], ttl=30)['attempts'] == 2
+    assert queue.fail(high, 'w2', "node unreachable") == 'failed'
+    assert queue.get(high)['error'] == "node unreachable"
+    # A finished job no longer blocks a new one for the task
+    assert queue.enqueue('download', {'task_id': 'b'}, task_id='b') != high
+
+    queue.complete(low, 'w1')
+    assert queue.counts() == {'tiles': {'succeeded': 1}, 'download': {'failed': 1, 'queued': 1}}
+
+
+def test_job_of_a_stopped_worker_is_claimed_after_its_lease(queue):
+    job_id = queue.enqueue('download', {}, task_id='a')
+    assert queue.claim('crashed', ['download'], ttl=-1)['id'] == job_id
+
+    job = queue.claim('w2', ['download'], ttl=30)
+    assert (job['id'], job['owner'], job['attempts']) == (job_id, 'w2', 2)
+    # The old owner can no longer complete or fail it
+    assert queue.fail(job_id, 'crashed', "late") is None
+    queue.complete(job_id, 'w2')
+    assert queue.get(job_id)['status'] == 'succeeded'
+
+
+@pytest.mark.asyncio
+async def test_worker_limits_concurrency_and_reports_final_failures(queue, monkeypatch):
+    monkeypatch.setattr(settings, 'JOB_RETRY_DELAY', 0.0)
+    release = asyncio.Event()
+    running = []
+    failures = []
+
+    async def slow(payload):
+        running.append(payload['n'])
+        await release.wait()
+
+    async def broken(payload):
+        raise PermanentJobError("bad input")
+
+    worker = JobWorker(queue, worker_id='w')
+    worker.register('slow', slow, concurrency=2)
+    worker.register('broken', broken, on_failure=lambda payload, error: failures.append((payload, error)))
+    for n in range(3):
+        queue.enqueue('slow', {'n': n}, task_id=str(n))
+    queue.enqueue('broken', {'n': 9})
+
+    assert worker.fill() == 3
+    await asyncio.sleep(0)
+    assert sorted(running) == [0, 1]
+    assert failures == [({'n': 9}, "bad input")]
+    assert queue.list(job_type='broken')[0]['attempts'] == 1
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert worker.fill() == 1
+    await asyncio.sleep(0.01)
+    assert queue.counts()['slow'] == {'succeeded': 3}
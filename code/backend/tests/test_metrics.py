@@ -0,0 +1,126 @@
+"""
+Tests for the metrics registry and request timing middleware
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.metrics import MetricsMiddleware, router
+from app.core.config import settings
+from app.services.metrics import (
+    DOWNLOAD_BYTES,
+    HTTP_REQUEST_DURATION,
+    SIZE_BUCKETS,
+    MetricsRegistry,
+    _format_value,
+    metrics_publisher,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("call_seconds", "Call latency", ("endpoint",), buckets=(0.1, 1.0))
+    calls = registry.counter("calls_total", "Calls")
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, endpoint="/info")
+    calls.inc(3)
+
+    text = registry.render()
+
+    assert '# TYPE call_seconds histogram' in text
+    assert 'call_seconds_bucket{endpoint="/info",le="0.1"} 1' in text
+    assert 'call_seconds_bucket{endpoint="/info",le="1"} 2' in text
+    assert 'call_seconds_bucket{endpoint="/info",le="+Inf"} 3' in text
+    assert 'call_seconds_count{endpoint="/info"} 3' in text
+    assert 'calls_total 3' in text
+
+
+def test_requests_are_timed_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    before = HTTP_REQUEST_DURATION.count(method="GET", route="/items/{item_id}", status="200")
+    client.get("/items/a")
+    client.get("/items/b")
+
+    assert HTTP_REQUEST_DURATION.count(method="GET", route="/items/{item_id}", status="200") == before + 2
+    response = client.get("/metrics")
+    assert response.headers['content-type'].startswith("text/plain")
+    assert 'route="/items/{item_id}"' in response.text
+
+
+DOWNLOAD_IN_WORKER = """
+import asyncio, io, sys, zipfile
+from pathlib import Path
+
+import httpx
+from app.services.asset_download import AssetDownloader
+from app.services.metrics import metrics_publisher
+from app.services.nodeodm_client import NodeODMClient
+
+archive = io.BytesIO()
+with zipfile.ZipFile(archive, 'w') as zf:
+    zf.writestr('odm_orthophoto/odm_orthophoto.tif', b'x' * 5000)
+data = archive.getvalue()
+
+async def main():
+    client = NodeODMClient(base_url="http://nodeodm.test")
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(lambda request: httpx.Response(200, content=data)))
+    await AssetDownloader(client).download('abc', Path(sys.argv[1]), include=[])
+    await client.aclose()
+    metrics_publisher.publish()
+    print(len(data))
+
+asyncio.run(main())
+"""
+
+
+def test_downloads_in_a_worker_process_show_up_in_the_scrape(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'RESULTS_DIR', str(tmp_path / "results"))
+    monkeypatch.setattr(metrics_publisher, '_store', None)
+    app = FastAPI()
+    app.include_router(router)
+    before = DOWNLOAD_BYTES.count()
+
+    worker = subprocess.run(
+        [sys.executable, "-c", DOWNLOAD_IN_WORKER, str(tmp_path / "task")],
+        cwd=Path(__file__).resolve().parents[1],
+        env={**os.environ, 'RESULTS_DIR': str(tmp_path / "results")},
+        capture_output=True, text=True, check=True,
+    )
+    size = int(worker.stdout.split()[-1])
+
+    text = TestClient(app).get("/metrics").text
+    assert f"asset_download_bytes_count {_format_value(before + 1)}" in text
+    assert size < SIZE_BUCKETS[0]
+
+
+def test_snapshots_add_counters_and_histograms_but_not_gauges():
+    worker, api = MetricsRegistry(), MetricsRegistry()
+    for registry in (worker, api):
+        registry.counter("calls_total", "Calls", ("endpoint",))
+        registry.histogram("call_seconds", "Call latency", buckets=(1.0,))
+        registry.gauge("queue", "Queue length")
+    worker._metrics["calls_total"].inc(2, endpoint="/info")
+    worker._metrics["call_seconds"].observe(0.5)
+    worker._metrics["queue"].set(7)
+    api._metrics["calls_total"].inc(1, endpoint="/info")
+    api._metrics["queue"].set(3)
+
+    text = api.render([json.loads(json.dumps(worker.snapshot()))])
+
+    assert 'calls_total{endpoint="/info"} 3' in text
+    assert 'call_seconds_bucket{le="1"} 1' in text
+    assert 'queue 3' in text and 'queue 7' not in text
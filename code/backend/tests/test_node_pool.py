@@ -0,0 +1,80 @@
+"""
+Tests for multi-node NodeODM dispatch
+"""
+
+import pytest
+from pyodm.types import NodeInfo
+
+from app.services.node_pool import NodePool
+from app.services.nodeodm_client import NodeODMError, NodeODMTaskNotFoundError, NodeODMUnavailableError
+
+
+class FakeNode:
+    """Stand-in NodeODM client with a fixed queue and optional outage"""
+
+    def __init__(self, queue, parallel=1, down=False):
+        self.queue = queue
+        self.parallel = parallel
+        self.down = down
+        self.tasks = []
+
+    async def info(self):
+        if self.down:
+            raise NodeODMUnavailableError("down")
+        return NodeInfo({'taskQueueCount': self.queue, 'maxParallelTasks': self.parallel})
+
+    async def create_task(self, files, options=None, name=None):
+        if self.down:
+            raise NodeODMUnavailableError("down")
+        uuid = f"task-{len(self.tasks)}"
+        self.tasks.append(uuid)
+        return uuid
+
+    async def task_info(self, uuid):
+        if self.down:
+            raise NodeODMUnavailableError("down")
+        if uuid not in self.tasks:
+            raise NodeODMTaskNotFoundError(f"{uuid} not found")
+        return None
+
+
+@pytest.mark.asyncio
+async def test_dispatch_prefers_least_loaded_healthy_node():
+    busy, spare, dead = FakeNode(queue=4, parallel=2), FakeNode(queue=1, parallel=2), FakeNode(queue=0, down=True)
+    pool = NodePool(clients={'http://busy': busy, 'http://spare': spare, 'http://dead': dead})
+
+    node_url, uuid = await pool.create_task(["a.JPG"])
+
+    assert node_url == 'http://spare'
+    assert spare.tasks == [uuid]
+    assert not pool.nodes['http://dead'].healthy
+    assert await pool.locate(uuid) is spare
+
+
+@pytest.mark.asyncio
+async def test_dispatch_fails_over_and_locates_unpinned_tasks():
+    flaky, backup = FakeNode(queue=0), FakeNode(queue=3)
+    pool = NodePool(clients={'http://flaky': flaky, 'http://backup': backup})
+    await pool.probe_all()
+    flaky.down = True
+
+    node_url, _ = await pool.create_task(["a.JPG"])
+    assert node_url == 'http://backup'
+
+    backup.tasks.append("created-elsewhere")
+    assert await pool.locate("created-elsewhere") is backup
+    with pytest.raises(NodeODMTaskNotFoundError):
+        await pool.locate("unknown")
+
+    backup.down = True
+    with pytest.raises(NodeODMUnavailableError):
+        await pool.create_task(["a.JPG"])
+
+
+@pytest.mark.asyncio
+async def test_locate_reports_unreachable_nodes_rather_than_a_missing_task():
+    up, down = FakeNode(queue=0), FakeNode(queue=0, down=True)
+    pool = NodePool(clients={'http://up': up, 'http://down': down})
+
+    with pytest.raises(NodeODMUnavailableError):
+        await pool.locate("somewhere")
@@ -0,0 +1,126 @@
+"""
+Tests for the async NodeODM client against a mocked transport
+"""
+
+import json
+
+import httpx
+import pytest
+from pyodm.types import TaskStatus
+
+from app.services.nodeodm_client import NodeODMClient, NodeODMError, NodeODMTaskNotFoundError, NodeODMUnavailableError
+
+
+def make_client(handler) -> NodeODMClient:
+    client = NodeODMClient(base_url="http://nodeodm.test")
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+def task_info_json(uuid: str, code: int, progress: float = 0) -> dict:
+    return {
+        'uuid': uuid,
+        'name': 'flight',
+        'dateCreated': 1700000000000,
+        'processingTime': 1000,
+        'status': {'code': code},
+        'options': [],
+        'imagesCount': 2,
+        'progress': progress,
+    }
+
+
+@pytest.mark.asyncio
+async def test_create_task_uses_init_upload_commit(tmp_path):
+    """Images are uploaded one request each between init and commit"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == '/task/new/init':
+            return httpx.Response(200, json={'uuid': 'abc'})
+        return httpx.Response(200, json={'success': True})
+
+    images = []
+    for name in ('a.JPG', 'b.JPG'):
+        (tmp_path / name).write_bytes(b'jpeg')
+        images.append(tmp_path / name)
+
+    client = make_client(handler)
+    uuid = await client.create_task(images, options={'orthophoto-png': True})
+
+    assert uuid == 'abc'
+    assert calls[0] == '/task/new/init'
+    assert calls.count('/task/new/upload/abc') == 2
+    assert calls[-1] == '/task/new/commit/abc'
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_upload_image_streams_the_file(tmp_path):
+    """The multipart body is streamed from disk with a known length and the given name"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.headers, request.read()))
+        return httpx.Response(200, json={'success': True})
+
+    spooled = tmp_path / "0f3a.part"
+    spooled.write_bytes(b'x' * 200_000)
+
+    client = make_client(handler)
+    await client.upload_image('abc', spooled, filename='DJI_0001.JPG', mime='image/jpeg')
+
+    headers, body = requests[0]
+    assert int(headers['content-length']) == len(body)
+    assert b'filename="DJI_0001.JPG"' in body
+    assert b'x' * 200_000 in body
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_task_info_and_errors():
+    """Info payloads parse into TaskInfo and error payloads raise"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == '/task/good/info':
+            return httpx.Response(200, content=json.dumps(task_info_json('good', 20, 42.5)))
+        if request.url.path == '/task/broken/info':
+            return httpx.Response(200, json={'error': 'Cannot process task'})
+        return httpx.Response(200, json={'error': 'missing not found'})
+
+    client = make_client(handler)
+    info = await client.task_info('good')
+    assert info.status == TaskStatus.RUNNING
+    assert info.progress == 42.5
+
+    with pytest.raises(NodeODMTaskNotFoundError):
+        await client.task_info('missing')
+    with pytest.raises(NodeODMError) as error:
+        await client.task_info('broken')
+    assert not isinstance(error.value, NodeODMTaskNotFoundError)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_node_raises_unavailable():
+    """Connection failures surface as NodeODMUnavailableError"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("connection refused", request=request)
+
+    client = make_client(handler)
+    with pytest.raises(NodeODMUnavailableError):
+        await client.info()
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_dropped_connection_raises_nodeodm_error():
+    """Transport failures other than connecting surface as NodeODMError, not raw httpx errors"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.RemoteProtocolError("peer closed connection", request=request)
+
+    client = make_client(handler)
+    with pytest.raises(NodeODMError) as error:
+        await client.info()
+    assert not isinstance(error.value, NodeODMUnavailableError)
+    await client.aclose()
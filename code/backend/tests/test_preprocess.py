@@ -0,0 +1,68 @@
+"""
+Tests for the image preprocessing stage
+"""
+
+import pytest
+from PIL import ExifTags, Image
+
+from app.core.config import settings
+from app.services.preprocess import PreprocessService
+
+
+def save_frame(path, latitude=None, color=(90, 140, 60), relative_altitude=None):
+    image = Image.new('RGB', (400, 300), color)
+    # Some texture so the image hash has gradients to work with
+    for x in range(0, 400, 50):
+        image.paste((20, 20, 20), (x, 0, x + 10, 300))
+    exif = Image.Exif()
+    exif.get_ifd(ExifTags.IFD.Exif)[41989] = 24
+    if latitude is not None:
+        gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+        gps.update({1: 'N', 2: (latitude, 0.0, 0.0), 3: 'W', 4: (105.0, 0.0, 0.0), 5: 0, 6: 1500.0})
+    comment = f'<x:xmpmeta drone-dji:RelativeAltitude="{relative_altitude}"/>'.encode() if relative_altitude else b''
+    image.save(path, format='JPEG', exif=exif, comment=comment)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_report_rejects_flags_and_drops_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'PREPROCESS_TARGET_GSD', 0.0)
+    first = save_frame(tmp_path / "DJI_0001.JPG", latitude=40.0)
+    hover = save_frame(tmp_path / "DJI_0002.JPG", latitude=40.0)
+    moved = save_frame(tmp_path / "DJI_0003.JPG", latitude=40.001)
+    no_gps = save_frame(tmp_path / "DJI_0004.JPG")
+    corrupt = tmp_path / "DJI_0005.JPG"
+    corrupt.write_bytes(b"\xff\xd8not really a jpeg")
+    service = PreprocessService(max_workers=1)
+
+    try:
+        report = await service.run([first, hover, moved, no_gps, corrupt])
+    finally:
+        service.shutdown()
+
+    assert report['accepted'] == [first, moved, no_gps]
+    assert report['duplicates'] == ["DJI_0002.JPG"]
+    assert report['missing_gps'] == ["DJI_0004.JPG"]
+    assert [item['name'] for item in report['rejected']] == ["DJI_0005.JPG"]
+    first_info = report['images'][0]
+    assert first_info['latitude'] == pytest.approx(40.0)
+    assert first_info['longitude'] == pytest.approx(-105.0)
+    assert first_info['altitude'] == pytest.approx(1500.0)
+
+
+@pytest.mark.asyncio
+async def test_images_finer_than_target_gsd_are_downscaled(tmp_path, monkeypatch):
+    # 100 m above ground with a 24mm-equivalent lens over 400 px is 37.5 cm/px
+    monkeypatch.setattr(settings, 'PREPROCESS_TARGET_GSD', 75.0)
+    frame = save_frame(tmp_path / "DJI_0001.JPG", latitude=40.0, relative_altitude=100)
+    service = PreprocessService(max_workers=1)
+
+    try:
+        report = await service.run([frame])
+    finally:
+        service.shutdown()
+
+    assert report['downscaled'] == ["DJI_0001.JPG"]
+    with Image.open(frame) as image:
+        assert image.size == (200, 150)
+        assert image.getexif().get_ifd(ExifTags.IFD.GPSInfo)
@@ -0,0 +1,40 @@
+"""
+Tests for orthophoto preview generation
+"""
+
+import pytest
+from PIL import Image
+
+from app.services.file_storage import FileStorageService
+from app.services.previews import PreviewService
+
+
+@pytest.mark.asyncio
+async def test_previews_are_rendered_and_listed(tmp_path):
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    ortho_dir = storage.results_dir / "task" / "odm_orthophoto"
+    ortho_dir.mkdir(parents=True)
+    Image.new('RGB', (2000, 1000), (30, 120, 40)).save(ortho_dir / "odm_orthophoto.png")
+    storage.write_manifest("task", {'task_id': "task", 'status': 'completed'})
+    previews = PreviewService(max_workers=1)
+
+    try:
+        rendered = await previews.create_previews(storage.results_dir / "task")
+    finally:
+        previews.shutdown()
+
+    assert (rendered['small']['width'], rendered['small']['height']) == (256, 128)
+    assert (rendered['medium']['width'], rendered['medium']['height']) == (1024, 512)
+    small = previews.preview_path(storage.results_dir / "task", "small")
+    with Image.open(small) as image:
+        assert image.format == 'WEBP'
+    assert previews.preview_path(storage.results_dir / "task", "huge") is None
+
+    storage.update_manifest("task", {'previews': rendered})
+    storage.catalog.refresh_artifacts("task")
+    items, _ = storage.list_tasks_with_orthophoto()
+    assert items[0]['previews']['medium'] == {
+        'url': "/api/v1/results/task/previews/medium.webp",
+        'width': 1024,
+        'height': 512,
+    }
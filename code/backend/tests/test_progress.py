@@ -0,0 +1,38 @@
+"""
+Tests for progress fan-out to streaming subscribers
+"""
+
+import pytest
+
+from app.services.progress import SUBSCRIBER_BUFFER, ProgressHub
+
+
+@pytest.mark.asyncio
+async def test_events_fan_out_and_late_subscribers_get_latest():
+    hub = ProgressHub()
+    first = hub.subscribe("task")
+    hub.publish("task", {'stage': 'processing', 'progress': 10.0})
+    late = hub.subscribe("task")
+
+    assert (await first.get())['progress'] == 10.0
+    assert (await late.get()) == {'taskId': "task", 'stage': 'processing', 'progress': 10.0}
+
+    hub.publish("task", {'stage': 'completed', 'results': None})
+    assert (await first.get())['stage'] == 'completed'
+    assert (await late.get())['stage'] == 'completed'
+    assert hub.latest("task") is None
+
+    hub.unsubscribe("task", first)
+    hub.unsubscribe("task", late)
+    assert hub.subscriber_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_keeps_only_recent_events():
+    hub = ProgressHub()
+    queue = hub.subscribe("task")
+    for progress in range(SUBSCRIBER_BUFFER + 5):
+        hub.publish("task", {'stage': 'processing', 'progress': float(progress)})
+
+    assert queue.qsize() == SUBSCRIBER_BUFFER
+    assert (await queue.get())['progress'] == 5.0
@@ -0,0 +1,60 @@
+"""
+Tests for Cloud-Optimized GeoTIFF conversion and bbox crops
+"""
+
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from app.services.rasters import WindowError, WindowTooLargeError, convert_to_cog, describe_raster, read_window
+
+
+@pytest.fixture
+def dsm(tmp_path):
+    """A 1024x1024 striped (non-tiled) elevation GeoTIFF at 0.1 m/pixel in UTM 17N"""
+    path = tmp_path / "dsm.tif"
+    data = np.arange(1024 * 1024, dtype=np.float32).reshape(1, 1024, 1024)
+    with rasterio.open(
+        path, 'w', driver='GTiff', width=1024, height=1024, count=1, dtype='float32',
+        crs='EPSG:32617', transform=from_origin(500000.0, 4000000.0, 0.1, 0.1), nodata=-9999.0,
+    ) as dst:
+        dst.write(data)
+    return path
+
+
+def test_convert_to_cog_tiles_and_adds_overviews(dsm):
+    assert describe_raster(str(dsm))['overviews'] == []
+
+    info = convert_to_cog(str(dsm), 256, "DEFLATE")
+
+    assert info['block_size'] == [256, 256]
+    assert info['overviews']
+    assert info['crs'] == 'EPSG:32617'
+    assert not dsm.with_name("dsm.tif.part").exists()
+    # Already optimized files are left untouched
+    mtime = dsm.stat().st_mtime_ns
+    convert_to_cog(str(dsm), 256, "DEFLATE")
+    assert dsm.stat().st_mtime_ns == mtime
+
+
+def test_read_window_crops_and_resamples(dsm):
+    convert_to_cog(str(dsm), 256, "DEFLATE")
+    bbox = (500010.0, 3999970.0, 500020.0, 3999990.0)
+
+    with MemoryFile(read_window(str(dsm), bbox, None, None, 'nearest', 10 ** 6)) as memfile, memfile.open() as crop:
+        assert (crop.width, crop.height) == (100, 200)
+        assert crop.bounds == pytest.approx(bbox)
+        # Row 100, column 100 of the source is the top-left pixel of the crop
+        assert crop.read(1)[0, 0] == 100 * 1024 + 100
+
+    with MemoryFile(read_window(str(dsm), bbox, None, 1.0, 'average', 10 ** 6)) as memfile, memfile.open() as coarse:
+        assert (coarse.width, coarse.height) == (10, 20)
+        assert coarse.res == pytest.approx((1.0, 1.0))
+
+    with pytest.raises(WindowTooLargeError):
+        read_window(str(dsm), bbox, None, None, 'nearest', 1000)
+    with pytest.raises(WindowError):
+        read_window(str(dsm), (0.0, 0.0, 1.0, 1.0), None, None, 'nearest', 10 ** 6)
@@ -0,0 +1,64 @@
+"""
+Tests for conditional, range and precompressed artifact responses
+"""
+
+import hashlib
+import json
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.api.responses import artifact_response
+from app.services.artifacts import artifact_store
+
+
+def make_client(path, media_type):
+    app = FastAPI()
+
+    @app.get("/artifact")
+    async def artifact(request: Request):
+        return await artifact_response(request, path, media_type=media_type)
+
+    return TestClient(app)
+
+
+def test_validators_304_and_ranges(tmp_path):
+    path = tmp_path / "odm_orthophoto.png"
+    payload = bytes(range(256)) * 40
+    path.write_bytes(payload)
+    client = make_client(path, "image/png")
+
+    full = client.get("/artifact")
+    etag = full.headers["etag"]
+    assert full.content == payload
+    assert etag == f'"{hashlib.sha256(payload).hexdigest()}"'
+    assert "immutable" in full.headers["cache-control"]
+
+    assert client.get("/artifact", headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get("/artifact", headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.content == payload[100:200]
+    assert partial.headers["content-range"] == f"bytes 100-199/{len(payload)}"
+
+    stale = client.get("/artifact", headers={"Range": "bytes=100-199", "If-Range": '"outdated"'})
+    assert stale.status_code == 200
+
+    assert client.get("/artifact", headers={"Range": f"bytes={len(payload)}-"}).status_code == 416
+
+
+def test_precompressed_variant_is_negotiated(tmp_path):
+    path = tmp_path / "stats.json"
+    payload = json.dumps({"points": list(range(2000))}).encode()
+    path.write_bytes(payload)
+    assert artifact_store.precompress(path)
+    client = make_client(path, "application/json")
+
+    compressed = client.get("/artifact", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.content == payload
+    assert compressed.headers["vary"] == "Accept-Encoding"
+
+    plain = client.get("/artifact", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != compressed.headers["etag"]
@@ -0,0 +1,47 @@
+"""
+Tests for the SQLite results catalog
+"""
+
+from app.services.file_storage import FileStorageService
+
+
+def make_task(storage: FileStorageService, task_id: str, name: str, created_at: str, with_ortho: bool = True):
+    storage.write_manifest(task_id, {'task_id': task_id, 'task_name': name, 'created_at': created_at})
+    if with_ortho:
+        ortho_dir = storage.results_dir / task_id / "odm_orthophoto"
+        ortho_dir.mkdir(parents=True)
+        (ortho_dir / "odm_orthophoto.png").write_bytes(b"png" * 10)
+    storage.catalog.refresh_artifacts(task_id)
+
+
+def test_listing_pages_sorts_and_filters(tmp_path):
+    storage = FileStorageService(results_dir=tmp_path)
+    for i in range(5):
+        make_task(storage, f"task-{i}", f"North field {i}" if i % 2 else f"South field {i}", f"2025-10-0{i + 1}T00:00:00")
+    make_task(storage, "pending", "North field pending", "2025-10-09T00:00:00", with_ortho=False)
+
+    items, total = storage.list_tasks_with_orthophoto(page=1, page_size=2)
+    assert total == 5
+    assert [item['taskId'] for item in items] == ["task-4", "task-3"]
+    assert items[0]['orthophotoSize'] == 30
+
+    items, total = storage.list_tasks_with_orthophoto(page=3, page_size=2, order='asc')
+    assert [item['taskId'] for item in items] == ["task-4"]
+
+    items, total = storage.list_tasks_with_orthophoto(name="north")
+    assert total == 2
+    assert {item['taskName'] for item in items} == {"North field 1", "North field 3"}
+
+
+def test_rebuild_repairs_drift(tmp_path):
+    storage = FileStorageService(results_dir=tmp_path)
+    make_task(storage, "kept", "Kept", "2025-10-01T00:00:00")
+    storage.catalog.upsert_manifest({'task_id': 'ghost', 'task_name': 'Ghost'})
+
+    # A task that exists on disk but was never indexed
+    (tmp_path / "unindexed" / "odm_orthophoto").mkdir(parents=True)
+    (tmp_path / "unindexed" / "odm_orthophoto" / "odm_orthophoto.png").write_bytes(b"png")
+
+    assert storage.catalog.rebuild() == 2
+    assert storage.catalog.get('ghost') is None
+    assert storage.catalog.get('unindexed')['has_orthophoto'] == 1
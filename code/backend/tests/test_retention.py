@@ -0,0 +1,183 @@
+"""
+Tests for the retention janitor and task deletion
+"""
+
+import gzip
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1 import upload
+from app.core.config import settings
+from app.main import app
+from app.services.blob_store import BlobStore
+from app.services.file_storage import FileStorageService
+from app.services.node_pool import NodePool
+from app.services.retention import RetentionService
+from app.services.status_cache import StatusCache
+from app.services.task_supervisor import TaskSupervisor
+from app.services.tiles import TileService
+
+
+class FakeClient:
+    """Stand-in NodeODM client recording removed tasks"""
+
+    def __init__(self):
+        self.removed = []
+
+    async def remove_task(self, uuid, quiet=False):
+        self.removed.append(uuid)
+        return True
+
+
+@pytest.fixture
+def janitor(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'RETENTION_MAX_BYTES', 0)
+    monkeypatch.setattr(settings, 'RETENTION_DELETE_UPLOADS', True)
+    monkeypatch.setattr(settings, 'RETENTION_COMPACT_AFTER_DAYS', 30.0)
+    monkeypatch.setattr(settings, 'RETENTION_TRIM_PATHS', ["opensfm"])
+    monkeypatch.setattr(settings, 'RETENTION_COMPRESS_MIN_BYTES', 100)
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    pool = NodePool(clients={'http://node': FakeClient()})
+    return RetentionService(
+        storage=storage,
+        store=BlobStore(tmp_path / "blobs"),
+        tiles=TileService(storage=storage, cache_dir=tmp_path / "tiles"),
+        supervisor=TaskSupervisor(storage=storage, pool=pool),
+        pool=pool,
+        cache=StatusCache(pool=pool, ttl=1, max_entries=10),
+        upload_dir=tmp_path / "uploads",
+    )
+
+
+def add_task(janitor, task_id, status='completed', completed_at='2024-01-01T00:00:00', upload_bytes=1000, **fields):
+    janitor.storage.write_manifest(task_id, {
+        'task_id': task_id,
+        'nodeodm_task_id': f"n-{task_id}",
+        'status': status,
+        'created_at': '2024-01-01T00:00:00',
+        'completed_at': completed_at,
+        **fields,
+    })
+    ortho = janitor.storage.results_dir / task_id / "odm_orthophoto" / "odm_orthophoto.png"
+    ortho.parent.mkdir(parents=True)
+    ortho.write_bytes(b"p" * 2000)
+    upload = janitor.upload_dir / task_id / "DJI_0001.JPG"
+    upload.parent.mkdir(parents=True)
+    upload.write_bytes(b"j" * upload_bytes)
+
+
+def test_plan_deletes_uploads_compacts_old_tasks_and_respects_pins(janitor):
+    add_task(janitor, "old")
+    (janitor.storage.results_dir / "old" / "opensfm").mkdir()
+    (janitor.storage.results_dir / "old" / "opensfm" / "reconstruction.json").write_bytes(b"r" * 500)
+    (janitor.storage.results_dir / "old" / "task_output.txt").write_text("log line\n" * 50)
+    add_task(janitor, "pinned", pinned=True)
+    add_task(janitor, "running", status='processing', completed_at=None)
+
+    report = janitor.plan()
+
+    actions = {(action['task_id'], action['action']): action for action in report['actions']}
+    assert set(actions) == {("old", "delete_uploads"), ("old", "compact")}
+    assert sorted(actions[("old", "compact")]['paths']) == ["opensfm", "task_output.txt"]
+    assert actions[("old", "compact")]['bytes'] == 500
+    # Planning changes nothing on disk
+    assert (janitor.upload_dir / "old").exists()
+
+
+@pytest.mark.asyncio
+async def test_sweep_applies_policies(janitor):
+    add_task(janitor, "old")
+    (janitor.storage.results_dir / "old" / "opensfm").mkdir()
+    log = janitor.storage.results_dir / "old" / "task_output.txt"
+    log.write_text("log line\n" * 50)
+
+    report = await janitor.sweep(dry_run=False)
+
+    assert report['freed_bytes'] > 1000
+    assert not (janitor.upload_dir / "old").exists()
+    assert not (janitor.storage.results_dir / "old" / "opensfm").exists()
+    assert not log.exists()
+    assert gzip.decompress(log.with_name("task_output.txt.gz").read_bytes()).startswith(b"log line")
+    manifest = janitor.storage.read_manifest("old")
+    assert manifest['compacted'] and manifest['uploads_deleted_at']
+    # A second sweep has nothing left to do
+    assert (await janitor.sweep(dry_run=False))['actions'] == []
+
+
+@pytest.mark.asyncio
+async def test_quota_evicts_least_recently_viewed_tasks(janitor, monkeypatch):
+    monkeypatch.setattr(settings, 'RETENTION_DELETE_UPLOADS', False)
+    for task_id in ("a", "b", "c"):
+        add_task(janitor, task_id, completed_at=f"2024-01-0{'abc'.index(task_id) + 1}T00:00:00")
+    janitor.storage.catalog.record_access("a", "2024-06-01T00:00:00")
+    # Each task uses a little over 3000 bytes; the quota fits two
+    monkeypatch.setattr(settings, 'RETENTION_MAX_BYTES', 7000)
+
+    report = await janitor.sweep(dry_run=False)
+
+    assert [(action['task_id'], action['action']) for action in report['actions']] == [("b", "evict")]
+    assert janitor.storage.catalog.get("b") is None
+    assert not (janitor.storage.results_dir / "b").exists()
+    assert janitor.pool.client_for('http://node').removed == ["n-b"]
+
+
+
+@pytest.mark.asyncio
+async def test_uploads_in_progress_are_never_evicted(janitor, monkeypatch):
+    add_task(janitor, "uploading", status=None, completed_at=None)
+    add_task(janitor, "abandoned", status=None, completed_at=None)
+    stale = time.time() - 2 * 86400
+    for path in (janitor.upload_dir / "abandoned", janitor.storage.results_dir / "abandoned" / "manifest.json"):
+        os.utime(path, (stale, stale))
+    monkeypatch.setattr(settings, 'RETENTION_MAX_BYTES', 1)
+
+    report = await janitor.sweep(dry_run=False)
+
+    assert [(action['task_id'], action['action']) for action in report['actions']] == [("abandoned", "evict")]
+    assert (janitor.upload_dir / "uploading" / "DJI_0001.JPG").exists()
+
+
+@pytest.mark.asyncio
+async def test_delete_task_removes_everything(janitor):
+    add_task(janitor, "t", status='processing', completed_at=None, node_url='http://node')
+    janitor.supervisor.watch("t", "n-t", 'http://node')
+
+    deleted = await janitor.delete_task("t")
+
+    assert deleted['freed_bytes'] > 3000
+    assert not janitor.supervisor.is_watched("t")
+    assert not (janitor.storage.results_dir / "t").exists()
+    assert not (janitor.upload_dir / "t").exists()
+    assert janitor.storage.catalog.get("t") is None
+    assert janitor.pool.client_for('http://node').removed == ["n-t"]
+    assert await janitor.delete_task("t") is None
+
+
+@pytest.mark.parametrize('path', ["%2E%2E", "..%2Fpin", "%2E%2E%2F%2E%2E", "t%2F..%2F..", "%2E"])
+def test_delete_and_pin_routes_reject_path_traversal(janitor, monkeypatch, path):
+    monkeypatch.setattr(upload, 'retention_service', janitor)
+    add_task(janitor, "t")
+    sentinel = janitor.storage.results_dir.parent / "keep.txt"
+    sentinel.write_text("keep")
+    client = TestClient(app)
+
+    for method, url in (('DELETE', f"/api/v1/upload/{path}"), ('PUT', f"/api/v1/upload/{path}/pin"), ('DELETE', f"/api/v1/upload/{path}/pin")):
+        response = client.request(method, url)
+        assert response.status_code in (400, 404, 405), (method, url)
+    assert sentinel.exists()
+    assert (janitor.storage.results_dir / "t" / "manifest.json").exists()
+    assert not (janitor.storage.results_dir.parent / "manifest.json").exists()
+    assert client.delete("/api/v1/upload/%2E%2E").status_code == 400
+    assert client.put("/api/v1/upload/%2E%2E/pin").status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_service_rejects_ids_outside_its_directories(janitor):
+    for task_id in ("..", ".", "", "a/..", "../t"):
+        with pytest.raises(ValueError):
+            await janitor.delete_task(task_id)
+        with pytest.raises(ValueError):
+            janitor.set_pinned(task_id, True)
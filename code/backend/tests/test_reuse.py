@@ -0,0 +1,95 @@
+"""
+Tests for result reuse across resubmitted image sets
+"""
+
+import pytest
+
+from app.core.config import settings
+from app.services.file_storage import FileStorageService
+from app.services.node_pool import NodePool
+from app.services.progress import ProgressHub
+from app.services.reuse import ReuseService, task_fingerprint
+from app.services.task_supervisor import TaskSupervisor
+
+OPTIONS = {'orthophoto-resolution': 3.0}
+
+
+@pytest.fixture
+def reuse(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REUSE_ENABLED', True)
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    supervisor = TaskSupervisor(storage=storage, pool=NodePool(clients={'http://node': object()}), hub=ProgressHub())
+    return ReuseService(storage=storage, supervisor=supervisor)
+
+
+def add_task(reuse, task_id, status, fingerprint, created_at, with_results=False):
+    reuse.storage.write_manifest(task_id, {
+        'task_id': task_id,
+        'status': status,
+        'fingerprint': fingerprint,
+        'created_at': created_at,
+        **({'previews': {'small': {'width': 4, 'height': 4, 'bytes': 10}}} if with_results else {}),
+    })
+    if with_results:
+        ortho = reuse.storage.results_dir / task_id / "odm_orthophoto" / "odm_orthophoto.png"
+        ortho.parent.mkdir(parents=True)
+        ortho.write_bytes(b"png")
+        reuse.storage.catalog.refresh_artifacts(task_id)
+
+
+def test_fingerprint_ignores_order_but_not_content_or_options():
+    fingerprint = task_fingerprint(["b", "a"], OPTIONS)
+
+    assert fingerprint == task_fingerprint(["a", "b"], dict(OPTIONS))
+    assert fingerprint != task_fingerprint(["a", "c"], OPTIONS)
+    assert fingerprint != task_fingerprint(["a", "b"], {'orthophoto-resolution': 5.0})
+
+
+@pytest.mark.asyncio
+async def test_completed_match_links_results_at_once(reuse, monkeypatch):
+    add_task(reuse, "failed", 'failed', "fp", '2024-01-01T00:00:00')
+    add_task(reuse, "done", 'completed', "fp", '2024-01-02T00:00:00', with_results=True)
+    add_task(reuse, "other", 'completed', "other-fp", '2024-01-03T00:00:00', with_results=True)
+    add_task(reuse, "new", None, "fp", '2024-01-04T00:00:00')
+
+    reused = await reuse.reuse("new", "fp")
+
+    assert reused == {'status': 'completed', 'reused_from': "done"}
+    manifest = reuse.storage.read_manifest("new")
+    assert manifest['status'] == 'completed' and manifest['reused_from'] == "done"
+    assert manifest['previews'] == reuse.storage.read_manifest("done")['previews']
+    source = reuse.storage.get_image_path("done")
+    linked = reuse.storage.get_image_path("new")
+    assert linked.stat().st_ino == source.stat().st_ino
+    assert reuse.storage.result_links("new")['taskId'] == "new"
+    # Nothing matches with reuse turned off
+    monkeypatch.setattr(settings, 'REUSE_ENABLED', False)
+    add_task(reuse, "newer", None, "fp", '2024-01-05T00:00:00')
+    assert await reuse.reuse("newer", "fp") is None
+
+
+@pytest.mark.asyncio
+async def test_in_flight_match_attaches_until_the_source_completes(reuse):
+    add_task(reuse, "running", 'processing', "fp", '2024-01-01T00:00:00')
+    add_task(reuse, "dup", None, "fp", '2024-01-02T00:00:00')
+    add_task(reuse, "dup2", None, "fp", '2024-01-03T00:00:00')
+    supervisor = reuse.supervisor
+    queue = supervisor.hub.subscribe("dup")
+
+    assert await reuse.reuse("dup", "fp") == {'status': 'processing', 'reused_from': "running"}
+    # A second duplicate attaches to the task that is actually processing, not to the first duplicate
+    assert (await reuse.reuse("dup2", "fp"))['reused_from'] == "running"
+    supervisor._publish("running", {'stage': 'processing', 'status': 'running', 'progress': 40.0})
+    assert (await queue.get())['progress'] == 40.0
+
+    ortho = reuse.storage.results_dir / "running" / "odm_orthophoto" / "odm_orthophoto.png"
+    ortho.parent.mkdir(parents=True)
+    ortho.write_bytes(b"png")
+    reuse.storage.update_manifest("running", {'status': 'completed'})
+    supervisor._complete_attached("running")
+
+    for task_id in ("dup", "dup2"):
+        assert reuse.storage.read_manifest(task_id)['status'] == 'completed'
+        assert reuse.storage.get_image_path(task_id).read_bytes() == b"png"
+    event = await queue.get()
+    assert event['stage'] == 'completed' and event['results']['taskId'] == "dup"
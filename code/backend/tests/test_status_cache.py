@@ -0,0 +1,99 @@
+"""
+Tests for the coalescing task status cache
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from pyodm.types import TaskInfo
+
+from app.api.v1 import upload
+from app.core.config import settings
+from app.main import app
+from app.services.node_pool import NodePool
+from app.services.nodeodm_client import NodeODMError, NodeODMTaskNotFoundError, NodeODMUnavailableError
+from app.services.status_cache import StatusCache
+
+
+def task_info(uuid, code):
+    return TaskInfo({
+        'uuid': uuid, 'name': uuid, 'dateCreated': 0, 'processingTime': 0,
+        'status': {'code': code}, 'options': [], 'imagesCount': 1, 'progress': 50,
+    })
+
+
+class SlowNode:
+    """Stand-in NodeODM client that counts upstream status calls"""
+
+    def __init__(self, code=20):
+        self.code = code
+        self.calls = 0
+
+    async def task_info(self, uuid):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return task_info(uuid, self.code)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_call_until_ttl_expires():
+    node = SlowNode()
+    pool = NodePool(clients={'http://node': node})
+    pool.pin("task", 'http://node')
+    cache = StatusCache(pool=pool, ttl=0.05, max_entries=10)
+
+    results = await asyncio.gather(*(cache.get("task") for _ in range(20)))
+    await cache.get("task")
+
+    assert node.calls == 1
+    assert all(info is results[0] for info in results)
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 19, 1)
+    await asyncio.sleep(0.06)
+    await cache.get("task")
+    assert node.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_terminal_states_persist_and_entries_are_bounded():
+    node = SlowNode(code=40)
+    pool = NodePool(clients={'http://node': node})
+    cache = StatusCache(pool=pool, ttl=0, max_entries=2)
+    for uuid in ("a", "b"):
+        pool.pin(uuid, 'http://node')
+        await cache.get(uuid)
+
+    await cache.get("a")
+    assert node.calls == 2
+
+    cache.put("c", task_info("c", 20))
+    assert len(cache) == 2
+    await cache.get("b")
+    # "b" was least recently used and had to be fetched again
+    assert node.calls == 3
+
+
+class FailingNode:
+    """Stand-in NodeODM client whose status calls raise a given error"""
+
+    def __init__(self, error):
+        self.error = error
+
+    async def task_info(self, uuid):
+        raise self.error
+
+
+@pytest.mark.parametrize("error, status_code", [
+    (NodeODMTaskNotFoundError("task not found"), 404),
+    (NodeODMUnavailableError("node is down"), 503),
+    (NodeODMError("Cannot process task"), 502),
+])
+def test_status_endpoint_tells_missing_tasks_from_node_failures(tmp_path, monkeypatch, error, status_code):
+    monkeypatch.setattr(settings, 'RESULTS_DIR', str(tmp_path))
+    pool = NodePool(clients={'http://node': FailingNode(error)})
+    pool.pin("task", 'http://node')
+    monkeypatch.setattr(upload, 'status_cache', StatusCache(pool=pool, ttl=1, max_entries=10))
+
+    response = TestClient(app).get("/api/v1/upload/task/status")
+
+    assert response.status_code == status_code
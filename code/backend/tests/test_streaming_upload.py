@@ -0,0 +1,177 @@
+"""
+Tests for the pipelined pass-through upload
+"""
+
+import hashlib
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from pyodm.types import NodeInfo
+from starlette.requests import Request
+
+from app.api.multipart import iter_form_parts
+from app.api.v1 import upload
+from app.core.config import settings
+from app.main import app
+from app.services.blob_store import BlobStore
+from app.services.node_pool import NodePool
+
+BOUNDARY = "testboundary"
+
+
+def multipart_body(parts):
+    chunks = []
+    for name, filename, content_type, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        headers = f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            headers += f"Content-Type: {content_type}\r\n"
+        chunks.append(headers.encode() + b"\r\n" + data + b"\r\n")
+    return b"".join(chunks) + f"--{BOUNDARY}--\r\n".encode()
+
+
+@pytest.mark.asyncio
+async def test_parts_are_yielded_before_the_body_ends():
+    body = multipart_body([
+        ("task_name", None, None, b"Field 7"),
+        ("files", "a.JPG", "image/jpeg", b"a" * 5000),
+        ("files", "b.JPG", "image/jpeg", b"b" * 5000),
+    ])
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+    sent = []
+
+    async def receive():
+        chunk = chunks[len(sent)]
+        sent.append(chunk)
+        return {'type': 'http.request', 'body': chunk, 'more_body': len(sent) < len(chunks)}
+
+    request = Request({
+        'type': 'http', 'method': 'POST', 'path': '/',
+        'headers': [(b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode())],
+    }, receive)
+
+    seen = []
+    async for part in iter_form_parts(request, max_part_size=10_000):
+        seen.append((part.name, part.filename, len(part.data), len(sent)))
+
+    assert [item[:3] for item in seen] == [("task_name", None, 7), ("files", "a.JPG", 5000), ("files", "b.JPG", 5000)]
+    # The first image was handed out while the second was still being received
+    assert seen[1][3] < len(chunks)
+
+
+@pytest.mark.asyncio
+async def test_file_parts_are_spooled_to_disk(tmp_path):
+    body = multipart_body([
+        ("task_name", None, None, b"Field 7"),
+        ("files", "a.JPG", "image/jpeg", b"a" * 5000),
+    ])
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+    request = Request({
+        'type': 'http', 'method': 'POST', 'path': '/',
+        'headers': [(b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode())],
+    }, receive)
+
+    parts = [part async for part in iter_form_parts(request, max_part_size=10_000, spool_dir=tmp_path)]
+
+    assert parts[0].path is None and parts[0].text == "Field 7"
+    assert parts[1].data == b"" and parts[1].path.read_bytes() == b"a" * 5000
+    assert parts[1].size == 5000
+    assert parts[1].sha256 == hashlib.sha256(b"a" * 5000).hexdigest()
+
+
+class FakeNode:
+    """Stand-in NodeODM client recording the init/upload/commit flow"""
+
+    def __init__(self):
+        self.calls = []
+        self.uploaded = {}
+
+    async def info(self):
+        return NodeInfo({'taskQueueCount': 0, 'maxParallelTasks': 1})
+
+    async def init_task(self, options=None, name=None):
+        self.calls.append(('init', name))
+        return "nodeodm-task"
+
+    async def upload_image(self, uuid, path, filename=None, mime=None):
+        self.calls.append(('upload', filename))
+        self.uploaded[filename] = path.read_bytes()
+
+    async def commit_task(self, uuid):
+        self.calls.append(('commit', uuid))
+
+    async def remove_task(self, uuid, quiet=False):
+        self.calls.append(('remove', uuid))
+
+
+@pytest.fixture
+def streaming_env(tmp_path, monkeypatch):
+    node = FakeNode()
+    monkeypatch.setattr(upload, 'blob_store', BlobStore(tmp_path / "blobs"))
+    monkeypatch.setattr(settings, 'RESULTS_DIR', str(tmp_path / "results"))
+    monkeypatch.setattr(settings, 'UPLOAD_DIR', str(tmp_path / "uploads"))
+    monkeypatch.setattr(settings, 'UPLOAD_KEEP_LOCAL', False)
+    monkeypatch.setattr(upload, 'node_pool', NodePool(clients={'http://fake': node}))
+    monkeypatch.setattr(upload.task_supervisor, 'watch', lambda *args: None)
+    return node
+
+
+def test_stream_endpoint_forwards_images_and_commits(streaming_env):
+    body = multipart_body([
+        ("files", "a.JPG", "image/jpeg", b"a" * 100),
+        ("files", "b.JPG", "image/jpeg", b"b" * 100),
+    ])
+    response = TestClient(app).post(
+        "/api/v1/upload/stream?task_name=Field%207",
+        content=body,
+        headers={'content-type': f'multipart/form-data; boundary={BOUNDARY}'},
+    )
+
+    assert response.status_code == 201
+    assert response.json()['files'] == ["a.JPG", "b.JPG"]
+    calls = streaming_env.calls
+    assert calls[0] == ('init', "Field 7")
+    assert sorted(calls[1:3]) == [('upload', "a.JPG"), ('upload', "b.JPG")]
+    assert calls[3] == ('commit', "nodeodm-task")
+    assert streaming_env.uploaded == {"a.JPG": b"a" * 100, "b.JPG": b"b" * 100}
+    # Spooled images are removed once they are on the node
+    assert not list(upload.blob_store.staging_dir.iterdir())
+
+
+def test_stream_endpoint_removes_task_on_invalid_file(streaming_env):
+    body = multipart_body([
+        ("files", "a.JPG", "image/jpeg", b"a" * 100),
+        ("files", "notes.txt", "text/plain", b"hello"),
+    ])
+    response = TestClient(app).post(
+        "/api/v1/upload/stream",
+        content=body,
+        headers={'content-type': f'multipart/form-data; boundary={BOUNDARY}'},
+    )
+
+    assert response.status_code == 400
+    assert ('remove', "nodeodm-task") in streaming_env.calls
+    assert ('commit', "nodeodm-task") not in streaming_env.calls
+    assert not list(upload.blob_store.staging_dir.iterdir())
+
+
+def test_oversized_upload_is_refused_before_it_is_read(streaming_env, monkeypatch):
+    monkeypatch.setattr(upload, 'MAX_FILES', 1)
+    monkeypatch.setattr(upload, 'FORM_OVERHEAD_BYTES', 500)
+    monkeypatch.setattr(settings, 'MAX_FILE_SIZE', 1000)
+    body = multipart_body([("files", "a.JPG", "image/jpeg", b"a" * 5000)])
+    headers = {'content-type': f'multipart/form-data; boundary={BOUNDARY}'}
+    client = TestClient(app)
+
+    declared = client.post("/api/v1/upload/", content=body, headers=headers)
+    # Without a Content-Length the body is cut off once it passes the limit
+    chunked = client.post("/api/v1/upload/", content=iter([body[i:i + 100] for i in range(0, len(body), 100)]), headers=headers)
+
+    assert (declared.status_code, chunked.status_code) == (413, 413)
+    assert not Path(settings.UPLOAD_DIR).exists()
@@ -0,0 +1,115 @@
+"""
+Tests for the task state and leases shared between worker processes
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from app.services.file_storage import FileStorageService
+from app.services.node_pool import NodePool
+from app.services.progress import ProgressHub
+from app.services.task_store import TaskStore, task_lease
+from app.services.task_supervisor import TaskSupervisor
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileStorageService(results_dir=tmp_path)
+
+
+def test_lease_is_exclusive_until_it_expires(tmp_path):
+    store = TaskStore(tmp_path / "state.db")
+    # A second connection to the same file stands in for another worker process
+    other = TaskStore(tmp_path / "state.db")
+
+    assert store.acquire("task:a", "w1", ttl=30)
+    assert not other.acquire("task:a", "w2", ttl=30)
+    assert store.acquire("task:a", "w1", ttl=30)
+    assert store.renew("w1", ttl=30) == {"task:a"}
+
+    assert store.acquire("task:b", "w1", ttl=-1)
+    assert other.acquire("task:b", "w2", ttl=30)
+    assert store.renew("w1", ttl=30) == {"task:a"}
+    store.release_all("w1")
+    assert other.acquire("task:a", "w2", ttl=30)
+
+
+
+@pytest.mark.asyncio
+async def test_held_lease_is_renewed_past_its_ttl(tmp_path):
+    store = TaskStore(tmp_path / "state.db")
+    other = TaskStore(tmp_path / "state.db")
+
+    async with store.hold("reuse:x", "w1", ttl=0.3):
+        await asyncio.sleep(0.6)
+        assert not other.acquire("reuse:x", "w2", ttl=30)
+    assert other.acquire("reuse:x", "w2", ttl=30)
+
+def test_tasks_move_to_another_worker_when_leases_lapse(storage):
+    store = TaskStore.for_directory(storage.results_dir)
+    pool = NodePool(clients={'http://node': object()})
+    first = TaskSupervisor(storage=storage, pool=pool, hub=ProgressHub(), store=store, worker_id="w1")
+    second = TaskSupervisor(storage=storage, pool=pool, hub=ProgressHub(), store=store, worker_id="w2")
+    storage.write_manifest('a', {'task_id': 'a', 'nodeodm_task_id': 'n-a', 'status': 'processing'})
+
+    assert first.watch('a', 'n-a', 'http://node')
+    # Only one worker drives a task
+    assert second.restore() == 0
+    assert not second.watch('a', 'n-a', 'http://node')
+    assert not second.is_watched('a')
+
+    # The second worker streams progress it reads from the store
+    queue = second.hub.subscribe('a')
+    store.upsert('a', node_status='RUNNING', progress=40.0)
+    second._publish_followed()
+    event = queue.get_nowait()
+    assert (event['stage'], event['status'], event['progress']) == ('processing', 'RUNNING', 40.0)
+    second._publish_followed()
+    assert queue.empty()
+
+    # The first worker stops renewing, e.g. because it crashed
+    store.release_all("w1")
+    second._sync()
+    assert second.is_watched('a')
+    assert store.renew("w2", ttl=30) == {task_lease('a')}
+    first._sync()
+    assert not first.is_watched('a')
+
+
+def test_importing_the_app_creates_no_databases(tmp_path):
+    backend = Path(__file__).resolve().parents[1]
+    subprocess.run(
+        [sys.executable, "-c", "import app.main, worker"],
+        cwd=tmp_path,
+        env={**os.environ, 'PYTHONPATH': str(backend)},
+        check=True,
+    )
+
+    assert not list(tmp_path.rglob("*.db"))
+
+
+def test_concurrent_manifest_updates_keep_every_field(storage):
+    storage.write_manifest('a', {'task_id': 'a', 'status': 'processing'})
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: storage.update_manifest('a', {f"field_{i}": i}), range(32)))
+
+    manifest = storage.read_manifest('a')
+    assert all(manifest[f"field_{i}"] == i for i in range(32))
+    assert manifest['status'] == 'processing'
+    assert [path.name for path in (storage.results_dir / 'a').iterdir()] == ["manifest.json"]
+
+
+def test_unreadable_manifest_is_not_replaced_by_an_update(storage):
+    manifest_path = storage.results_dir / 'a' / "manifest.json"
+    manifest_path.parent.mkdir()
+    manifest_path.write_text('{"task_id": "a", "status": ')
+
+    with pytest.raises(ValueError):
+        storage.update_manifest('a', {'status': 'failed'})
+    assert manifest_path.read_text() == '{"task_id": "a", "status": '
@@ -0,0 +1,118 @@
+"""
+Tests for the batched task supervisor
+"""
+
+import pytest
+from pyodm.types import TaskInfo
+
+from app.services.file_storage import FileStorageService
+from app.services.node_pool import NodePool
+from app.services.task_supervisor import TaskSupervisor
+
+
+class FakeClient:
+    """Stand-in NodeODM client returning canned task states"""
+
+    def __init__(self, states):
+        self.states = states
+        self.info_calls = 0
+        self.downloads = []
+
+    async def task_list(self):
+        return list(self.states)
+
+    async def task_info(self, uuid):
+        self.info_calls += 1
+        code, progress = self.states[uuid]
+        return TaskInfo({
+            'uuid': uuid, 'name': uuid, 'dateCreated': 0, 'processingTime': 0,
+            'status': {'code': code}, 'options': [], 'imagesCount': 1, 'progress': progress,
+        })
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileStorageService(results_dir=tmp_path)
+
+
+def test_restore_rebuilds_watch_list(storage):
+    """Only manifests of in-flight tasks are picked up at startup"""
+    storage.write_manifest('a', {'task_id': 'a', 'nodeodm_task_id': 'n-a', 'status': 'processing'})
+    storage.write_manifest('b', {'task_id': 'b', 'nodeodm_task_id': 'n-b', 'status': 'completed'})
+    storage.write_manifest('c', {'task_id': 'c', 'status': 'processing'})
+
+    supervisor = TaskSupervisor(storage=storage, pool=NodePool(clients={'http://node': FakeClient({})}))
+
+    assert supervisor.restore() == 1
+    assert supervisor.watched_count == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_check_schedules_and_finishes(storage):
+    """Queued tasks back off, vanished tasks fail, intervals shrink near completion"""
+    client = FakeClient({'n-queued': (10, 0), 'n-almost': (20, 99.0)})
+    supervisor = TaskSupervisor(storage=storage, pool=NodePool(clients={'http://node': client}))
+    for task_id in ('queued', 'almost', 'gone'):
+        storage.write_manifest(task_id, {'task_id': task_id, 'status': 'processing'})
+        supervisor.watch(task_id, f'n-{task_id}')
+
+    await supervisor._check_batch(list(supervisor._watched.values()))
+
+    queued = supervisor._watched['queued']
+    almost = supervisor._watched['almost']
+    assert 'gone' not in supervisor._watched
+    assert storage.read_manifest('gone')['status'] == 'failed'
+    assert almost.next_check < queued.next_check
+    assert client.info_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_finished_task_is_handed_to_a_download_job(storage, monkeypatch):
+    """The supervisor only queues the download; the job completes the task"""
+    client = FakeClient({'n-done': (40, 100.0)})
+    supervisor = TaskSupervisor(storage=storage, pool=NodePool(clients={'http://node': client}))
+    storage.write_manifest('done', {'task_id': 'done', 'status': 'processing'})
+    supervisor.watch('done', 'n-done', 'http://node')
+
+    await supervisor._check_batch(list(supervisor._watched.values()))
+
+    assert storage.read_manifest('done')['status'] == 'downloading'
+    assert supervisor.watched_count == 0
+    job = supervisor.jobs.claim('worker', ['download'], ttl=30)
+    assert job['payload'] == {'task_id': 'done', 'nodeodm_task_id': 'n-done', 'node_url': 'http://node'}
+    # The lease is released so no worker polls the task again
+    assert supervisor.store.unowned(('downloading',))[0]['task_id'] == 'done'
+
+    async def download_assets(nodeodm_task_id, task_id, client=None, on_progress=None):
+        on_progress(1024)
+
+    monkeypatch.setattr(storage, 'download_assets', download_assets)
+    await supervisor.run_download(job['payload'])
+
+    assert storage.read_manifest('done')['status'] == 'completed'
+    assert supervisor.store.get('done')['status'] == 'completed'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('mid_stream', [True, False])
+async def test_download_of_a_deleted_task_is_discarded(storage, monkeypatch, mid_stream):
+    """Deleting a task mid-download must not leave its results directory or manifest behind"""
+    supervisor = TaskSupervisor(storage=storage, pool=NodePool(clients={'http://node': FakeClient({})}))
+    storage.write_manifest('gone', {'task_id': 'gone', 'status': 'downloading'})
+    supervisor._enqueue_download('gone', 'n-gone', 'http://node')
+    job = supervisor.jobs.claim('worker', ['download'], ttl=30)
+
+    async def download_assets(nodeodm_task_id, task_id, client=None, on_progress=None):
+        (storage.results_dir / task_id / "odm_orthophoto").mkdir(parents=True, exist_ok=True)
+        # Deleted by another process while the archive streams or is post-processed
+        supervisor.forget(task_id)
+        if mid_stream:
+            on_progress(1024)
+            raise AssertionError("the download should have stopped")
+
+    monkeypatch.setattr(storage, 'download_assets', download_assets)
+    await supervisor.run_download(job['payload'])
+
+    assert not (storage.results_dir / 'gone').exists()
+    assert supervisor.store.get('gone') is None
+    assert supervisor.jobs.get(job['id'])['status'] == 'canceled'
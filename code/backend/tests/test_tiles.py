@@ -0,0 +1,93 @@
+"""
+Tests for orthophoto tile pyramids
+"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from app.services.file_storage import FileStorageService
+from app.services.tiles import TileService
+
+
+def make_orthophoto(storage: FileStorageService, task_id: str, size=(600, 300)):
+    ortho_dir = storage.results_dir / task_id / "odm_orthophoto"
+    ortho_dir.mkdir(parents=True)
+    Image.new('RGB', size, (30, 120, 40)).save(ortho_dir / "odm_orthophoto.png")
+
+
+@pytest.mark.asyncio
+async def test_pyramid_levels_and_tiles(tmp_path):
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    make_orthophoto(storage, "task")
+    tiles = TileService(storage=storage, cache_dir=tmp_path / "tiles", tile_size=256)
+
+    metadata = await tiles.ensure_pyramid("task")
+
+    assert metadata['max_zoom'] == 2
+    assert [(level['cols'], level['rows']) for level in metadata['levels']] == [(1, 1), (2, 1), (3, 2)]
+    edge = await tiles.get_tile("task", 2, 2, 1)
+    with Image.open(edge) as tile:
+        assert tile.size == (256, 256)
+        # Padding beyond the orthophoto is transparent
+        assert tile.getpixel((255, 255))[3] == 0
+    assert await tiles.get_tile("task", 2, 3, 0) is None
+    assert await tiles.ensure_pyramid("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_pyramid_is_evicted(tmp_path):
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    for task_id in ("old", "new"):
+        make_orthophoto(storage, task_id)
+    tiles = TileService(storage=storage, cache_dir=tmp_path / "tiles", max_bytes=1, tile_size=256)
+
+    await tiles.ensure_pyramid("old")
+    await tiles.ensure_pyramid("new")
+
+    assert not tiles.pyramid_dir("old").exists()
+    assert tiles.pyramid_dir("new").exists()
+
+
+@pytest.mark.asyncio
+async def test_geotiff_tiles_are_rendered_on_request(tmp_path):
+    rasterio = pytest.importorskip("rasterio")
+    import numpy as np
+
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    path = storage.results_dir / "task" / "odm_orthophoto" / "odm_orthophoto.tif"
+    path.parent.mkdir(parents=True)
+    with rasterio.open(path, 'w', driver='GTiff', width=600, height=300, count=4, dtype='uint8') as dst:
+        for band, value in enumerate((30, 120, 40, 255), start=1):
+            dst.write(np.full((300, 600), value, dtype=np.uint8), band)
+    tiles = TileService(storage=storage, cache_dir=tmp_path / "tiles", tile_size=256)
+
+    metadata = await tiles.ensure_pyramid("task")
+    assert metadata['windowed']
+    assert [(level['cols'], level['rows']) for level in metadata['levels']] == [(1, 1), (2, 1), (3, 2)]
+    assert not list(tiles.pyramid_dir("task").rglob("*.png"))
+
+    edge = await tiles.get_tile("task", 2, 2, 1)
+    # Only the requested tile is rendered
+    assert list(tiles.pyramid_dir("task").rglob("*.png")) == [edge]
+    with Image.open(edge) as tile:
+        assert tile.size == (256, 256)
+        assert tile.getpixel((0, 0)) == (30, 120, 40, 255)
+        assert tile.getpixel((255, 255))[3] == 0
+
+    await tiles.prerender("task")
+    assert len(list(tiles.pyramid_dir("task").rglob("*.png"))) == 1 + 2 + 6
+
+
+@pytest.mark.asyncio
+async def test_concurrent_services_share_one_build(tmp_path):
+    storage = FileStorageService(results_dir=tmp_path / "results")
+    make_orthophoto(storage, "task")
+    first, second = (TileService(storage=storage, cache_dir=tmp_path / "tiles", tile_size=256) for _ in range(2))
+
+    results = await asyncio.gather(first.ensure_pyramid("task"), second.ensure_pyramid("task"))
+
+    assert results[0] == results[1]
+    assert (await second.get_tile("task", 0, 0, 0)).exists()
+    assert not list((tmp_path / "tiles").glob(".*.building"))
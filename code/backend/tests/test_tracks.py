@@ -0,0 +1,83 @@
+"""
+Tests for robot track storage and queries
+"""
+
+import math
+
+import pytest
+
+from app.services.tracks import Samples, TrackError, TrackService, simplify
+
+
+@pytest.fixture
+def tracks(tmp_path):
+    return TrackService(tracks_dir=tmp_path / "tracks")
+
+
+async def stream(*lines):
+    for line in lines:
+        yield line
+
+
+def test_appends_are_columnar_ordered_and_queryable(tracks):
+    track_id = tracks.create(name="north", task_id="task")['track_id']
+    batch = Samples()
+    for i in (2, 0, 1, 3):
+        batch.append(1000.0 + i, 36.0 + i * 1e-5, -81.0, 90.0, 1.5)
+    assert tracks.append(track_id, batch) == {'stored': 4, 'dropped': 0, 'count': 4}
+    late = Samples()
+    late.append(1002.5, 36.0, -81.0)
+    late.append(1004.0, 36.1, -81.0)
+    assert tracks.append(track_id, late) == {'stored': 1, 'dropped': 1, 'count': 5}
+
+    # 32 bytes per sample across the column files
+    files = sorted((tracks.tracks_dir / track_id).glob("*.bin"))
+    assert sum(path.stat().st_size for path in files) == 5 * 32
+    meta = tracks.get(track_id)
+    assert (meta['count'], meta['start'], meta['end']) == (5, 1000.0, 1004.0)
+    assert meta['bbox'] == pytest.approx([-81.0, 36.0, -81.0, 36.1])
+
+    window = tracks.read(track_id, start=1001.0, end=1003.0)
+    assert window.columns['t'].tolist() == [1001.0, 1002.0, 1003.0]
+    inside = tracks.read(track_id, bbox=[-81.1, 36.05, -80.9, 36.2]).to_dict()
+    assert inside['t'] == [1004.0] and inside['heading'] == [None]
+    assert [meta['track_id'] for meta in tracks.list(task_id="task")] == [track_id]
+
+
+@pytest.mark.asyncio
+async def test_streamed_lines_are_ingested_in_batches(tracks, monkeypatch):
+    monkeypatch.setattr('app.core.config.settings.TRACK_BATCH_SIZE', 2)
+    track_id = tracks.create()['track_id']
+
+    totals = await tracks.ingest(track_id, stream(
+        "1.0,36.0,-81.0,10,1.2", "", '{"t": 2.0, "lat": 36.00001, "lon": -81.0}', "3.0,36.00002,-81.0",
+    ))
+    assert totals == {'received': 3, 'stored': 3, 'dropped': 0, 'count': 3}
+    with pytest.raises(TrackError):
+        await tracks.ingest(track_id, stream("4.0,36.0,-81.0", "not a sample"))
+    # Samples before the malformed line were kept
+    assert tracks.get(track_id)['count'] == 4
+
+
+def test_simplification_keeps_shape_and_fits_point_budget(tracks):
+    # A 10 Hz drive: 100 m east, then 100 m north, sampled every 5 cm
+    xs = [i * 0.05 for i in range(2001)] + [100.0] * 2000
+    ys = [0.0] * 2001 + [(i + 1) * 0.05 for i in range(2000)]
+    kept = simplify(xs, ys, 0.5)
+    # Start, end and a point within tolerance of the corner
+    assert len(kept) == 3 and (kept[0], kept[-1]) == (0, 4000)
+    assert math.hypot(xs[kept[1]] - 100.0, ys[kept[1]]) <= 0.5
+
+    track_id = tracks.create()['track_id']
+    batch = Samples()
+    for i in range(3000):
+        # Zig-zag rows a few metres apart
+        batch.append(float(i), 36.0 + (i // 100) * 3e-5, -81.0 + (i % 100 if (i // 100) % 2 == 0 else 99 - i % 100) * 1e-6)
+    tracks.append(track_id, batch)
+
+    result = tracks.simplified(track_id, max_points=100)
+    assert result['total'] == 3000
+    assert len(result['samples']) <= 100 and result['tolerance'] > 0
+    assert result['samples'].columns['t'][0] == 0.0 and result['samples'].columns['t'][-1] == 2999.0
+    assert tracks.simplified(track_id, max_points=100) is result
+    assert len(tracks.simplified(track_id)['samples']) == 3000
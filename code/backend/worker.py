@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Job worker for the Drone Imagery API
+
+Runs the jobs the API queues (asset downloads, derived products) in its own
+process, so heavy post-processing never competes with request handling.
+Start as many as the machine allows; they coordinate through RESULTS_DIR/jobs.db.
+"""
+
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.services.indices import index_service
+from app.services.job_worker import job_worker
+from app.services.metrics import metrics_publisher
+from app.services.node_pool import node_pool
+from app.services.previews import preview_service
+from app.services.rasters import raster_service
+
+
+async def main() -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await job_worker.start()
+    if settings.METRICS_ENABLED:
+        # Downloads and NodeODM calls made here show up in the API's /metrics
+        await metrics_publisher.start()
+    logging.getLogger(__name__).info(f"Job worker {job_worker.worker_id} started")
+    try:
+        await stopping.wait()
+    finally:
+        await job_worker.stop()
+        await metrics_publisher.stop()
+        preview_service.shutdown()
+        raster_service.shutdown()
+        index_service.shutdown()
+        await node_pool.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main())